@@ -13,4 +13,7 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LittleLemon.settings')
 
+# Serve through this module (e.g. `uvicorn LittleLemon.asgi:application`) for
+# api/orders/events: under WSGI each open event stream would pin a worker.
+
 application = get_asgi_application()
@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'LittleLemonAPI.instrumentation.PerformanceMiddleware',
+    'LittleLemonAPI.database.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,13 +80,57 @@ WSGI_APPLICATION = 'LittleLemon.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Connections are kept for CONN_MAX_AGE seconds instead of one per request.
+# SQLite's 'timeout' is its busy timeout: writers wait that long for the lock.
+# Read replicas are further aliases, e.g.
+#     'replica1': {..., 'TEST': {'MIRROR': 'default'}},
+# and only serve the views' read-only actions (see LittleLemonAPI/database.py).
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+        },
+        # On disk, so threaded tests see SQLite's real locking; the shared
+        # in-memory test database locks whole tables instead.
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    }
+}
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['LittleLemonAPI.database.ReadReplicaRouter']
+
+# Applied to every new SQLite connection. Only per-connection pragmas belong
+# here: WAL journaling is stored in the file and enabled by a migration.
+SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',
+}
+
+# Seconds a user's reads stay on the primary after they write.
+REPLICA_STICKY_SECONDS = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Local memory is per process; point 'default' at a shared backend such as
+# django.core.cache.backends.redis.RedisCache when running several workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
+# Cache alias and timeout (seconds) for menu and category responses.
+MENU_CACHE_ALIAS = 'default'
+MENU_CACHE_TIMEOUT = 600
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -131,17 +177,92 @@ REST_FRAMEWORK = {
 
     # Add code to assign default authentication classes
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'LittleLemonAPI.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
-        'rest_framework.filters.OrderingFilter',
-        'rest_framework.filters.SearchFilter',
+        'LittleLemonAPI.search.FullTextSearchFilter',
+        'LittleLemonAPI.search.RelevanceOrderingFilter',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 2,
     'DEFAULT_THROTTLE_RATES': {
         'anon': '2/minute',
-        'user': '5/minute'
+        'user': '5/minute',
+        'checkout': '2/minute',
     },
 }
+
+# Cache alias holding the throttle counters; must be shared by all workers.
+THROTTLE_CACHE_ALIAS = 'default'
+
+# Seconds a user's resolved group names are shared across requests (0 = per request only).
+ROLE_CACHE_TIMEOUT = 300
+
+# Per-process cache of authenticated tokens: maximum entries and lifetime in seconds.
+TOKEN_CACHE_SIZE = 1024
+TOKEN_CACHE_TTL = 60
+
+# Cache alias holding the per-user versions that invalidate cached tokens in every worker; must be shared.
+TOKEN_CACHE_ALIAS = 'default'
+
+# Largest ?page_size= a client may request from keyset-paginated views.
+MAX_PAGE_SIZE = 100
+
+# Full-text matches of a ?search= on menu items that are ordered by relevance; the rest follow.
+SEARCH_RANKED_RESULTS = 200
+
+# Fraction of requests profiled by PerformanceMiddleware (served at api/perf/stats and api/perf/metrics).
+PERF_SAMPLE_RATE = 0.05
+
+# Serve menu, order and cart listings from .values() rows instead of
+# ModelSerializer instances (same output; see LittleLemonAPI/fastserializers.py).
+FAST_LIST_SERIALIZATION = True
+
+# Unassigned orders handed out per POST to api/orders/dispatch when no limit is given.
+DISPATCH_BATCH_SIZE = 100
+
+# Order event stream (api/orders/events). The broker carries events between
+# processes; LocalBroker only reaches clients of the same process.
+ORDER_EVENTS_BROKER = 'LittleLemonAPI.events.LocalBroker'
+ORDER_EVENTS_QUEUE_SIZE = 100
+ORDER_EVENTS_KEEPALIVE = 15
+ORDER_EVENTS_MAX_AGE = 300
+
+# Rows written per transaction by menu imports (api/menu-items/import, manage.py import_menu).
+MENU_IMPORT_BATCH_SIZE = 500
+
+# Orders fetched per query (with their items) by order exports (api/orders/export, manage.py export_orders).
+ORDER_EXPORT_CHUNK_SIZE = 2000
+
+# Sales analytics (api/analytics/*). Finished days are cached per day and
+# dropped when one of their orders changes. Invalidation only reaches the
+# cache alias given here, so the timeout bounds staleness when that alias is
+# per process (like the default local memory cache).
+ANALYTICS_CACHE_ALIAS = 'default'
+ANALYTICS_PARTITION_TIMEOUT = 300
+ANALYTICS_MAX_DAYS = 366
+
+# Idempotency-Key on cart and order POSTs: how long a key's response is kept,
+# and after how long an unfinished first request is presumed dead and its key
+# reusable (seconds). A duplicate of an unfinished request gets a 409 at once.
+IDEMPOTENCY_KEY_TTL = 86400
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+
+# Background jobs (LittleLemonAPI/background.py, manage.py run_worker): attempts
+# per job, retry backoff base and cap, seconds before a running job is presumed
+# dead and requeued, and worker defaults.
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_BACKOFF = 10
+TASK_RETRY_BACKOFF_MAX = 3600
+TASK_TIMEOUT = 600
+TASK_WORKER_CONCURRENCY = 4
+TASK_WORKER_POLL = 1.0
+
+# Order receipts and account notices are sent by the worker; the console
+# backend prints them. Configure SMTP here for real delivery.
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = 'orders@littlelemon.local'
+
+# Longest a cached set of sold-out menu items may lag behind the stock (seconds).
+STOCK_SOLD_OUT_TIMEOUT = 60
@@ -0,0 +1,133 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from .models import MenuItem, Order, OrderItem
+
+# Sales analytics for any date range, built from one partition per day:
+#     orders, delivered, revenue, quantity (units sold),
+#     menuitems {menu item id: [quantity, revenue]},
+#     crews {crew id: [assigned, delivered]}
+# Finished days are cached and recomputed after an order of that day changes
+# (see invalidate_days), or at the latest after ANALYTICS_PARTITION_TIMEOUT,
+# which bounds how stale a cache the invalidation never reached can be (a
+# per-process one, for instance). Today is always computed.
+# Titles and categories are looked up when reading, so renames and moved
+# menu items never leave a partition stale.
+
+PARTITION_KEY = 'analytics:v2:day:%s'
+EPOCH_KEY = 'analytics:epoch'
+
+def get_analytics_cache():
+    return caches[getattr(settings, 'ANALYTICS_CACHE_ALIAS', 'default')]
+
+def _empty():
+    return {'orders': 0, 'delivered': 0, 'revenue': Decimal('0.00'), 'quantity': 0, 'menuitems': {}, 'crews': {}}
+
+def compute_partitions(days):
+    # Three grouped queries over the span of `days`, whatever its length.
+    partitions = {day: _empty() for day in days}
+    span = {'date__range': (min(days), max(days))}
+    orders = (Order.objects.filter(**span).values('date')
+              .annotate(orders=Count('pk'), delivered=Count('pk', filter=Q(status=True)), revenue=Sum('total'))
+              .order_by())
+    for row in orders:
+        if row['date'] in partitions:
+            partitions[row['date']].update(orders=row['orders'], delivered=row['delivered'], revenue=row['revenue'])
+    items = (OrderItem.objects.filter(**{'order__' + key: value for key, value in span.items()})
+             .values_list('order__date', 'menuitem_id')
+             .annotate(quantity=Sum('quantity'), revenue=Sum('price'))
+             .order_by())
+    for day, menuitem, quantity, revenue in items:
+        if day in partitions:
+            partitions[day]['menuitems'][menuitem] = [quantity, revenue]
+            partitions[day]['quantity'] += quantity
+    crews = (Order.objects.filter(delivery_crew__isnull=False, **span)
+             .values_list('date', 'delivery_crew_id')
+             .annotate(assigned=Count('pk'), delivered=Count('pk', filter=Q(status=True)))
+             .order_by())
+    for day, crew, assigned, delivered in crews:
+        if day in partitions:
+            partitions[day]['crews'][crew] = [assigned, delivered]
+    return partitions
+
+def get_partitions(date_from, date_to):
+    # Returns [(day, partition)] for every day of the range, oldest first.
+    today = date.today()
+    days = [date_from + timedelta(days=n) for n in range((date_to - date_from).days + 1)]
+    cache = get_analytics_cache()
+    finished = {PARTITION_KEY % day.isoformat(): day for day in days if day < today}
+    partitions = {finished[key]: partition for key, partition in cache.get_many(finished).items()}
+    missing = [day for day in days if day not in partitions]
+    if missing:
+        epoch = cache.get(EPOCH_KEY)
+        computed = compute_partitions(missing)
+        partitions.update(computed)
+        # An order of a finished day may have changed while we were reading;
+        # its invalidation bumped the epoch and the fresh copy is not kept.
+        if cache.get(EPOCH_KEY) == epoch:
+            cache.set_many({PARTITION_KEY % day.isoformat(): partition for day, partition in computed.items() if day < today},
+                           getattr(settings, 'ANALYTICS_PARTITION_TIMEOUT', 300))
+    return [(day, partitions[day]) for day in days]
+
+def invalidate_days(days):
+    # Called by the order summary writers once their transaction commits.
+    # Today's partition is never cached, so checkouts cost nothing here.
+    today = date.today()
+    keys = [PARTITION_KEY % day.isoformat() for day in set(days) if day is not None and day < today]
+    if not keys:
+        return
+
+    def forget():
+        cache = get_analytics_cache()
+        try:
+            cache.incr(EPOCH_KEY)
+        except ValueError:
+            cache.add(EPOCH_KEY, 1, None)
+        cache.delete_many(keys)
+    transaction.on_commit(forget)
+
+def daily_revenue(date_from, date_to):
+    return [{'date': day, 'orders': partition['orders'], 'delivered': partition['delivered'],
+             'quantity': partition['quantity'], 'revenue': partition['revenue']}
+            for day, partition in get_partitions(date_from, date_to) if partition['orders']]
+
+def _menuitem_totals(partitions):
+    totals = defaultdict(lambda: [0, Decimal('0.00')])
+    for _, partition in partitions:
+        for menuitem, (quantity, revenue) in partition['menuitems'].items():
+            total = totals[menuitem]
+            total[0] += quantity
+            total[1] += revenue
+    return totals
+
+def top_menu_items(date_from, date_to, limit=10, by='revenue'):
+    totals = _menuitem_totals(get_partitions(date_from, date_to))
+    column = 0 if by == 'quantity' else 1
+    ranked = sorted(totals.items(), key=lambda item: (-item[1][column], item[0]))[:limit]
+    titles = dict(MenuItem.objects.filter(pk__in=[menuitem for menuitem, _ in ranked]).values_list('pk', 'title'))
+    return [{'menuitem': menuitem, 'title': titles.get(menuitem), 'quantity': quantity, 'revenue': revenue}
+            for menuitem, (quantity, revenue) in ranked]
+
+def category_sales(date_from, date_to):
+    totals = _menuitem_totals(get_partitions(date_from, date_to))
+    categories = {}
+    rows = MenuItem.objects.filter(pk__in=list(totals)).values_list('pk', 'category_id', 'category__title')
+    for menuitem, category, title in rows:
+        quantity, revenue = totals[menuitem]
+        row = categories.setdefault(category, {'category': category, 'title': title, 'quantity': 0, 'revenue': Decimal('0.00')})
+        row['quantity'] += quantity
+        row['revenue'] += revenue
+    return sorted(categories.values(), key=lambda row: (-row['revenue'], row['category']))
+
+def crew_deliveries(date_from, date_to):
+    crews = defaultdict(lambda: [0, 0])
+    for _, partition in get_partitions(date_from, date_to):
+        for crew, (assigned, delivered) in partition['crews'].items():
+            crews[crew][0] += assigned
+            crews[crew][1] += delivered
+    return [{'delivery_crew': crew, 'assigned': assigned, 'delivered': delivered}
+            for crew, (assigned, delivered) in sorted(crews.items(), key=lambda item: (-item[1][1], item[0]))]
@@ -0,0 +1,130 @@
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ObjectDoesNotExist
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
+from django.views import View
+from rest_framework.response import Response
+from . import views
+from .caching import MenuCacheMixin
+from .events import channels_for, event_stream, hub
+from .fastserializers import FastListMixin
+from .pagination import KeysetPagination
+
+class AsyncReadView(View):
+    # Async GET endpoint reusing a DRF view's authentication, permission,
+    # throttle, filter, pagination and serializer configuration, with the
+    # queries themselves run through the async ORM. DRF's hooks are
+    # synchronous and may block on the cache or the database, so each stretch
+    # of them runs once, in one sync_to_async call, off the event loop.
+    view_class = None
+    action = 'list'
+
+    def build_view(self, request, *args, **kwargs):
+        view = self.view_class(action=self.action, action_map={'get': self.action}, detail=self.action == 'retrieve',
+                               args=args, kwargs=kwargs, format_kwarg=None)
+        view.headers = view.default_response_headers
+        view.request = view.initialize_request(request, *args, **kwargs)
+        return view
+
+    def begin(self, view, request, *args, **kwargs):
+        # Authentication, permissions and throttles, then the menu cache:
+        # (key, validator headers, cached response or None), or None.
+        view.initial(request, *args, **kwargs)
+        if isinstance(view, MenuCacheMixin):
+            return view.get_cached_response(request)
+        return None
+
+    def finish(self, view, request, response, exc, *args, **kwargs):
+        if exc is not None:
+            response = view.handle_exception(exc)
+        return view.finalize_response(request, response, *args, **kwargs)
+
+    async def get(self, request, *args, **kwargs):
+        view = self.build_view(request, *args, **kwargs)
+        request = view.request
+        response = exc = None
+        try:
+            cached = await sync_to_async(self.begin)(view, request, *args, **kwargs)
+            handler = self.retrieve if self.action == 'retrieve' else self.list
+            if cached is None:
+                response = await handler(view, request)
+            else:
+                key, headers, response = cached
+                if response is None:
+                    # A cache write, so off the event loop as well.
+                    response = await sync_to_async(view.store_response)(key, headers, await handler(view, request))
+        except Exception as error:
+            exc = error
+        return await sync_to_async(self.finish)(view, request, response, exc, *args, **kwargs)
+
+    def get_queryset(self, view):
+        # (fast serializer or None, queryset to page through).
+        fast = view.get_fast_serializer() if isinstance(view, FastListMixin) else None
+        if fast is not None:
+            return fast, view.get_fast_queryset(fast)
+        return None, view.filter_queryset(view.get_queryset())
+
+    async def list(self, view, request):
+        fast, queryset = await sync_to_async(self.get_queryset)(view)
+        paginator = view.paginator
+        if isinstance(paginator, KeysetPagination):
+            page = await paginator.apaginate_queryset(queryset, request, view=view)
+        elif paginator is not None:
+            page = await sync_to_async(paginator.paginate_queryset)(queryset, request, view=view)
+        else:
+            page = [obj async for obj in queryset]
+        if fast is not None:
+            data = await fast.aserialize(page)
+        else:
+            data = await sync_to_async(lambda: view.get_serializer(page, many=True).data)()
+        return paginator.get_paginated_response(data) if paginator is not None else Response(data)
+
+    def serialize_object(self, view, request, obj):
+        view.check_object_permissions(request, obj)
+        return view.get_serializer(obj).data
+
+    async def retrieve(self, view, request):
+        queryset = await sync_to_async(lambda: view.filter_queryset(view.get_queryset()))()
+        lookupUrlKwarg = view.lookup_url_kwarg or view.lookup_field
+        try:
+            obj = await queryset.aget(**{view.lookup_field: view.kwargs[lookupUrlKwarg]})
+        except (ObjectDoesNotExist, TypeError, ValueError):
+            raise Http404('No %s matches the given query.' % queryset.model._meta.object_name)
+        return Response(await sync_to_async(self.serialize_object)(view, request, obj))
+
+class AsyncOrderDetailView(AsyncReadView):
+    # OrderView.retrieve lists the order's items through OrderItemView.
+    view_class = views.OrderView
+    action = 'retrieve'
+
+    async def retrieve(self, view, request):
+        itemView = views.OrderItemView(args=view.args, kwargs=view.kwargs, format_kwarg=None)
+        itemView.headers = view.headers
+        itemView.request = request
+        await sync_to_async(itemView.initial)(request, *view.args, **view.kwargs)
+        return await self.list(itemView, request)
+
+class OrderEventStreamView(AsyncReadView):
+    # Server-sent order events for the requesting user (and, for managers,
+    # every order). Needs an ASGI server; the stream holds no thread.
+    view_class = views.OrderEventsView
+
+    def subscribe_channels(self, view, request, *args, **kwargs):
+        view.initial(request, *args, **kwargs)
+        return channels_for(request.user)
+
+    async def get(self, request, *args, **kwargs):
+        view = self.build_view(request, *args, **kwargs)
+        request = view.request
+        try:
+            channels = await sync_to_async(self.subscribe_channels)(view, request, *args, **kwargs)
+        except Exception as exc:
+            return view.finalize_response(request, view.handle_exception(exc), *args, **kwargs)
+        # Subscribe before responding so nothing committed from here on is missed.
+        stream = event_stream(hub.subscribe(channels),
+                              getattr(settings, 'ORDER_EVENTS_KEEPALIVE', 15),
+                              getattr(settings, 'ORDER_EVENTS_MAX_AGE', 300))
+        response = StreamingHttpResponse(stream, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -0,0 +1,144 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from .roles import get_roles, roles_changed
+
+USER_VERSION_KEY = 'auth:user:%s'
+
+class TokenCache:
+    # Bounded, per-process LRU of token key -> (user, token, roles). Each
+    # entry remembers its user's version in the shared TOKEN_CACHE_ALIAS
+    # cache and is dropped on the first hit after that version moves, so an
+    # invalidation in one worker reaches all of them; TOKEN_CACHE_TTL only
+    # bounds how long an entry lives otherwise.
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._keysByUser = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def maxsize(self):
+        return getattr(settings, 'TOKEN_CACHE_SIZE', 1024)
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'TOKEN_CACHE_TTL', 60)
+
+    @property
+    def shared(self):
+        return caches[getattr(settings, 'TOKEN_CACHE_ALIAS', 'default')]
+
+    def user_version(self, userId):
+        # Seeded from the clock so a version lost to eviction never comes
+        # back equal to one an entry still holds.
+        self.shared.add(USER_VERSION_KEY % userId, time.time_ns() // 1000, None)
+        return self.shared.get(USER_VERSION_KEY % userId)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._discard(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        # The shared lookup runs outside the lock.
+        if entry is not None and self.shared.get(USER_VERSION_KEY % entry[2].pk) != entry[1]:
+            self.invalidate_key(key)
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[2:]
+
+    def set(self, key, user, token, roles, version):
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (time.monotonic() + self.ttl, version, user, token, roles)
+            self._keysByUser.setdefault(user.pk, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._discard(next(iter(self._entries)))
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._keysByUser.get(entry[2].pk)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keysByUser[entry[2].pk]
+
+    def invalidate_key(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def bump(self, userIds):
+        for userId in userIds:
+            try:
+                self.shared.incr(USER_VERSION_KEY % userId)
+            except ValueError:
+                pass
+
+    def invalidate_user(self, *userIds):
+        with self._lock:
+            for userId in userIds:
+                for key in list(self._keysByUser.get(userId, ())):
+                    self._discard(key)
+        # Now for the other workers, and again once the change commits so none
+        # of them keeps rows it read before the commit.
+        self.bump(userIds)
+        transaction.on_commit(partial(self.bump, userIds))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keysByUser.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'maxsize': self.maxsize}
+
+token_cache = TokenCache()
+
+class CachedTokenAuthentication(TokenAuthentication):
+    # TokenAuthentication without the token+user query on repeat requests.
+    def authenticate_credentials(self, key):
+        entry = token_cache.get(key)
+        if entry is not None:
+            user, token, roles = entry
+            # Each request gets its own copy so per-request state never leaks.
+            user = copy.copy(user)
+            user._roles = roles
+            return (user, token)
+        user, token = super().authenticate_credentials(key)
+        # Read after the user: an invalidation from here on moves the version.
+        token_cache.set(key, copy.copy(user), token, get_roles(user), token_cache.user_version(user.pk))
+        return (user, token)
+
+@receiver(post_delete, sender=Token)
+def _token_deleted(sender, instance, **kwargs):
+    # Logout: every worker drops the user's cached tokens.
+    token_cache.invalidate_user(instance.user_id)
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def _user_changed(sender, instance, **kwargs):
+    # Covers deactivation as well as any other profile change.
+    token_cache.invalidate_user(instance.pk)
+
+@receiver(roles_changed)
+def _roles_changed(sender, user_ids, **kwargs):
+    token_cache.invalidate_user(*user_ids)
@@ -0,0 +1,87 @@
+import random
+import traceback
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import Job
+
+# Background tasks queued in the Job table and run by `manage.py run_worker`.
+# A job is inserted in the caller's transaction, so it exists exactly when
+# the work that asked for it commits. Delivery is at least once: a task may
+# run again after a failure or a worker crash, so tasks must be safe to
+# repeat.
+
+_tasks = {}
+
+def task(func):
+    # Registers func under its dotted path, the name stored on its jobs.
+    _tasks['%s.%s' % (func.__module__, func.__qualname__)] = func
+    return func
+
+def get_task(name):
+    func = _tasks.get(name)
+    return func if func is not None else import_string(name)
+
+def enqueue(func, *args, delay=0, max_attempts=None, **kwargs):
+    # Arguments are stored as JSON: pass ids, not model instances.
+    name = '%s.%s' % (func.__module__, func.__qualname__)
+    if _tasks.get(name) is not func:
+        raise ValueError('%s is not a registered task.' % name)
+    now = timezone.now()
+    return Job.objects.create(
+        name=name, args=list(args), kwargs=kwargs, run_at=now + timedelta(seconds=delay), created=now,
+        max_attempts=max_attempts or getattr(settings, 'TASK_MAX_ATTEMPTS', 5),
+    )
+
+def get_backoff(attempts):
+    # Exponential with full jitter, so jobs that failed together spread out.
+    base = getattr(settings, 'TASK_RETRY_BACKOFF', 10)
+    ceiling = min(base * 2 ** (attempts - 1), getattr(settings, 'TASK_RETRY_BACKOFF_MAX', 3600))
+    return random.uniform(base, max(base, ceiling))
+
+def requeue_stale_jobs():
+    # Jobs whose worker died mid-run. Their attempt was already counted when
+    # they were claimed.
+    stale = Job.objects.filter(status=Job.RUNNING,
+                               locked_at__lt=timezone.now() - timedelta(seconds=getattr(settings, 'TASK_TIMEOUT', 600)))
+    stale.filter(attempts__gte=F('max_attempts')).update(status=Job.FAILED, claim='', last_error='Timed out.')
+    return stale.update(status=Job.QUEUED, claim='')
+
+def claim_jobs(limit):
+    # Two statements whatever the backend: a guarded UPDATE marks the due
+    # jobs with a fresh claim token, so concurrent workers never share one.
+    now = timezone.now()
+    ids = list(Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by('run_at', 'pk')
+               .values_list('pk', flat=True)[:limit])
+    if not ids:
+        return []
+    claim = uuid.uuid4().hex
+    Job.objects.filter(pk__in=ids, status=Job.QUEUED).update(
+        status=Job.RUNNING, claim=claim, locked_at=now, attempts=F('attempts') + 1)
+    return list(Job.objects.filter(claim=claim).values_list('pk', flat=True))
+
+def run_job(jobId):
+    # Runs in a worker thread or process. Returns True if the job succeeded.
+    try:
+        job = Job.objects.filter(pk=jobId, status=Job.RUNNING).first()
+        if job is None:
+            return False
+        mine = Job.objects.filter(pk=job.pk, claim=job.claim)
+        try:
+            get_task(job.name)(*job.args, **job.kwargs)
+        except Exception:
+            error = traceback.format_exc()
+            if job.attempts >= job.max_attempts:
+                mine.update(status=Job.FAILED, claim='', last_error=error)
+            else:
+                mine.update(status=Job.QUEUED, claim='', last_error=error,
+                            run_at=timezone.now() + timedelta(seconds=get_backoff(job.attempts)))
+            return False
+        mine.delete()
+        return True
+    finally:
+        close_old_connections()
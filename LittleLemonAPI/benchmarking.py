@@ -0,0 +1,101 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.urls import URLPattern, URLResolver, reverse
+from rest_framework.authtoken.models import Token
+from .models import Category, MenuItem, Cart, Order, OrderItem
+from .roles import MANAGER, DELIVERY_CREW
+from .summaries import rebuild_order_summaries
+
+ADJECTIVES = ['Greek', 'Roasted', 'Lemon', 'Grilled', 'Spicy', 'Herbed', 'Smoked', 'Crispy', 'Garden', 'Classic']
+DISHES = ['salad', 'chicken', 'sea bass', 'bruschetta', 'risotto', 'lamb', 'pasta', 'soup', 'tart', 'cake']
+CATEGORIES = ['Starters', 'Mains', 'Desserts', 'Drinks', 'Sides', 'Specials', 'Kids', 'Vegan']
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def seed_dataset(menuItems=2000, customers=1000, managers=5, crews=50, orders=100000,
+                 maxItemsPerOrder=5, seed=0, batchSize=5000):
+    # Deterministic for a given seed: the same arguments always produce the
+    # same rows, so benchmark runs are comparable across commits.
+    rng = random.Random(seed)
+    User = get_user_model()
+    today = date.today()
+    with transaction.atomic():
+        managerGroup, _ = Group.objects.get_or_create(name=MANAGER)
+        crewGroup, _ = Group.objects.get_or_create(name=DELIVERY_CREW)
+        users = User.objects.bulk_create(
+            [User(username='manager%d' % i, password='!') for i in range(managers)] +
+            [User(username='crew%d' % i, password='!') for i in range(crews)] +
+            [User(username='customer%d' % i, password='!') for i in range(customers)],
+            batch_size=batchSize)
+        managerUsers, crewUsers, customerUsers = users[:managers], users[managers:managers + crews], users[managers + crews:]
+        User.groups.through.objects.bulk_create(
+            [User.groups.through(user_id=user.pk, group_id=managerGroup.pk) for user in managerUsers] +
+            [User.groups.through(user_id=user.pk, group_id=crewGroup.pk) for user in crewUsers])
+
+        categories = Category.objects.bulk_create(
+            [Category(slug=title.lower(), title=title) for title in CATEGORIES])
+        menu = MenuItem.objects.bulk_create([
+            MenuItem(title='%s %s %d' % (rng.choice(ADJECTIVES), rng.choice(DISHES), i),
+                     price=Decimal(rng.randrange(300, 4000)) / 100,
+                     featured=rng.random() < 0.1, category=rng.choice(categories))
+            for i in range(menuItems)
+        ], batch_size=batchSize)
+
+        for start in range(0, orders, batchSize):
+            batch, lines = [], []
+            for _ in range(min(batchSize, orders - start)):
+                age = rng.randrange(365)
+                chosen = rng.sample(menu, rng.randint(1, maxItemsPerOrder))
+                quantities = [rng.randint(1, 3) for _ in chosen]
+                batch.append(Order(
+                    user=rng.choice(customerUsers),
+                    delivery_crew=rng.choice(crewUsers) if age > 0 or rng.random() < 0.5 else None,
+                    status=age > 1, date=today - timedelta(days=age),
+                    total=sum(item.price * quantity for item, quantity in zip(chosen, quantities))))
+                lines.append(list(zip(chosen, quantities)))
+            Order.objects.bulk_create(batch)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, menuitem=item, quantity=quantity,
+                          unit_price=item.price, price=item.price * quantity)
+                for order, orderLines in zip(batch, lines) for item, quantity in orderLines
+            ], batch_size=batchSize)
+
+        Cart.objects.bulk_create([
+            Cart(user=user, menuitem=item, quantity=1, unit_price=item.price, price=item.price)
+            for user in customerUsers[:100] for item in rng.sample(menu, 3)
+        ], batch_size=batchSize)
+        Token.objects.bulk_create([Token(key=Token.generate_key(), user=user)
+                                   for user in (managerUsers[0], crewUsers[0], customerUsers[0])])
+    rebuild_order_summaries(batch_size=batchSize)
+    return {'manager': managerUsers[0], 'crew': crewUsers[0], 'customer': customerUsers[0]}
+
+def iter_routes(patterns):
+    # Named URL patterns, flattened through include().
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_routes(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern.name, set(pattern.pattern.regex.groupindex)
+
+def route_paths(patterns, samplePks):
+    # (route name, path) for every route in `patterns`; detail routes are
+    # filled in from `samplePks` and skipped when no sample is known.
+    seen = set()
+    for name, kwargs in iter_routes(patterns):
+        if name in seen:
+            continue
+        seen.add(name)
+        if kwargs - {'pk'}:
+            continue
+        if kwargs:
+            if name not in samplePks:
+                continue
+            yield name, reverse(name, kwargs={'pk': samplePks[name]})
+        else:
+            yield name, reverse(name)
@@ -0,0 +1,100 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+from .models import Category, MenuItem, menu_rows_written
+
+MENU_VERSION_KEY = 'menu:version'
+MENU_MODIFIED_KEY = 'menu:modified'
+# Columns no cached response contains (stock is served by stock.py).
+UNCACHED_FIELDS = frozenset(['stock', 'stock_shards'])
+
+def get_menu_cache():
+    return caches[getattr(settings, 'MENU_CACHE_ALIAS', 'default')]
+
+def get_menu_version():
+    cache = get_menu_cache()
+    # Seed from the clock so a version lost to eviction never restarts below
+    # one that is still baked into cached keys.
+    cache.add(MENU_VERSION_KEY, time.time_ns() // 1000, None)
+    cache.add(MENU_MODIFIED_KEY, int(time.time()), None)
+    state = cache.get_many([MENU_VERSION_KEY, MENU_MODIFIED_KEY])
+    return state.get(MENU_VERSION_KEY, 0), state.get(MENU_MODIFIED_KEY, int(time.time()))
+
+def bump_menu_version():
+    cache = get_menu_cache()
+    cache.set(MENU_MODIFIED_KEY, int(time.time()), None)
+    try:
+        cache.incr(MENU_VERSION_KEY)
+    except ValueError:
+        cache.add(MENU_VERSION_KEY, time.time_ns() // 1000, None)
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def _menu_changed(sender, **kwargs):
+    # Bump after commit so no reader caches pre-commit rows under the new version.
+    transaction.on_commit(bump_menu_version)
+
+@receiver(menu_rows_written, sender=MenuItem)
+@receiver(menu_rows_written, sender=Category)
+def _menu_rows_written(sender, fields, **kwargs):
+    # update() and bulk_create(), which send no post_save. Raw SQL writes
+    # still need an explicit bump_menu_version().
+    if fields is None or fields - UNCACHED_FIELDS:
+        transaction.on_commit(bump_menu_version)
+
+class MenuCacheMixin:
+    # Read-through cache for list/retrieve. Entries are keyed by the menu
+    # version, so any MenuItem/Category write invalidates all of them at once.
+    cache_prefix = 'menu'
+
+    def get_cache_timeout(self):
+        return getattr(settings, 'MENU_CACHE_TIMEOUT', 600)
+
+    def get_cache_key(self, request, version):
+        params = sorted(request.query_params.lists())
+        raw = '%s|%s|%s|%s' % (request.get_host(), request.path, params, request.accepted_renderer.format)
+        return '%s:%s:%s' % (self.cache_prefix, version, hashlib.md5(raw.encode()).hexdigest())
+
+    def get_cached_response(self, request):
+        # Returns the cache key, the validator headers and, on a hit, the
+        # response to send (a 304 or the cached data).
+        version, modified = get_menu_version()
+        key = self.get_cache_key(request, version)
+        headers = {'ETag': quote_etag(key), 'Last-Modified': http_date(modified)}
+        response = get_conditional_response(request._request, etag=headers['ETag'], last_modified=modified)
+        if response is None:
+            data = get_menu_cache().get(key)
+            if data is not None:
+                response = Response(data)
+        if response is not None:
+            for header, value in headers.items():
+                response[header] = value
+        return key, headers, response
+
+    def store_response(self, key, headers, response):
+        if response.status_code == 200:
+            get_menu_cache().set(key, response.data, self.get_cache_timeout())
+            for header, value in headers.items():
+                response[header] = value
+        return response
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        key, headers, response = self.get_cached_response(request)
+        if response is None:
+            response = self.store_response(key, headers, handler(request, *args, **kwargs))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,74 @@
+from django.db import IntegrityError, transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from .models import Cart, MenuItem
+
+ADD, SET, REMOVE = 'add', 'set', 'remove'
+# Largest quantity Cart.quantity (a SmallIntegerField) holds.
+MAX_QUANTITY = 32767
+
+class CartConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The cart was changed by another request, please retry.'
+    default_code = 'cart_conflict'
+
+def _check_limits(quantities, menuitems):
+    # Per-operation limits do not bound the sum of several adds, nor the
+    # line price, which has to fit Cart.price.
+    priceField = Cart._meta.get_field('price')
+    maxPrice = 10 ** (priceField.max_digits - priceField.decimal_places)
+    errors = []
+    for menuitemId, quantity in quantities.items():
+        if quantity > MAX_QUANTITY:
+            errors.append('Menu item %s: quantity %d is above %d.' % (menuitemId, quantity, MAX_QUANTITY))
+        elif quantity * menuitems[menuitemId].price >= maxPrice:
+            errors.append('Menu item %s: price %s is too large.' % (menuitemId, quantity * menuitems[menuitemId].price))
+    if errors:
+        raise ValidationError({'quantity': errors})
+
+def apply_cart_operations(user, operations):
+    # Applies a list of {op, menuitem, quantity} in order with a fixed number of
+    # queries: one in_bulk for prices, one lookup of the affected cart rows,
+    # then at most one bulk insert, one bulk update and one delete.
+    menuitemIds = {operation['menuitem'] for operation in operations}
+    try:
+        with transaction.atomic():
+            menuitems = MenuItem.objects.in_bulk(menuitemIds)
+            missing = sorted(menuitemIds - set(menuitems))
+            if missing:
+                raise ValidationError({'menuitem': ['Menu item %s not found.' % pk for pk in missing]})
+            existing = {cart.menuitem_id: cart
+                        for cart in Cart.objects.select_for_update().filter(user=user, menuitem_id__in=menuitemIds)}
+
+            quantities = {menuitemId: cart.quantity for menuitemId, cart in existing.items()}
+            for operation in operations:
+                menuitemId = operation['menuitem']
+                if operation['op'] == REMOVE:
+                    quantities.pop(menuitemId, None)
+                elif operation['op'] == SET:
+                    quantities[menuitemId] = operation['quantity']
+                else:
+                    quantities[menuitemId] = quantities.get(menuitemId, 0) + operation['quantity']
+            _check_limits(quantities, menuitems)
+
+            created, updated = [], []
+            for menuitemId, quantity in quantities.items():
+                unitPrice = menuitems[menuitemId].price
+                cart = existing.get(menuitemId)
+                if cart is None:
+                    created.append(Cart(user=user, menuitem_id=menuitemId, quantity=quantity,
+                                        unit_price=unitPrice, price=quantity * unitPrice))
+                elif cart.quantity != quantity or cart.unit_price != unitPrice:
+                    cart.quantity, cart.unit_price, cart.price = quantity, unitPrice, quantity * unitPrice
+                    updated.append(cart)
+            removed = [cart.pk for menuitemId, cart in existing.items() if menuitemId not in quantities]
+
+            if removed:
+                Cart.objects.filter(pk__in=removed).delete()
+            if updated:
+                Cart.objects.bulk_update(updated, ['quantity', 'unit_price', 'price'])
+            if created:
+                Cart.objects.bulk_create(created)
+    except IntegrityError:
+        raise CartConflict()
+    return Cart.objects.filter(user=user).order_by('pk')
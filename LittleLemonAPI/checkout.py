@@ -0,0 +1,50 @@
+from datetime import date
+from django.db import transaction
+from django.db.models import F, Sum
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from .background import enqueue
+from .events import order_created
+from .models import Cart, Order, OrderItem
+from .stock import take_stock
+from .summaries import sync_order_summary
+from .tasks import send_order_receipt
+
+class CheckoutConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'This cart is already being checked out.'
+    default_code = 'checkout_conflict'
+
+def checkout(user):
+    # Fixed number of queries whatever the cart size: lock the cart, load it,
+    # aggregate the total, claim the rows, insert the order and its items.
+    with transaction.atomic():
+        # Write first. This no-op UPDATE is the cart lock: on SQLite it takes
+        # the RESERVED (write) lock up front, where the busy timeout applies;
+        # a transaction that read first could not upgrade its lock once
+        # another checkout had written and would fail with "database is
+        # locked" at once. On backends with row locks it locks the user's
+        # cart rows until commit, as select_for_update() would.
+        if not Cart.objects.filter(user=user).update(quantity=F('quantity')):
+            raise ValidationError({'cart': 'Cart is empty.'})
+        # The rows are locked now, so this sees every one the UPDATE counted.
+        carts = list(Cart.objects.select_related('menuitem').filter(user=user).order_by('id'))
+        cartIds = [cart.pk for cart in carts]
+        totalPrice = Cart.objects.filter(pk__in=cartIds).aggregate(total=Sum('price'))['total']
+        # A concurrent submit of the same cart deletes the rows first; losing
+        # that race rolls the whole checkout back instead of duplicating it.
+        deleted, _ = Cart.objects.filter(pk__in=cartIds).delete()
+        if deleted != len(cartIds):
+            raise CheckoutConflict()
+        take_stock([(cart.menuitem, cart.quantity) for cart in carts])
+        order = Order.objects.create(user=user, total=totalPrice, status=False, date=date.today())
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, menuitem=cart.menuitem,
+                      quantity=cart.quantity, unit_price=cart.unit_price,
+                      price=cart.price)
+            for cart in carts
+        ])
+        sync_order_summary(order, item_count=len(carts))
+        order_created(order)
+        enqueue(send_order_receipt, order.pk)
+    return order
@@ -0,0 +1,112 @@
+import random
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework.permissions import SAFE_METHODS
+
+STICKY_KEY = 'replica:sticky:%s'
+
+# Routing state of the request being served: the alias reads go to (None
+# for the primary) and whether anything was written. A mutable dict so
+# changes made in sync_to_async threads are seen by the middleware.
+_state = ContextVar('replica_state', default=None)
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    # Per-connection settings only; WAL is persistent and set by migration
+    # 0009. The busy timeout itself is the sqlite3 'timeout' option in DATABASES.
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute('PRAGMA %s = %s' % (pragma, value))
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+def is_sticky(user):
+    return bool(user and user.is_authenticated and cache.get(STICKY_KEY % user.pk))
+
+def mark_sticky(user):
+    # The user's next reads stay on the primary until replicas have caught up.
+    cache.set(STICKY_KEY % user.pk, True, getattr(settings, 'REPLICA_STICKY_SECONDS', 10))
+
+class ReadReplicaRouter:
+    # Reads go to the replica picked for the current request, if any;
+    # everything else uses the primary ('default').
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        return state['alias'] if state else None
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state['wrote'] = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        databases = {'default', *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        return False if db in get_replicas() else None
+
+class ReplicaRoutingMiddleware:
+    # Gives each request its routing state and, after a request that wrote
+    # for an authenticated user, pins that user's reads to the primary.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def finish(self, request, state):
+        user = getattr(request, 'user', None)
+        if state['wrote'] and get_replicas() and user is not None and user.is_authenticated:
+            mark_sticky(user)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = {'alias': None, 'wrote': False}
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        self.finish(request, state)
+        return response
+
+    async def __acall__(self, request):
+        state = {'alias': None, 'wrote': False}
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        self.finish(request, state)
+        return response
+
+class ReplicaReadMixin:
+    # Serves the listed read-only actions from a replica once the user is
+    # known, unless they wrote something in the last REPLICA_STICKY_SECONDS.
+    replica_actions = ('list', 'retrieve')
+
+    def use_replica(self, request):
+        return (request.method in SAFE_METHODS and getattr(self, 'action', None) in self.replica_actions
+                and not is_sticky(request.user))
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        state = _state.get()
+        replicas = get_replicas()
+        if state is not None and replicas and self.use_replica(request):
+            state['alias'] = random.choice(replicas)
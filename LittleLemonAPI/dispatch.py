@@ -0,0 +1,73 @@
+import heapq
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import F
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from .events import orders_assigned
+from .models import CrewOrderSummary, Order
+from .roles import DELIVERY_CREW
+from .summaries import assign_order_summaries
+
+# The dispatch queue is the set of open orders without a crew, read oldest
+# first through order_crew_date_idx. Crew load is the open order count
+# kept in CrewOrderSummary, so neither grows with the number of open orders.
+
+class DispatchConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Some orders were assigned by another request, please retry.'
+    default_code = 'dispatch_conflict'
+
+def get_crew_ids(crewIds=None):
+    queryset = get_user_model().objects.filter(groups__name=DELIVERY_CREW, is_active=True)
+    if crewIds is not None:
+        queryset = queryset.filter(pk__in=crewIds)
+    return sorted(set(queryset.values_list('pk', flat=True)))
+
+def get_crew_loads(crewIds):
+    loads = dict.fromkeys(crewIds, 0)
+    rows = (CrewOrderSummary.objects.filter(delivery_crew_id__in=crewIds)
+            .values_list('delivery_crew_id', F('order_count') - F('delivered_count')))
+    for crewId, load in rows:
+        loads[crewId] = load
+    return loads
+
+def unassigned_orders():
+    return Order.objects.filter(delivery_crew__isnull=True, status=False).order_by('date', 'pk')
+
+def dispatch_orders(limit=None, crewIds=None):
+    # Assigns up to `limit` of the oldest unassigned orders, each to the crew
+    # member with the fewest open orders at that point. Returns
+    # ({crew id: [order ids]}, {crew id: open orders after dispatch}).
+    limit = limit or getattr(settings, 'DISPATCH_BATCH_SIZE', 100)
+    with transaction.atomic():
+        crews = get_crew_ids(crewIds)
+        if crewIds is not None and len(crews) != len(set(crewIds)):
+            missing = sorted(set(crewIds) - set(crews))
+            raise ValidationError({'delivery_crew': ['User %s is not a delivery crew.' % pk for pk in missing]})
+        if not crews:
+            raise ValidationError({'delivery_crew': 'No delivery crew available.'})
+        loads = get_crew_loads(crews)
+        # Concurrent dispatchers skip each other's rows where the database
+        # can; elsewhere the guarded UPDATE below catches the overlap.
+        skipLocked = connection.features.has_select_for_update_skip_locked
+        orderIds = list(unassigned_orders().select_for_update(skip_locked=skipLocked)
+                        .values_list('pk', flat=True)[:limit])
+
+        heap = [(load, crewId) for crewId, load in loads.items()]
+        heapq.heapify(heap)
+        assignments = {}
+        for orderId in orderIds:
+            load, crewId = heap[0]
+            assignments.setdefault(crewId, []).append(orderId)
+            heapq.heapreplace(heap, (load + 1, crewId))
+
+        for crewId, ids in assignments.items():
+            updated = Order.objects.filter(pk__in=ids, delivery_crew__isnull=True).update(delivery_crew_id=crewId)
+            if updated != len(ids):
+                raise DispatchConflict()
+        assign_order_summaries(assignments)
+        if orderIds:
+            orders_assigned(Order.objects.filter(pk__in=orderIds).values('id', 'user_id', 'delivery_crew_id', 'status'))
+    return assignments, {crewId: load for load, crewId in heap}
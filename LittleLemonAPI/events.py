@@ -0,0 +1,170 @@
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+from .roles import is_manager
+
+# Order events pushed to connected clients (api/orders/events). Each event
+# goes to the customer's and the crew member's channel and to 'managers'.
+# Brokers carry events between processes; every process then fans them out
+# to its own subscribers through the hub.
+
+CREATED, ASSIGNED, STATUS = 'order.created', 'order.assigned', 'order.status'
+MANAGERS = 'managers'
+
+def user_channel(userId):
+    return 'user:%s' % userId
+
+def channels_for(user):
+    channels = [user_channel(user.pk)]
+    if user.is_staff or is_manager(user):
+        channels.append(MANAGERS)
+    return channels
+
+class Subscription:
+    # A client's bounded event queue, bound to the event loop it was opened
+    # on. A client that falls behind loses its oldest events, not the server.
+    def __init__(self, hub, channels, maxsize):
+        self.hub = hub
+        self.channels = channels
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+
+    def push(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+class EventHub:
+    # In-process fan-out from channel names to open subscriptions. deliver()
+    # may be called from any thread.
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels, maxsize=None):
+        subscription = Subscription(self, list(channels), maxsize or getattr(settings, 'ORDER_EVENTS_QUEUE_SIZE', 100))
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers[channel].discard(subscription)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+    def deliver(self, channels, event):
+        with self._lock:
+            subscriptions = set().union(*(self._subscribers.get(channel, ()) for channel in channels))
+        for subscription in subscriptions:
+            try:
+                subscription.push(event)
+            except RuntimeError:
+                # Its event loop has shut down.
+                self.unsubscribe(subscription)
+
+hub = EventHub()
+
+class LocalBroker:
+    # Single-process broker and test stand-in: hands events straight to this
+    # process's hub. A multi-process broker publishes to shared pub/sub and
+    # calls `deliver` from its listener for every message it receives.
+    def __init__(self, deliver):
+        self.deliver = deliver
+
+    def publish(self, channels, event):
+        self.deliver(channels, event)
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(getattr(settings, 'ORDER_EVENTS_BROKER', 'LittleLemonAPI.events.LocalBroker'))(hub.deliver)
+
+def _event(kind, order):
+    return {
+        'event': kind,
+        'time': time.time(),
+        'order': {
+            'id': order['id'],
+            'user': order['user_id'],
+            'delivery_crew': order['delivery_crew_id'],
+            'status': order['status'],
+        },
+    }
+
+def _publish(events):
+    # Sent once the transaction commits, so clients never see rolled back
+    # changes or read ahead of the database.
+    def send():
+        broker = get_broker()
+        for channels, event in events:
+            broker.publish(channels, event)
+    if events:
+        transaction.on_commit(send)
+
+def _row(order):
+    return {'id': order.pk, 'user_id': order.user_id, 'delivery_crew_id': order.delivery_crew_id, 'status': order.status}
+
+def _recipients(order, *crewIds):
+    channels = {user_channel(order['user_id']), MANAGERS}
+    channels.update(user_channel(crewId) for crewId in crewIds + (order['delivery_crew_id'],) if crewId is not None)
+    return sorted(channels)
+
+def order_created(order):
+    order = _row(order)
+    _publish([(_recipients(order), _event(CREATED, order))])
+
+def order_changed(previousCrewId, previousStatus, order):
+    # The crew member an order was taken from hears about it as well.
+    order = _row(order)
+    events = []
+    if order['delivery_crew_id'] != previousCrewId:
+        events.append((_recipients(order, previousCrewId), _event(ASSIGNED, order)))
+    if order['status'] != previousStatus:
+        events.append((_recipients(order, previousCrewId), _event(STATUS, order)))
+    _publish(events)
+
+def orders_assigned(orders):
+    # `orders` are rows with id, user_id, delivery_crew_id and status.
+    _publish([(_recipients(order), _event(ASSIGNED, order)) for order in orders])
+
+def format_event(event):
+    return 'event: %s\ndata: %s\n\n' % (event['event'], json.dumps(event, separators=(',', ':')))
+
+def format_error(data):
+    return 'event: error\ndata: %s\n\n' % json.dumps(data, separators=(',', ':'))
+
+async def event_stream(subscription, keepalive, maxAge):
+    # Server-sent events until maxAge, after which the client's EventSource
+    # reconnects; this bounds streams whose client went away unnoticed.
+    deadline = time.monotonic() + maxAge
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                event = await subscription.get(min(keepalive, remaining))
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            yield format_event(event)
+    finally:
+        subscription.close()
@@ -0,0 +1,199 @@
+import decimal
+from collections import defaultdict
+from functools import lru_cache
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from .pagination import KeysetPagination
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class Unsupported(Exception):
+    pass
+
+def _decimal(field):
+    # DecimalField.to_representation with the quantize context built once.
+    exponent = decimal.Decimal('.1') ** field.decimal_places if field.decimal_places is not None else None
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    if field.normalize_output or field.localize:
+        raise Unsupported()
+    coerceToString = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+
+    def convert(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        if exponent is not None:
+            value = value.quantize(exponent, rounding=field.rounding, context=context)
+        return f'{value:f}' if coerceToString else value
+    return convert
+
+def _date(field):
+    outputFormat = getattr(field, 'format', api_settings.DATE_FORMAT)
+    if outputFormat is None:
+        return None
+    if outputFormat.lower() == 'iso-8601':
+        return lambda value: value if isinstance(value, str) else value.isoformat()
+    return lambda value: value if isinstance(value, str) else value.strftime(outputFormat)
+
+# Exact field classes whose representation of a database value is known.
+# Anything else (method fields, dotted sources, custom to_representation)
+# keeps the view on its regular serializer.
+CONVERTERS = {
+    serializers.IntegerField: lambda field: None,
+    serializers.CharField: lambda field: None,
+    serializers.SlugField: lambda field: None,
+    serializers.EmailField: lambda field: None,
+    serializers.BooleanField: lambda field: bool,
+    serializers.DecimalField: _decimal,
+    serializers.DateField: _date,
+}
+if hasattr(serializers, 'BigIntegerField'):
+    # DRF 3.16+ maps BigAutoField ids here; strings only when asked to.
+    CONVERTERS[serializers.BigIntegerField] = lambda field: (
+        str if getattr(field, 'coerce_to_string', api_settings.COERCE_BIGINT_TO_STRING) else None)
+
+def _column(model, field):
+    if field.source in ('*', 'pk') or '.' in field.source:
+        raise Unsupported()
+    try:
+        modelField = model._meta.get_field(field.source)
+    except FieldDoesNotExist:
+        raise Unsupported()
+    if isinstance(field, serializers.PrimaryKeyRelatedField):
+        if (field.pk_field is not None or not modelField.concrete or not modelField.is_relation
+                or modelField.many_to_many or modelField.target_field != modelField.related_model._meta.pk):
+            raise Unsupported()
+        return modelField.attname, None
+    if modelField.is_relation or type(field) not in CONVERTERS:
+        raise Unsupported()
+    return modelField.attname, CONVERTERS[type(field)](field)
+
+def _reverse_relation(model, accessor):
+    for relation in model._meta.related_objects:
+        if relation.one_to_many and relation.get_accessor_name() == accessor:
+            return relation
+    raise Unsupported()
+
+class FastSerializer:
+    # Read-only stand-in for a ModelSerializer that renders .values() rows
+    # straight to primitives, with no field objects or model instances per
+    # row. A nested one-to-many serializer (one level deep) costs one extra
+    # query per page.
+    def __init__(self, serializer):
+        if type(serializer).to_representation is not serializers.Serializer.to_representation:
+            raise Unsupported()
+        self.model = serializer.Meta.model
+        self.fields = []
+        self.nested = []
+        for field in serializer._readable_fields:
+            if isinstance(field, serializers.ListSerializer) and isinstance(field.child, serializers.ModelSerializer):
+                relation = _reverse_relation(self.model, field.source)
+                child = FastSerializer(field.child)
+                if child.nested:
+                    raise Unsupported()
+                self.nested.append((field.field_name, child, relation.field.attname))
+            else:
+                self.fields.append((field.field_name,) + _column(self.model, field))
+        self.columns = [column for _, column, _ in self.fields] + (['pk'] if self.nested else [])
+
+    def values(self, queryset, extra=()):
+        columns = self.columns + [column for column in extra if column not in self.columns]
+        return queryset.select_related(None).prefetch_related(None).values(*columns)
+
+    def child_queryset(self, nested, rows):
+        _, child, foreignKey = nested
+        queryset = child.model._default_manager.filter(**{foreignKey + '__in': [row['pk'] for row in rows]})
+        return child.values(queryset.order_by(*(child.model._meta.ordering or ['pk'])), (foreignKey,))
+
+    def convert(self, rows, children=()):
+        data = []
+        for row in rows:
+            item = {}
+            for name, column, convert in self.fields:
+                value = row[column]
+                item[name] = value if convert is None or value is None else convert(value)
+            for (name, _, _), groups in zip(self.nested, children):
+                item[name] = groups.get(row['pk'], [])
+            data.append(item)
+        return data
+
+    def group(self, nested, childRows):
+        _, child, foreignKey = nested
+        groups = defaultdict(list)
+        for row, item in zip(childRows, child.convert(childRows)):
+            groups[row[foreignKey]].append(item)
+        return groups
+
+    def serialize(self, rows):
+        rows = list(rows)
+        return self.convert(rows, [self.group(nested, list(self.child_queryset(nested, rows)) if rows else [])
+                                   for nested in self.nested])
+
+    async def aserialize(self, rows):
+        children = []
+        for nested in self.nested:
+            childRows = [row async for row in self.child_queryset(nested, rows)] if rows else []
+            children.append(self.group(nested, childRows))
+        return self.convert(rows, children)
+
+@lru_cache(maxsize=None)
+def get_fast_serializer(serializer_class):
+    try:
+        return FastSerializer(serializer_class())
+    except Unsupported:
+        return None
+
+class FastJSONRenderer(JSONRenderer):
+    # Byte-for-byte JSONRenderer output, encoded with orjson when it is
+    # installed. Indented (browsable API) output keeps the json module.
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # Non-string keys and out-of-range ints go back to the json
+            # module. Views using this emit no floats, which orjson spells
+            # differently in places (exponents, NaN).
+            ret = orjson.dumps(data, default=self.encoder_class().default,
+                               option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+class FastListMixin:
+    # List actions read .values() rows and render them through the
+    # serializer's FastSerializer when it has one and FAST_LIST_SERIALIZATION
+    # is on (the default). Output matches the regular serializer.
+    renderer_classes = [FastJSONRenderer if renderer is JSONRenderer else renderer
+                        for renderer in api_settings.DEFAULT_RENDERER_CLASSES]
+
+    def get_fast_serializer(self):
+        if not getattr(settings, 'FAST_LIST_SERIALIZATION', True):
+            return None
+        return get_fast_serializer(self.get_serializer_class())
+
+    def get_fast_queryset(self, fast):
+        queryset = self.filter_queryset(self.get_queryset())
+        extra = ()
+        if isinstance(self.paginator, KeysetPagination) and self.paginator.uses_keyset(self.request):
+            # The cursor is built from the ordering columns of the last row.
+            extra = [field.lstrip('-') for field in self.paginator.get_ordering(self.request, queryset, self)]
+        return fast.values(queryset, extra)
+
+    def list(self, request, *args, **kwargs):
+        fast = self.get_fast_serializer()
+        if fast is None:
+            return super().list(request, *args, **kwargs)
+        queryset = self.get_fast_queryset(fast)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(fast.serialize(page))
+        return Response(fast.serialize(queryset))
@@ -0,0 +1,117 @@
+import hashlib
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from .models import IdempotencyKey
+
+# Idempotency-Key support for retried POSTs. The first request with a key
+# claims it and stores its response; a retry with the same key and request
+# gets that response back without running the view again, and a retry that
+# arrives while the first is still running gets a 409 straight away rather
+# than holding a worker while it waits.
+
+HEADER = 'Idempotency-Key'
+
+class IdempotencyKeyInUse(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is still being processed, please retry.'
+    default_code = 'idempotency_key_in_use'
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was already used for a different request.'
+    default_code = 'idempotency_key_reused'
+
+def get_fingerprint(request):
+    digest = hashlib.sha256()
+    for part in (request.method.encode(), request.get_full_path().encode(), request.body):
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def claim_key(user, key, fingerprint):
+    # Returns (claim, None) when this request is the one to run, or (None,
+    # stored record) for a replay. Keys are per user. Only loops when the
+    # record it ran into was deleted in the meantime.
+    while True:
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    user=user, key=key, fingerprint=fingerprint, created=now,
+                    expires=now + timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 86400)),
+                ), None
+        except IntegrityError:
+            pass
+        record = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if record is None:
+            continue
+        abandoned = (record.status_code is None and
+                     record.created <= now - timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 60)))
+        if record.expires <= now or abandoned:
+            # Whoever deletes it first claims the key on the next pass.
+            IdempotencyKey.objects.filter(pk=record.pk, created=record.created).delete()
+            continue
+        if record.fingerprint != fingerprint:
+            raise IdempotencyKeyReused()
+        if record.status_code is None:
+            raise IdempotencyKeyInUse()
+        return None, record
+
+def release_key(claim):
+    IdempotencyKey.objects.filter(pk=claim.pk, status_code__isnull=True).delete()
+
+def store_response(claim, response):
+    # Server errors, conflicts and throttling are worth retrying for real, so
+    # those give the key back instead of pinning the failure to it.
+    if response.status_code >= 500 or response.status_code in (status.HTTP_409_CONFLICT, status.HTTP_429_TOO_MANY_REQUESTS):
+        release_key(claim)
+        return
+    IdempotencyKey.objects.filter(pk=claim.pk).update(
+        status_code=response.status_code, content_type=response.get('Content-Type', ''), content=response.content)
+
+def replay_response(record):
+    response = HttpResponse(bytes(record.content), status=record.status_code, content_type=record.content_type)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+class IdempotentMixin:
+    # Honours Idempotency-Key on idempotent_methods. Runs after
+    # authentication, permissions and throttling, so keys are scoped per user
+    # and throttled retries never claim one.
+    idempotent_methods = ('POST',)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        key = request.headers.get(HEADER)
+        if key is None or request.method not in self.idempotent_methods or not request.user.is_authenticated:
+            return
+        if not key or len(key) > 255:
+            raise ValidationError({HEADER: 'Must be 1 to 255 characters.'})
+        claim, record = claim_key(request.user, key, get_fingerprint(request))
+        if record is not None:
+            # dispatch() looks the handler up after initial(); the replay
+            # stands in for it on this instance only.
+            setattr(self, request.method.lower(), lambda *args, **kwargs: replay_response(record))
+        request.idempotency_claim = claim
+
+    def handle_exception(self, exc):
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            claim = getattr(self.request, 'idempotency_claim', None)
+            if claim is not None:
+                release_key(claim)
+            raise
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        claim = getattr(request, 'idempotency_claim', None)
+        if claim is not None:
+            request.idempotency_claim = None
+            store_response(claim, response.render() if hasattr(response, 'render') else response)
+        return response
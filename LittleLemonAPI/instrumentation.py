@@ -0,0 +1,230 @@
+import random
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+PHASES = ('authentication', 'permissions', 'throttling', 'queryset', 'serialization')
+
+class RequestProfile:
+    # Per-request timings, attached to the HttpRequest as `_perf` when the
+    # request is sampled. Called by the DB execute wrapper for each query.
+    def __init__(self):
+        self.phases = defaultdict(float)
+        self.queries = 0
+        self.queryTime = 0.0
+        self.statements = defaultdict(int)
+        self.handlerStart = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queryTime += time.perf_counter() - start
+            self.queries += 1
+            self.statements[(sql, repr(params))] += 1
+
+    def duplicates(self):
+        # Same SQL with the same parameters run more than once in one request.
+        return [(sql, count) for (sql, _), count in self.statements.items() if count > 1]
+
+# The profile of the sampled request being served. A context variable rather
+# than a per-connection wrapper so queries run from sync_to_async threads
+# (which hold their own connections) are still counted.
+_current = ContextVar('perf_profile', default=None)
+
+def _execute(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile(execute, sql, params, many, context)
+
+def _install(connection):
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute)
+
+@receiver(connection_created)
+def install_execute_wrapper(sender, connection, **kwargs):
+    _install(connection)
+
+class RouteStats:
+    def __init__(self):
+        self.requests = 0
+        self.seconds = 0.0
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.queries = 0
+        self.querySeconds = 0.0
+        self.duplicateQueries = 0
+        self.lastDuplicate = None
+
+class StatsRegistry:
+    # In-process aggregates per route name; each worker reports its own.
+    def __init__(self):
+        self._routes = defaultdict(RouteStats)
+        self._lock = threading.Lock()
+
+    def record(self, route, profile, seconds):
+        duplicates = profile.duplicates()
+        with self._lock:
+            stats = self._routes[route]
+            stats.requests += 1
+            stats.seconds += seconds
+            for phase in PHASES:
+                stats.phases[phase] += profile.phases.get(phase, 0.0)
+            stats.queries += profile.queries
+            stats.querySeconds += profile.queryTime
+            stats.duplicateQueries += sum(count - 1 for _, count in duplicates)
+            if duplicates:
+                stats.lastDuplicate = max(duplicates, key=lambda item: item[1])[0][:500]
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def snapshot(self):
+        with self._lock:
+            routes = {}
+            for route, stats in sorted(self._routes.items()):
+                requests = stats.requests or 1
+                routes[route] = {
+                    'requests': stats.requests,
+                    'mean_ms': round(stats.seconds / requests * 1000, 3),
+                    'phases_mean_ms': {phase: round(value / requests * 1000, 3) for phase, value in stats.phases.items()},
+                    'queries_per_request': round(stats.queries / requests, 2),
+                    'query_mean_ms': round(stats.querySeconds / requests * 1000, 3),
+                    'duplicate_queries': stats.duplicateQueries,
+                    'last_duplicate_sql': stats.lastDuplicate,
+                }
+            return routes
+
+    def prometheus(self):
+        metrics = [
+            ('requests_total', 'counter', 'Sampled requests.', lambda stats: stats.requests),
+            ('request_seconds_total', 'counter', 'Time spent serving sampled requests.', lambda stats: stats.seconds),
+            ('db_queries_total', 'counter', 'SQL queries run by sampled requests.', lambda stats: stats.queries),
+            ('db_query_seconds_total', 'counter', 'Time spent in SQL by sampled requests.', lambda stats: stats.querySeconds),
+            ('db_duplicate_queries_total', 'counter', 'Repeated identical SQL within one request.', lambda stats: stats.duplicateQueries),
+        ]
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = []
+            for name, kind, help, value in metrics:
+                lines.append('# HELP littlelemon_%s %s' % (name, help))
+                lines.append('# TYPE littlelemon_%s %s' % (name, kind))
+                for route, stats in routes:
+                    lines.append('littlelemon_%s{route="%s"} %s' % (name, route, value(stats)))
+            lines.append('# HELP littlelemon_phase_seconds_total Time per request phase of sampled requests.')
+            lines.append('# TYPE littlelemon_phase_seconds_total counter')
+            for route, stats in routes:
+                for phase in PHASES:
+                    lines.append('littlelemon_phase_seconds_total{route="%s",phase="%s"} %s' % (route, phase, stats.phases[phase]))
+        return '\n'.join(lines) + '\n'
+
+registry = StatsRegistry()
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.url_name if match and match.url_name else 'unmatched'
+
+class PerformanceMiddleware:
+    # Profiles a PERF_SAMPLE_RATE fraction of requests; the rest only pay for
+    # one random() call.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        rate = getattr(settings, 'PERF_SAMPLE_RATE', 0)
+        return rate and random.random() < rate
+
+    def start(self, request):
+        # Connections opened before this module was loaded never saw the signal.
+        for connection in connections.all(initialized_only=True):
+            _install(connection)
+        profile = request._perf = RequestProfile()
+        return profile, _current.set(profile)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        start = time.perf_counter()
+        profile, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        registry.record(_route(request), profile, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        start = time.perf_counter()
+        profile, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        registry.record(_route(request), profile, time.perf_counter() - start)
+        return response
+
+def _profile(request):
+    return getattr(getattr(request, '_request', request), '_perf', None)
+
+def _timed(request, phase, func, *args, **kwargs):
+    profile = _profile(request)
+    if profile is None:
+        return func(*args, **kwargs)
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profile.phases[phase] += time.perf_counter() - start
+
+class InstrumentedViewMixin:
+    # Splits a sampled request's view time into DRF's phases. Serialization is
+    # the handler time not spent evaluating the queryset.
+    def perform_authentication(self, request):
+        return _timed(request, 'authentication', super().perform_authentication, request)
+
+    def check_permissions(self, request):
+        return _timed(request, 'permissions', super().check_permissions, request)
+
+    def check_object_permissions(self, request, obj):
+        return _timed(request, 'permissions', super().check_object_permissions, request, obj)
+
+    def check_throttles(self, request):
+        return _timed(request, 'throttling', super().check_throttles, request)
+
+    def paginate_queryset(self, queryset):
+        return _timed(self.request, 'queryset', super().paginate_queryset, queryset)
+
+    def get_object(self):
+        return _timed(self.request, 'queryset', super().get_object)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        profile = _profile(request)
+        if profile is not None and profile.handlerStart is None:
+            profile.handlerStart = (time.perf_counter(), profile.phases['queryset'])
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        profile = _profile(request)
+        if profile is not None and profile.handlerStart is not None:
+            started, querysetBefore = profile.handlerStart
+            handler = time.perf_counter() - started
+            profile.phases['serialization'] += max(handler - (profile.phases['queryset'] - querysetBefore), 0.0)
+            profile.handlerStart = None
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,74 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+from rest_framework.authtoken.models import Token
+from LittleLemonAPI.benchmarking import percentile
+
+PATHS = ['menu-items', 'orders', 'cart/menu-items']
+
+class Command(BaseCommand):
+    help = ('Compare the async read endpoints (/api/async/...) under ASGI with the sync '
+            'views under WSGI at the same concurrency, using in-process clients.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help='User to authenticate as (a token is created if missing).')
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and mode.')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Endpoint under /api/ to compare; repeatable. Defaults to %s.' % ', '.join(PATHS))
+
+    def run_sync(self, path, token, total, concurrency):
+        local = threading.local()
+
+        def fetch(_):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            start = time.perf_counter()
+            response = local.client.get(path, HTTP_AUTHORIZATION='Token ' + token)
+            return time.perf_counter() - start, response.status_code
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return list(pool.map(fetch, range(total)))
+
+    async def run_async(self, path, token, total, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(path, headers={'Authorization': 'Token ' + token})
+                return time.perf_counter() - start, response.status_code
+
+        return await asyncio.gather(*[fetch() for _ in range(total)])
+
+    def report(self, path, mode, results, elapsed):
+        latencies = [latency for latency, _ in results]
+        errors = sum(1 for _, statusCode in results if statusCode >= 400)
+        self.stdout.write('%-24s %-11s %8.1f req/s  p50 %7.2f ms  p95 %7.2f ms  errors %d' % (
+            path, mode, len(results) / elapsed, percentile(latencies, 50) * 1000,
+            percentile(latencies, 95) * 1000, errors))
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist:
+            raise CommandError('User "%s" does not exist.' % options['username'])
+        token, _ = Token.objects.get_or_create(user=user)
+        concurrency, total = options['concurrency'], options['requests']
+        # Throttling would turn most of the run into 429s.
+        rates = {scope: None for scope in settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {})}
+        restFramework = dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES=rates)
+        with override_settings(REST_FRAMEWORK=restFramework, ALLOWED_HOSTS=['testserver'], DEBUG=False):
+            for path in options['paths'] or PATHS:
+                start = time.perf_counter()
+                results = self.run_sync('/api/' + path, token.key, total, concurrency)
+                self.report(path, 'wsgi/sync', results, time.perf_counter() - start)
+                start = time.perf_counter()
+                results = asyncio.run(self.run_async('/api/async/' + path, token.key, total, concurrency))
+                self.report(path, 'asgi/async', results, time.perf_counter() - start)
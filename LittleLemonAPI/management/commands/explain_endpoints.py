@@ -0,0 +1,104 @@
+import re
+from datetime import date
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models
+from django.http import HttpRequest
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from LittleLemonAPI import views
+from LittleLemonAPI.pagination import with_tiebreaker
+from LittleLemonAPI.roles import MANAGER, DELIVERY_CREW
+
+# (route name, view class, view kwargs, roles to run get_queryset as)
+ENDPOINTS = [
+    ('menuitem-list', views.MenuItemsView, {}, [()]),
+    ('category-list', views.CategoryView, {}, [()]),
+    ('manager-list', views.ManagersView, {}, [()]),
+    ('delivery-crew-list', views.DeliveryCrewsView, {}, [()]),
+    ('cart', views.CartView, {}, [()]),
+    ('orders-list', views.OrderView, {}, [(MANAGER,), (DELIVERY_CREW,), ()]),
+    ('orders-detail', views.OrderItemView, {'pk': 1}, [()]),
+    ('order-summary-list', views.OrderSummaryView, {}, [()]),
+]
+
+# SQLite reports "SCAN <table>" for a table scan, PostgreSQL "Seq Scan".
+FULL_SCAN = re.compile(r'\bSCAN \S+$|\bSeq Scan\b', re.MULTILINE)
+SORT = re.compile(r'TEMP B-TREE FOR ORDER BY|\bSort\b')
+INDEX = re.compile(r'USING (?:COVERING )?INDEX (\S+)|Index (?:Only )?Scan (?:Backward )?using (\S+)|Bitmap Index Scan on (\S+)')
+
+def _sample_value(model, lookup):
+    for part in lookup.split('__'):
+        field = model._meta.get_field(part)
+        model = field.related_model or model
+    if field.is_relation:
+        return 1
+    if isinstance(field, models.BooleanField):
+        return True
+    if isinstance(field, models.DateField):
+        return date.today()
+    return 1
+
+def _filter_combinations(fields):
+    combos = [()] + [(field,) for field in fields]
+    if len(fields) > 1:
+        combos.append(tuple(fields))
+    return combos
+
+def _orderings(view):
+    orderings = [[field] for field in getattr(view, 'ordering_fields', None) or []]
+    default = getattr(view, 'ordering', None)
+    if default and list(default) not in orderings:
+        orderings.insert(0, list(default))
+    return orderings or [['-id']]
+
+class Command(BaseCommand):
+    help = ('Run EXPLAIN on the SQL each list endpoint generates and report full table scans, and '
+            'the declared indexes of the endpoint models that no plan uses.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--strict', action='store_true',
+                            help='Exit with an error if any query needs a full table scan or an index goes unused.')
+
+    def build_view(self, viewClass, kwargs, roles):
+        user = get_user_model()(pk=1, username='explain')
+        user._roles = frozenset(roles)
+        request = Request(HttpRequest())
+        request.user = user
+        view = viewClass(request=request, kwargs=kwargs, format_kwarg=None, action='list')
+        return view
+
+    def handle(self, *args, **options):
+        pageSize = api_settings.PAGE_SIZE or 10
+        scans = 0
+        used, models = set(), set()
+        for name, viewClass, kwargs, roleSets in ENDPOINTS:
+            for roles in roleSets:
+                view = self.build_view(viewClass, kwargs, roles)
+                base = view.get_queryset()
+                models.add(base.model)
+                label = name if len(roleSets) == 1 else '%s [%s]' % (name, ', '.join(roles) or 'customer')
+                for fields in _filter_combinations(getattr(view, 'filterset_fields', None) or []):
+                    filters = {field: _sample_value(base.model, field) for field in fields}
+                    for ordering in _orderings(view):
+                        queryset = base.filter(**filters).order_by(*with_tiebreaker(ordering))[:pageSize]
+                        plan = queryset.explain()
+                        used.update(name for match in INDEX.findall(plan) for name in match if name)
+                        problems = []
+                        if FULL_SCAN.search(plan):
+                            problems.append('FULL SCAN')
+                            scans += 1
+                        if SORT.search(plan):
+                            problems.append('sort')
+                        line = '%s filter=%s order=%s: %s' % (
+                            label, ','.join(fields) or '-', ','.join(ordering), ', '.join(problems) or 'ok')
+                        self.stdout.write(self.style.WARNING(line) if problems else line)
+                        if options['verbosity'] > 1:
+                            self.stdout.write('    ' + plan.replace('\n', '\n    '))
+        # Each index is paid for by every insert, so one that serves none of
+        # these queries has to earn its keep elsewhere or go.
+        unused = sorted(index.name for model in models for index in model._meta.indexes if index.name not in used)
+        for name in unused:
+            self.stdout.write(self.style.WARNING('unused index: %s' % name))
+        if (scans or unused) and options['strict']:
+            raise CommandError('%d endpoint queries need a full table scan, %d indexes are unused.' % (scans, len(unused)))
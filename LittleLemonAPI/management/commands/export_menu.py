@@ -0,0 +1,19 @@
+import sys
+from django.core.management.base import BaseCommand
+from LittleLemonAPI.menu_io import CSV, JSONL, export_menu
+
+class Command(BaseCommand):
+    help = 'Write every menu item in the import format (CSV or JSON lines).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=[CSV, JSONL], default=CSV)
+        parser.add_argument('--output', help='Write here instead of stdout.')
+
+    def handle(self, *args, **options):
+        if not options['output']:
+            for chunk in export_menu(options['format']):
+                sys.stdout.write(chunk)
+            return
+        with open(options['output'], 'w', newline='', encoding='utf-8') as fh:
+            for chunk in export_menu(options['format']):
+                fh.write(chunk)
@@ -0,0 +1,40 @@
+import json
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from LittleLemonAPI.menu_io import CSV, JSONL
+from LittleLemonAPI.order_export import export_orders, filter_orders
+from LittleLemonAPI.serializers import OrderExportSerializer
+
+class Command(BaseCommand):
+    help = ('Stream order history with items as CSV (one row per item) or JSON lines (one order per line), '
+            'oldest first. Resume an interrupted export with --after <last complete order id>.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=[CSV, JSONL], default=CSV)
+        parser.add_argument('--output', help='Write here instead of stdout.')
+        parser.add_argument('--date-from', help='YYYY-MM-DD, inclusive.')
+        parser.add_argument('--date-to', help='YYYY-MM-DD, inclusive.')
+        parser.add_argument('--user', type=int)
+        parser.add_argument('--delivery-crew', type=int)
+        parser.add_argument('--status', choices=['true', 'false'])
+        parser.add_argument('--after', type=int)
+        parser.add_argument('--chunk-size', type=int, default=getattr(settings, 'ORDER_EXPORT_CHUNK_SIZE', 2000))
+
+    def handle(self, *args, **options):
+        filters = {key: options[key] for key in ('date_from', 'date_to', 'user', 'delivery_crew', 'status', 'after')
+                   if options[key] is not None}
+        serializer = OrderExportSerializer(data=filters)
+        if not serializer.is_valid():
+            raise CommandError(json.dumps(serializer.errors))
+        # A resumed export appends to --output, so it does not repeat the CSV header.
+        resumed = options['after'] is not None
+        chunks = export_orders(filter_orders(**serializer.validated_data), options['format'], options['chunk_size'],
+                               header=not (resumed and options['output']))
+        if not options['output']:
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+            return
+        with open(options['output'], 'a' if resumed else 'w', newline='', encoding='utf-8') as fh:
+            for chunk in chunks:
+                fh.write(chunk)
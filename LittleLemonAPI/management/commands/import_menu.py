@@ -0,0 +1,31 @@
+import json
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from LittleLemonAPI.menu_io import CSV, JSONL, import_menu
+
+class Command(BaseCommand):
+    help = ('Upsert menu items (by title) and categories (by slug) from a CSV or JSON-lines file, '
+            'in batches. Invalid rows are reported and skipped.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or '-' for stdin.")
+        parser.add_argument('--format', choices=[CSV, JSONL], help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'MENU_IMPORT_BATCH_SIZE', 500))
+
+    def handle(self, *args, **options):
+        fmt = options['format']
+        if fmt is None and options['path'].endswith('.csv'):
+            fmt = CSV
+        elif fmt is None and options['path'].endswith(('.jsonl', '.ndjson')):
+            fmt = JSONL
+        if fmt is None:
+            raise CommandError('Cannot tell the format of %s; pass --format.' % options['path'])
+        if options['path'] == '-':
+            report = import_menu(sys.stdin, fmt, options['batch_size'])
+        else:
+            with open(options['path'], newline='', encoding='utf-8-sig') as fh:
+                report = import_menu(fh, fmt, options['batch_size'])
+        for error in report.pop('errors'):
+            self.stderr.write('line %d: %s' % (error['line'], json.dumps(error['errors'])))
+        self.stdout.write(self.style.SUCCESS(', '.join('%s %d' % (key.replace('_', ' '), value) for key, value in report.items())))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from LittleLemonAPI.summaries import rebuild_order_summaries
+
+class Command(BaseCommand):
+    help = 'Recompute the order summary projection and its daily and per-crew rollups from Order history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = rebuild_order_summaries(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Rebuilt summaries for %d orders.' % count))
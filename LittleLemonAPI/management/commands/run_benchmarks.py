@@ -0,0 +1,153 @@
+import json
+import platform
+import sys
+import time
+import django
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from LittleLemonAPI import urls
+from LittleLemonAPI.benchmarking import percentile, route_paths, seed_dataset
+from LittleLemonAPI.models import Category, DailyOrderSummary, MenuItem, Order
+
+SKIPPED_STATUSES = (401, 403, 404, 405)
+# Streams that stay open until the client leaves; one request would never finish.
+SKIPPED_ROUTES = ('orders-events',)
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway test database with a reproducible dataset, GET every named API route '
+            'as a manager, a delivery crew member and a customer, and report latency, queries and '
+            'response size as JSON. With --baseline, fail when results regress.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=100000)
+        parser.add_argument('--menu-items', type=int, default=2000)
+        parser.add_argument('--customers', type=int, default=1000)
+        parser.add_argument('--crews', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--iterations', type=int, default=30, help='Requests per route and role.')
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout.')
+        parser.add_argument('--baseline', help='JSON report from an earlier run to compare against.')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed relative p95 latency and size growth over the baseline.')
+        parser.add_argument('--keepdb', action='store_true', help='Reuse the seeded test database between runs.')
+
+    def handle(self, *args, **options):
+        oldName = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            if not Order.objects.exists():
+                self.stderr.write('Seeding %d orders...' % options['orders'])
+                seed_dataset(menuItems=options['menu_items'], customers=options['customers'],
+                             crews=options['crews'], orders=options['orders'], seed=options['seed'])
+            report = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(oldName, verbosity=0, keepdb=options['keepdb'])
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output + '\n')
+        else:
+            self.stdout.write(output)
+        if options['baseline']:
+            with open(options['baseline']) as fh:
+                regressions = compare(json.load(fh)['results'], report['results'], options['tolerance'])
+            for line in regressions:
+                self.stderr.write(line)
+            if regressions:
+                raise CommandError('%d benchmark regressions against %s.' % (len(regressions), options['baseline']))
+
+    def sample_pks(self, users):
+        orderPk = Order.objects.filter(user=users['customer']).values_list('pk', flat=True).first()
+        menuPk = MenuItem.objects.values_list('pk', flat=True).first()
+        return {
+            'menuitem-detail': menuPk,
+            'async-menuitem-detail': menuPk,
+            'category-detail': Category.objects.values_list('pk', flat=True).first(),
+            'manager-detail': users['manager'].pk,
+            'delivery-crew-detail': users['crew'].pk,
+            'orders-detail': orderPk,
+            'async-orders-detail': orderPk,
+            'order-summary-detail': orderPk,
+            'order-summary-daily-detail': DailyOrderSummary.objects.values_list('pk', flat=True).first(),
+            'order-summary-crew-detail': users['crew'].pk,
+        }
+
+    def run(self, options):
+        tokens = {}
+        for role, prefix in (('manager', 'manager'), ('crew', 'crew'), ('customer', 'customer')):
+            token = Token.objects.select_related('user').filter(user__username__startswith=prefix).order_by('user__username').first()
+            tokens[role] = token
+        samplePks = self.sample_pks({role: token.user for role, token in tokens.items()})
+        rates = {scope: None for scope in settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {})}
+        restFramework = dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES=rates)
+
+        results = {}
+        client = Client()
+        with override_settings(REST_FRAMEWORK=restFramework, ALLOWED_HOSTS=['testserver'], DEBUG=False):
+            for cache in caches.all():
+                cache.clear()
+            for name, path in route_paths(urls.urlpatterns, samplePks):
+                if name in SKIPPED_ROUTES:
+                    continue
+                for role, token in tokens.items():
+                    headers = {'HTTP_AUTHORIZATION': 'Token ' + token.key}
+                    response = client.get(path, **headers)
+                    response_size(response)
+                    if response.status_code in SKIPPED_STATUSES:
+                        continue
+                    latencies, queries, sizes = [], [], []
+                    for _ in range(options['iterations']):
+                        with CaptureQueriesContext(connection) as captured:
+                            start = time.perf_counter()
+                            response = client.get(path, **headers)
+                            # Streamed exports do their work while being read.
+                            size = response_size(response)
+                            latencies.append(time.perf_counter() - start)
+                        queries.append(len(captured))
+                        sizes.append(size)
+                    results['%s[%s]' % (name, role)] = {
+                        'path': path,
+                        'status': response.status_code,
+                        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+                        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+                        'queries': max(queries),
+                        'bytes': max(sizes),
+                    }
+        return {
+            'meta': {
+                'orders': options['orders'], 'menu_items': options['menu_items'],
+                'customers': options['customers'], 'crews': options['crews'], 'seed': options['seed'],
+                'iterations': options['iterations'], 'django': django.get_version(),
+                'python': platform.python_version(), 'database': connection.vendor,
+                'platform': sys.platform,
+            },
+            'results': results,
+        }
+
+def response_size(response):
+    # Reads the whole body, streamed or not.
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+def compare(baseline, current, tolerance):
+    # Query counts must not grow at all; latency and size may grow by `tolerance`.
+    regressions = []
+    for key, before in sorted(baseline.items()):
+        after = current.get(key)
+        if after is None:
+            regressions.append('%s: missing from this run' % key)
+            continue
+        if after['queries'] > before['queries']:
+            regressions.append('%s: queries %d -> %d' % (key, before['queries'], after['queries']))
+        if after['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append('%s: p95 %.2f ms -> %.2f ms' % (key, before['p95_ms'], after['p95_ms']))
+        if after['bytes'] > before['bytes'] * (1 + tolerance):
+            regressions.append('%s: bytes %d -> %d' % (key, before['bytes'], after['bytes']))
+    return regressions
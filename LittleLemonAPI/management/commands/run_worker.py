@@ -0,0 +1,63 @@
+import multiprocessing
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from LittleLemonAPI import tasks  # noqa: F401 -- registers the tasks
+from LittleLemonAPI.background import claim_jobs, requeue_stale_jobs, run_job
+
+class Command(BaseCommand):
+    help = ('Run queued background jobs with a pool of threads or processes. '
+            'SIGINT/SIGTERM stop claiming new jobs and let running ones finish.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=getattr(settings, 'TASK_WORKER_CONCURRENCY', 4))
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread')
+        parser.add_argument('--poll', type=float, default=getattr(settings, 'TASK_WORKER_POLL', 1.0),
+                            help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is due.')
+
+    def result(self, future):
+        # run_job records task errors itself; this is the worker failing around
+        # it (a lost database connection, a killed process). The job stays
+        # running until requeue_stale_jobs picks it up, and the loop goes on.
+        try:
+            return future.result()
+        except Exception as exc:
+            self.stderr.write('Worker error: %r' % exc)
+            return False
+
+    def handle(self, *args, **options):
+        concurrency, poll = max(options['concurrency'], 1), options['poll']
+        stopping = []
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stopping.append(True))
+        if options['pool'] == 'process':
+            # Fresh interpreters, so no process inherits an open connection.
+            connections.close_all()
+            pool = ProcessPoolExecutor(concurrency, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=django.setup)
+        else:
+            pool = ThreadPoolExecutor(concurrency, thread_name_prefix='worker')
+        results = []
+        running = set()
+        lastSweep = 0.0
+        with pool:
+            while not stopping:
+                if time.monotonic() - lastSweep >= 60:
+                    requeue_stale_jobs()
+                    lastSweep = time.monotonic()
+                if len(running) < concurrency:
+                    running.update(pool.submit(run_job, jobId) for jobId in claim_jobs(concurrency - len(running)))
+                if not running:
+                    if options['burst']:
+                        break
+                    time.sleep(poll)
+                    continue
+                done, running = wait(running, timeout=poll, return_when=FIRST_COMPLETED)
+                results.extend(self.result(future) for future in done)
+            results.extend(self.result(future) for future in wait(running).done)
+        self.stdout.write(self.style.SUCCESS('Ran %d jobs, %d failed or retrying.' % (len(results), results.count(False))))
@@ -0,0 +1,147 @@
+import csv
+import json
+from django.db import DatabaseError, transaction
+from .models import Category, MenuItem
+from .serializers import MenuImportSerializer
+
+# Bulk menu transfer in CSV or JSON lines. Rows are
+#     title, price, featured, category[, category_title]
+# where category is a slug. Items are matched by title and categories by
+# slug; a row with category_title creates or renames its category.
+
+CSV, JSONL = 'csv', 'jsonl'
+FIELDS = ('title', 'price', 'featured', 'category', 'category_title')
+MEDIA_TYPES = {
+    'text/csv': CSV,
+    'application/x-ndjson': JSONL,
+    'application/jsonl': JSONL,
+    'application/json-lines': JSONL,
+}
+
+def read_rows(lines, fmt):
+    # Yields (line number, raw row) from any iterable of text lines.
+    if fmt == CSV:
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, {key: value for key, value in row.items() if key is not None and value != ''}
+        return
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, None
+
+def _first_by(queryset, field):
+    # Titles and slugs are not unique columns; the oldest row wins.
+    rows = {}
+    for obj in queryset.order_by('-pk'):
+        rows[getattr(obj, field)] = obj
+    return rows
+
+def _import_batch(batch, report):
+    # One transaction per batch: a category lookup, an item lookup, then at
+    # most one bulk insert and one bulk update for each model.
+    with transaction.atomic():
+        categories = _first_by(Category.objects.filter(slug__in={row['category'] for _, row in batch}), 'slug')
+        newCategories, changedCategories = {}, {}
+        for _, row in batch:
+            title = row.get('category_title')
+            category = categories.get(row['category'])
+            if title is None:
+                continue
+            if category is None:
+                category = categories[row['category']] = newCategories[row['category']] = Category(slug=row['category'], title=title)
+            elif category.title != title:
+                category.title = title
+                if category.pk is not None:
+                    changedCategories[category.pk] = category
+        Category.objects.bulk_create(newCategories.values())
+        if any(category.pk is None for category in newCategories.values()):
+            # Backends that cannot return ids from a bulk insert.
+            categories.update(_first_by(Category.objects.filter(slug__in=newCategories), 'slug'))
+        Category.objects.bulk_update(changedCategories.values(), ['title'])
+
+        items = _first_by(MenuItem.objects.filter(title__in={row['title'] for _, row in batch}), 'title')
+        newItems, changedItems, errors, unchanged = {}, {}, [], 0
+        for line, row in batch:
+            category = categories.get(row['category'])
+            if category is None:
+                errors.append({'line': line, 'errors': {'category': ['Unknown category "%s".' % row['category']]}})
+                continue
+            item = items.get(row['title'])
+            if item is None:
+                items[row['title']] = newItems[row['title']] = MenuItem(title=row['title'], price=row['price'],
+                                                                        featured=row['featured'], category=category)
+            elif (item.price, item.featured, item.category_id) != (row['price'], row['featured'], category.pk):
+                item.price, item.featured, item.category = row['price'], row['featured'], category
+                if item.pk is not None:
+                    changedItems[item.pk] = item
+            else:
+                unchanged += 1
+        MenuItem.objects.bulk_create(newItems.values())
+        MenuItem.objects.bulk_update(changedItems.values(), ['price', 'featured', 'category'])
+    report['errors'].extend(errors)
+    report['unchanged'] += unchanged
+    report['created'] += len(newItems)
+    report['updated'] += len(changedItems)
+    report['categories_created'] += len(newCategories)
+    report['categories_updated'] += len(changedCategories)
+
+def import_menu(lines, fmt, batch_size=500):
+    # Valid rows are written in batches; invalid rows are reported by line
+    # and never undo a batch that has already been committed.
+    report = {'rows': 0, 'created': 0, 'updated': 0, 'unchanged': 0,
+              'categories_created': 0, 'categories_updated': 0, 'errors': []}
+    batch = []
+
+    def flush():
+        try:
+            _import_batch(batch, report)
+        except DatabaseError as exc:
+            report['errors'].extend({'line': line, 'errors': {'non_field_errors': [str(exc)]}} for line, _ in batch)
+        batch.clear()
+
+    for line, data in read_rows(lines, fmt):
+        report['rows'] += 1
+        if data is None:
+            report['errors'].append({'line': line, 'errors': {'non_field_errors': ['Invalid JSON.']}})
+            continue
+        serializer = MenuImportSerializer(data=data)
+        if serializer.is_valid():
+            batch.append((line, serializer.validated_data))
+        else:
+            report['errors'].append({'line': line, 'errors': serializer.errors})
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    report['errors'].sort(key=lambda error: error['line'])
+    return report
+
+class EchoBuffer:
+    # File-like target that hands csv.writer's output back to the caller.
+    def write(self, value):
+        return value
+
+def export_menu(fmt, chunk_size=2000):
+    # Yields the whole menu in import format, a chunk of rows at a time.
+    rows = (MenuItem.objects.order_by('pk')
+            .values_list('title', 'price', 'featured', 'category__slug', 'category__title')
+            .iterator(chunk_size=chunk_size))
+    writer = csv.writer(EchoBuffer())
+    if fmt == CSV:
+        yield writer.writerow(FIELDS)
+    chunk = []
+    for title, price, featured, slug, categoryTitle in rows:
+        if fmt == CSV:
+            chunk.append(writer.writerow([title, price, 'true' if featured else 'false', slug, categoryTitle]))
+        else:
+            chunk.append(json.dumps(dict(zip(FIELDS, (title, str(price), featured, slug, categoryTitle))),
+                                    ensure_ascii=False) + '\n')
+        if len(chunk) >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:24
+
+from django.db import migrations
+
+# FTS5 index over menu item and category titles, kept in sync by triggers so
+# bulk writes and raw updates are covered as well as model saves.
+FORWARD_SQL = [
+    '''CREATE VIRTUAL TABLE "LittleLemonAPI_menuitem_fts"
+       USING fts5(title, category_title, tokenize = 'unicode61 remove_diacritics 2')''',
+    '''INSERT INTO "LittleLemonAPI_menuitem_fts" (rowid, title, category_title)
+       SELECT m.id, m.title, c.title FROM "LittleLemonAPI_menuitem" m
+       JOIN "LittleLemonAPI_category" c ON c.id = m.category_id''',
+    '''CREATE TRIGGER "LittleLemonAPI_menuitem_fts_ai" AFTER INSERT ON "LittleLemonAPI_menuitem" BEGIN
+         INSERT INTO "LittleLemonAPI_menuitem_fts" (rowid, title, category_title)
+         SELECT new.id, new.title, c.title FROM "LittleLemonAPI_category" c WHERE c.id = new.category_id;
+       END''',
+    '''CREATE TRIGGER "LittleLemonAPI_menuitem_fts_au" AFTER UPDATE OF title, category_id ON "LittleLemonAPI_menuitem" BEGIN
+         DELETE FROM "LittleLemonAPI_menuitem_fts" WHERE rowid = old.id;
+         INSERT INTO "LittleLemonAPI_menuitem_fts" (rowid, title, category_title)
+         SELECT new.id, new.title, c.title FROM "LittleLemonAPI_category" c WHERE c.id = new.category_id;
+       END''',
+    '''CREATE TRIGGER "LittleLemonAPI_menuitem_fts_ad" AFTER DELETE ON "LittleLemonAPI_menuitem" BEGIN
+         DELETE FROM "LittleLemonAPI_menuitem_fts" WHERE rowid = old.id;
+       END''',
+    '''CREATE TRIGGER "LittleLemonAPI_category_fts_au" AFTER UPDATE OF title ON "LittleLemonAPI_category" BEGIN
+         UPDATE "LittleLemonAPI_menuitem_fts" SET category_title = new.title
+         WHERE rowid IN (SELECT id FROM "LittleLemonAPI_menuitem" WHERE category_id = new.id);
+       END''',
+]
+
+REVERSE_SQL = [
+    'DROP TRIGGER IF EXISTS "LittleLemonAPI_category_fts_au"',
+    'DROP TRIGGER IF EXISTS "LittleLemonAPI_menuitem_fts_ad"',
+    'DROP TRIGGER IF EXISTS "LittleLemonAPI_menuitem_fts_au"',
+    'DROP TRIGGER IF EXISTS "LittleLemonAPI_menuitem_fts_ai"',
+    'DROP TABLE IF EXISTS "LittleLemonAPI_menuitem_fts"',
+]
+
+
+def _fts5_enabled(schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall())
+
+
+def create_index(apps, schema_editor):
+    if _fts5_enabled(schema_editor):
+        for sql in FORWARD_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in REVERSE_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0002_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
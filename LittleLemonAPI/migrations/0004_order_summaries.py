@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('LittleLemonAPI', '0003_menuitem_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrewOrderSummary',
+            fields=[
+                ('delivery_crew', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('delivered_count', models.PositiveIntegerField(default=0)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyOrderSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('delivered_count', models.PositiveIntegerField(default=0)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OrderSummary',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='LittleLemonAPI.order')),
+                ('status', models.BooleanField(default=0)),
+                ('total', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('date', models.DateField()),
+                ('delivery_crew', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'order'], name='ordersummary_date_idx'), models.Index(fields=['total', 'order'], name='ordersummary_total_idx'), models.Index(fields=['user', 'date', 'order'], name='ordersummary_user_date_idx'), models.Index(fields=['status', 'date', 'order'], name='ordersummary_status_date_idx'), models.Index(fields=['delivery_crew', 'date', 'order'], name='ordersummary_crew_date_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:53
+
+import importlib
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Adding a NOT NULL column makes SQLite rebuild the menu item table, which
+# drops the full-text search triggers on it; they are put back afterwards.
+fts = importlib.import_module('LittleLemonAPI.migrations.0003_menuitem_fts')
+TRIGGER_SQL = [sql for sql in fts.FORWARD_SQL if sql.startswith('CREATE TRIGGER')]
+DROP_TRIGGER_SQL = [sql for sql in fts.REVERSE_SQL if sql.startswith('DROP TRIGGER')]
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in DROP_TRIGGER_SQL:
+            schema_editor.execute(sql)
+
+
+def create_triggers(apps, schema_editor):
+    if fts._fts5_enabled(schema_editor):
+        for sql in TRIGGER_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0006_jobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_triggers, create_triggers),
+        migrations.AddField(
+            model_name='menuitem',
+            name='stock',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='menuitem',
+            name='stock_shards',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+        migrations.CreateModel(
+            name='StockShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('stock', models.PositiveIntegerField(default=0)),
+                ('menuitem', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='LittleLemonAPI.menuitem')),
+            ],
+            options={
+                'unique_together': {('menuitem', 'shard')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:24
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0007_menuitem_stock'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='menuitem',
+            name='menuitem_feat_cat_price_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_user_status_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_crew_status_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_status_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='ordersummary',
+            name='ordersummary_status_date_idx',
+        ),
+    ]
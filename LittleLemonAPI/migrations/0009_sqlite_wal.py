@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:10
+
+from django.db import migrations
+
+# WAL lets readers carry on while a writer commits. The journal mode is stored
+# in the database file, so it is set once here rather than on every
+# connection. Not atomic: SQLite cannot change it inside a transaction.
+
+
+def enable_wal(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode = WAL')
+
+
+def disable_wal(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode = DELETE')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('LittleLemonAPI', '0008_drop_unused_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(enable_wal, disable_wal),
+    ]
@@ -1,10 +1,31 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.dispatch import Signal
+
+# Sent after a menu update() or bulk_create(), which skip post_save; fields
+# names the updated columns, or is None when whole rows were inserted.
+# bulk_update() goes through update().
+menu_rows_written = Signal()
+
+class MenuQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        if rows:
+            menu_rows_written.send(sender=self.model, fields=set(kwargs))
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if objs:
+            menu_rows_written.send(sender=self.model, fields=None)
+        return objs
 
 class Category(models.Model):
     slug = models.SlugField()
     title = models.CharField(max_length=255, db_index=True)
 
+    objects = MenuQuerySet.as_manager()
+
     def __str__(self) -> str:
         return self.title
 
@@ -13,6 +34,26 @@ class MenuItem(models.Model):
     price = models.DecimalField(max_digits=6, decimal_places=2, db_index=True)
     featured = models.BooleanField(db_index=True)
     category = models.ForeignKey(Category, on_delete=models.PROTECT)
+    # Units left; null when the item is not stock tracked. Items with
+    # stock_shards > 0 keep their stock in that many StockShard rows instead.
+    stock = models.PositiveIntegerField(null=True, blank=True)
+    stock_shards = models.PositiveSmallIntegerField(default=0)
+
+    objects = MenuQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', 'price'], name='menuitem_cat_price_idx'),
+        ]
+
+class StockShard(models.Model):
+    # One slice of a hot item's stock, so parallel checkouts update different rows.
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='+')
+    shard = models.PositiveSmallIntegerField()
+    stock = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('menuitem', 'shard')
 
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -23,6 +64,9 @@ class Cart(models.Model):
 
     class Meta:
         unique_together = ('menuitem', 'user')
+        indexes = [
+            models.Index(fields=['user', 'price'], name='cart_user_price_idx'),
+        ]
 
 class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -31,6 +75,15 @@ class Order(models.Model):
     total = models.DecimalField(max_digits=6, decimal_places=2)
     date = models.DateField(db_index=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'date'], name='order_user_date_idx'),
+            models.Index(fields=['delivery_crew', 'date'], name='order_crew_date_idx'),
+            models.Index(fields=['user', 'total'], name='order_user_total_idx'),
+            models.Index(fields=['delivery_crew', 'total'], name='order_crew_total_idx'),
+            models.Index(fields=['total'], name='order_total_idx'),
+        ]
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
     menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
@@ -39,4 +92,75 @@ class OrderItem(models.Model):
     price = models.DecimalField(max_digits=6, decimal_places=2)
 
     class Meta:
-        unique_together = ('order', 'menuitem')
\ No newline at end of file
+        unique_together = ('order', 'menuitem')
+        indexes = [
+            models.Index(fields=['order', 'price'], name='orderitem_order_price_idx'),
+        ]
+
+class OrderSummary(models.Model):
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    delivery_crew = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='+', null=True)
+    status = models.BooleanField(default=0)
+    total = models.DecimalField(max_digits=6, decimal_places=2)
+    item_count = models.PositiveIntegerField(default=0)
+    date = models.DateField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'order'], name='ordersummary_date_idx'),
+            models.Index(fields=['total', 'order'], name='ordersummary_total_idx'),
+            models.Index(fields=['user', 'date', 'order'], name='ordersummary_user_date_idx'),
+            models.Index(fields=['delivery_crew', 'date', 'order'], name='ordersummary_crew_date_idx'),
+        ]
+
+class DailyOrderSummary(models.Model):
+    date = models.DateField(unique=True)
+    order_count = models.PositiveIntegerField(default=0)
+    delivered_count = models.PositiveIntegerField(default=0)
+    item_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+class CrewOrderSummary(models.Model):
+    delivery_crew = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    order_count = models.PositiveIntegerField(default=0)
+    delivered_count = models.PositiveIntegerField(default=0)
+    item_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+class IdempotencyKey(models.Model):
+    # A client's Idempotency-Key and the response it got; status_code is
+    # null while the first request with the key is still running.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    content_type = models.CharField(max_length=255, blank=True)
+    content = models.BinaryField(blank=True)
+    created = models.DateTimeField()
+    expires = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'key')
+
+class Job(models.Model):
+    # A background task call waiting in the queue (see background.py). Jobs
+    # are deleted once they succeed; failed ones stay for inspection.
+    QUEUED, RUNNING, FAILED = 'queued', 'running', 'failed'
+
+    name = models.CharField(max_length=255)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(max_length=16, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField()
+    claim = models.CharField(max_length=32, blank=True, db_index=True)
+    locked_at = models.DateTimeField(null=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
@@ -0,0 +1,77 @@
+import csv
+import json
+from collections import defaultdict
+from itertools import islice
+from .menu_io import CSV, EchoBuffer
+from .models import Order, OrderItem
+
+# Order history for accounting, oldest order first. CSV has one row per order
+# item (an order without items gets one row with empty item columns); JSON
+# lines has one order per line with its items nested. An interrupted export
+# resumes with after=<last complete order id>.
+
+ORDER_FIELDS = ('id', 'date', 'user', 'delivery_crew', 'status', 'total')
+ITEM_FIELDS = ('menuitem', 'title', 'quantity', 'unit_price', 'price')
+CSV_HEADER = ORDER_FIELDS + tuple('item_' + field for field in ITEM_FIELDS)
+
+def filter_orders(date_from=None, date_to=None, user=None, delivery_crew=None, status=None, after=None):
+    queryset = Order.objects.all()
+    if date_from is not None:
+        queryset = queryset.filter(date__gte=date_from)
+    if date_to is not None:
+        queryset = queryset.filter(date__lte=date_to)
+    if user is not None:
+        queryset = queryset.filter(user_id=user)
+    if delivery_crew is not None:
+        queryset = queryset.filter(delivery_crew_id=delivery_crew)
+    if status is not None:
+        queryset = queryset.filter(status=status)
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after)
+    return queryset.order_by('pk')
+
+def iter_orders(queryset, chunk_size=2000):
+    # Streams (order row, [item rows]) through a server-side cursor where the
+    # backend has one, loading the items of chunk_size orders per query, so
+    # memory stays bounded by the chunk whatever the history size.
+    orders = queryset.values_list('id', 'date', 'user_id', 'delivery_crew_id', 'status', 'total').iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(orders, chunk_size))
+        if not chunk:
+            return
+        items = defaultdict(list)
+        rows = (OrderItem.objects.filter(order_id__in=[order[0] for order in chunk]).order_by('pk')
+                .values_list('order_id', 'menuitem_id', 'menuitem__title', 'quantity', 'unit_price', 'price'))
+        for row in rows:
+            items[row[0]].append(row[1:])
+        for order in chunk:
+            yield order, items.get(order[0], [])
+
+def _json(order, items):
+    orderId, date, user, crew, status, total = order
+    return json.dumps({
+        'id': orderId, 'date': date.isoformat(), 'user': user, 'delivery_crew': crew,
+        'status': status, 'total': str(total),
+        'items': [dict(zip(ITEM_FIELDS, (menuitem, title, quantity, str(unitPrice), str(price))))
+                  for menuitem, title, quantity, unitPrice, price in items],
+    }, ensure_ascii=False) + '\n'
+
+def export_orders(queryset, fmt, chunk_size=2000, header=True):
+    # Yields text, one chunk of orders at a time.
+    writer = csv.writer(EchoBuffer())
+    if fmt == CSV and header:
+        yield writer.writerow(CSV_HEADER)
+    lines = []
+    for order, items in iter_orders(queryset, chunk_size):
+        if fmt != CSV:
+            lines.append(_json(order, items))
+        else:
+            orderId, date, user, crew, status, total = order
+            columns = [orderId, date.isoformat(), user, '' if crew is None else crew, 'true' if status else 'false', total]
+            for item in items or [('',) * len(ITEM_FIELDS)]:
+                lines.append(writer.writerow(columns + list(item)))
+        if len(lines) >= chunk_size:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
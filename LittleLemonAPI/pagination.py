@@ -0,0 +1,196 @@
+import json
+from asgiref.sync import sync_to_async
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+def _flip(field):
+    return field[1:] if field.startswith('-') else '-' + field
+
+def with_tiebreaker(ordering):
+    ordering = list(ordering)
+    if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+        ordering.append('-pk' if ordering[0].startswith('-') else 'pk')
+    return ordering
+
+def _keyset_filter(ordering, values):
+    # Rows strictly after `values` in `ordering`:
+    # (a > x) OR (a = x AND b > y) OR (a = x AND b = y AND id > z) ...
+    after, equal = Q(), Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        after |= equal & Q(**{'%s__%s' % (name, 'lt' if field.startswith('-') else 'gt'): value})
+        equal &= Q(**{name: value})
+    return after
+
+def _clean_value(model, path, value):
+    # Converts a cursor value the way the column an ordering such as 'price',
+    # '-date' or 'menuitem__price' compares it. Orderings that are not model
+    # fields (annotations) pass through.
+    *relations, name = path.lstrip('-').split('__')
+    try:
+        for relation in relations:
+            model = model._meta.get_field(relation).related_model
+        field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return value
+    return (field.target_field if field.is_relation else field).clean(value, None)
+
+class KeysetPagination(BasePagination):
+    # Cursor pagination over the view's ordering plus a primary-key tie-breaker. Pages
+    # are fetched with a WHERE on the last seen key, so there is no COUNT(*)
+    # and no OFFSET scan however deep the client pages.
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    default_ordering = ('-pk',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def uses_keyset(self, request):
+        return True
+
+    def get_page_size(self, request):
+        maxPageSize = getattr(settings, 'MAX_PAGE_SIZE', 100)
+        try:
+            pageSize = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        if pageSize <= 0:
+            return api_settings.PAGE_SIZE
+        return min(pageSize, maxPageSize)
+
+    def get_ordering(self, request, queryset, view):
+        ordering = None
+        for backend in getattr(view, 'filter_backends', []):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+        return with_tiebreaker(ordering or self.default_ordering)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            reverse, values = json.loads(b64decode(encoded.encode('ascii')).decode('utf-8'))
+        except (BinasciiError, UnicodeError, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values, bool(reverse)
+
+    def clean_cursor(self, model, values):
+        # A well-formed cursor can still carry values its columns reject;
+        # those are as invalid as a mangled one.
+        try:
+            values = [_clean_value(model, field, value) for field, value in zip(self.ordering, values)]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        # SQLite enforces no integer ranges, so out of 64-bit range is checked here.
+        if any(value is None or isinstance(value, int) and not -2 ** 63 <= value < 2 ** 63 for value in values):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def encode_cursor(self, instance, reverse):
+        # Pages hold model instances, or .values() rows on the fast list path.
+        if isinstance(instance, dict):
+            values = [instance[field.lstrip('-')] for field in self.ordering]
+        else:
+            values = [getattr(instance, field.lstrip('-')) for field in self.ordering]
+        raw = json.dumps([int(reverse), values], cls=DjangoJSONEncoder)
+        return replace_query_param(self.base_url, self.cursor_query_param, b64encode(raw.encode('utf-8')).decode('ascii'))
+
+    def get_page_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor, self.reverse = self.decode_cursor(request)
+        if self.cursor is not None:
+            self.cursor = self.clean_cursor(queryset.model, self.cursor)
+        ordering = [_flip(field) for field in self.ordering] if self.reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(_keyset_filter(ordering, self.cursor))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        hasMore = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, hasMore
+        else:
+            self.has_next, self.has_previous = hasMore, self.cursor is not None
+        return self.page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        return self.set_page([obj async for obj in queryset])
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+class OptInKeysetPagination(KeysetPagination):
+    # The project's default pagination (page numbers and a count) unless the
+    # client asks for keyset pages with ?pagination=cursor or sends a
+    # cursor. Cursor links keep the parameter, so later pages stay keyset.
+    mode_query_param = 'pagination'
+
+    def uses_keyset(self, request):
+        return (request.query_params.get(self.mode_query_param) == 'cursor'
+                or self.cursor_query_param in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.fallback = None if self.uses_keyset(request) else api_settings.DEFAULT_PAGINATION_CLASS()
+        if self.fallback is None:
+            return super().paginate_queryset(queryset, request, view)
+        return self.fallback.paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.fallback = None if self.uses_keyset(request) else api_settings.DEFAULT_PAGINATION_CLASS()
+        if self.fallback is None:
+            return await super().apaginate_queryset(queryset, request, view)
+        return await sync_to_async(self.fallback.paginate_queryset)(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.fallback is None:
+            return super().get_paginated_response(data)
+        return self.fallback.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return api_settings.DEFAULT_PAGINATION_CLASS().get_paginated_response_schema(schema)
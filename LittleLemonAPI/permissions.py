@@ -1,13 +1,14 @@
 from rest_framework import permissions
+from .roles import get_roles, is_manager, is_delivery_crew, MANAGER, DELIVERY_CREW
 
 class IsManager(permissions.BasePermission):
     def has_permission(self, request, view):
-        return request.user and (request.user.groups.filter(name='Manager').exists() or request.user.is_staff)
+        return request.user and (request.user.is_staff or is_manager(request.user))
 
 class IsDeliveryCrew(permissions.BasePermission):
     def has_permission(self, request, view):
-        return request.user and request.user.groups.filter(name='Delivery crew').exists()
+        return request.user and is_delivery_crew(request.user)
 
 class IsCustomer(permissions.BasePermission):
     def has_permission(self, request, view):
-        return request.user and not request.user.groups.filter(name__in=['Manager', 'Delivery crew']).exists()
\ No newline at end of file
+        return request.user and not get_roles(request.user) & {MANAGER, DELIVERY_CREW}
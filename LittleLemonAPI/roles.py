@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+
+MANAGER = 'Manager'
+DELIVERY_CREW = 'Delivery crew'
+
+# Sent with user_ids whenever their roles may have changed, after the shared
+# entries are gone; caches holding roles of their own listen to it.
+roles_changed = Signal()
+
+def _cache_key(user_id):
+    return 'roles:%s' % user_id
+
+def get_roles(user):
+    # Group names are loaded once per request and memoized on request.user;
+    # ROLE_CACHE_TIMEOUT additionally shares them across requests.
+    if not user or not user.is_authenticated:
+        return frozenset()
+    roles = getattr(user, '_roles', None)
+    if roles is None:
+        timeout = getattr(settings, 'ROLE_CACHE_TIMEOUT', 0)
+        if timeout:
+            roles = cache.get(_cache_key(user.pk))
+        if roles is None:
+            roles = frozenset(user.groups.values_list('name', flat=True))
+            if timeout:
+                cache.set(_cache_key(user.pk), roles, timeout)
+        user._roles = roles
+    return roles
+
+def is_manager(user):
+    return MANAGER in get_roles(user)
+
+def is_delivery_crew(user):
+    return DELIVERY_CREW in get_roles(user)
+
+def invalidate_roles(*user_ids):
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
+    roles_changed.send(sender=Group, user_ids=user_ids)
+
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+def _groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+    if reverse:
+        # Group side of the relation: pk_set holds users, or is None on clear.
+        userIds = pk_set or instance.user_set.values_list('pk', flat=True)
+        invalidate_roles(*userIds)
+    else:
+        instance.__dict__.pop('_roles', None)
+        invalidate_roles(instance.pk)
+
+@receiver(post_save, sender=Group)
+def _group_saved(sender, instance, created, **kwargs):
+    # A renamed group changes its members' roles.
+    if not created:
+        invalidate_roles(*instance.user_set.values_list('pk', flat=True))
+
+@receiver(pre_delete, sender=Group)
+def _group_deleting(sender, instance, **kwargs):
+    # Deleting a group drops its memberships without m2m_changed, and they
+    # are gone by post_delete.
+    instance._memberIds = list(instance.user_set.values_list('pk', flat=True))
+
+@receiver(post_delete, sender=Group)
+def _group_deleted(sender, instance, **kwargs):
+    invalidate_roles(*getattr(instance, '_memberIds', ()))
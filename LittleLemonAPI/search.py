@@ -0,0 +1,68 @@
+import re
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import OrderingFilter, SearchFilter
+
+MENU_FTS_TABLE = 'LittleLemonAPI_menuitem_fts'
+SEARCH_RANK = 'search_rank'
+
+_available = {}
+
+def fts_available(connection):
+    # The index only exists on SQLite builds with FTS5; everything else keeps
+    # the stock LIKE search.
+    key = (connection.alias, str(connection.settings_dict['NAME']))
+    if key not in _available:
+        available = False
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [MENU_FTS_TABLE])
+                available = cursor.fetchone() is not None
+        _available[key] = available
+    return _available[key]
+
+def match_expression(terms):
+    # Every word must match, each as a prefix so "gre sal" finds "Greek salad".
+    words = [word for term in terms for word in re.findall(r'\w+', term)]
+    return ' '.join('"%s"*' % word for word in words)
+
+def _match_sql():
+    return 'SELECT rowid FROM "%s" WHERE "%s" MATCH %%s' % (MENU_FTS_TABLE, MENU_FTS_TABLE)
+
+def search_menu(terms, using='default', limit=None):
+    # Ids of the best `limit` matches, best first.
+    expression = match_expression(terms)
+    if not expression:
+        return []
+    limit = limit or getattr(settings, 'SEARCH_RANKED_RESULTS', 200)
+    with connections[using].cursor() as cursor:
+        cursor.execute('%s ORDER BY bm25("%s") LIMIT %%s' % (_match_sql(), MENU_FTS_TABLE), [expression, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+class FullTextSearchFilter(SearchFilter):
+    # Same ?search= parameter as SearchFilter. Views that set
+    # `fulltext_search = True` are answered from the FTS5 index and annotated
+    # with their relevance position; the rest fall back to LIKE lookups.
+    # Every match is returned; only the best SEARCH_RANKED_RESULTS get their
+    # own position, the rest share the last one.
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        connection = connections[queryset.db]
+        if not terms or not getattr(view, 'fulltext_search', False) or not fts_available(connection):
+            return super().filter_queryset(request, queryset, view)
+        ids = search_menu(terms, using=queryset.db)
+        if not ids:
+            return queryset.none()
+        rank = Case(*[When(pk=pk, then=Value(position)) for position, pk in enumerate(ids)],
+                    default=Value(len(ids)), output_field=IntegerField())
+        return (queryset.filter(pk__in=RawSQL(_match_sql(), [match_expression(terms)]))
+                .annotate(**{SEARCH_RANK: rank}))
+
+class RelevanceOrderingFilter(OrderingFilter):
+    # Without an explicit ?ordering=, full-text results come back best match first.
+    def get_ordering(self, request, queryset, view):
+        if self.ordering_param not in request.query_params and SEARCH_RANK in queryset.query.annotations:
+            return [SEARCH_RANK]
+        return super().get_ordering(request, queryset, view)
@@ -1,7 +1,11 @@
+from datetime import date, timedelta
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator 
-from .models import MenuItem, Category, Cart, Order, OrderItem
+from .models import MenuItem, Category, Cart, Order, OrderItem, OrderSummary, DailyOrderSummary, CrewOrderSummary
+from .carts import ADD, MAX_QUANTITY, SET, REMOVE
+from .roles import is_delivery_crew
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -12,7 +16,19 @@ class MenuItemSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = MenuItem
-        fields = '__all__'
+        # Stock changes with every checkout and is served by menu-items/<id>/stock.
+        exclude = ('stock', 'stock_shards')
+
+class StockSerializer(serializers.Serializer):
+    stock = serializers.IntegerField(min_value=0, allow_null=True)
+    shards = serializers.IntegerField(min_value=0, max_value=64, default=0)
+
+class MenuImportSerializer(serializers.Serializer):
+    title = serializers.CharField(max_length=255)
+    price = serializers.DecimalField(max_digits=6, decimal_places=2)
+    featured = serializers.BooleanField(default=False)
+    category = serializers.SlugField(max_length=50)
+    category_title = serializers.CharField(max_length=255, required=False)
 
 User = get_user_model()
 class UserSerializer(serializers.ModelSerializer):
@@ -27,7 +43,7 @@ class CartSerializer(serializers.ModelSerializer):
     class Meta:
         model = Cart
         fields = ['user', 'menuitem', 'unit_price', 'quantity', 'price']
-        read_only_fields = ('price',)
+        read_only_fields = ('unit_price', 'price')
         validators = [
             UniqueTogetherValidator(
                 queryset=Cart.objects.all(),
@@ -36,9 +52,81 @@ class CartSerializer(serializers.ModelSerializer):
         ]
     
     def validate(self, attrs):
+        attrs['unit_price'] = attrs['menuitem'].price
         attrs['price'] = attrs['quantity'] * attrs['unit_price']
         return attrs
 
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=[ADD, SET, REMOVE], default=ADD)
+    menuitem = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=MAX_QUANTITY, required=False)
+
+    def validate(self, attrs):
+        if attrs['op'] != REMOVE and 'quantity' not in attrs:
+            raise serializers.ValidationError({'quantity': 'This field is required.'})
+        return attrs
+
+class DispatchSerializer(serializers.Serializer):
+    limit = serializers.IntegerField(min_value=1, max_value=1000, required=False)
+    delivery_crew = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+
+class OrderExportSerializer(serializers.Serializer):
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    user = serializers.IntegerField(min_value=1, required=False)
+    delivery_crew = serializers.IntegerField(min_value=1, required=False)
+    status = serializers.BooleanField(required=False, allow_null=True, default=None)
+    after = serializers.IntegerField(min_value=0, required=False)
+
+    def validate(self, attrs):
+        if 'date_from' in attrs and 'date_to' in attrs and attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError({'date_to': 'Must not be before date_from.'})
+        return attrs
+
+class SalesAnalyticsSerializer(serializers.Serializer):
+    # Defaults to the last 30 days, today included.
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+    by = serializers.ChoiceField(choices=('revenue', 'quantity'), default='revenue')
+
+    def validate(self, attrs):
+        attrs.setdefault('date_to', date.today())
+        attrs.setdefault('date_from', attrs['date_to'] - timedelta(days=29))
+        if attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError({'date_to': 'Must not be before date_from.'})
+        maxDays = getattr(settings, 'ANALYTICS_MAX_DAYS', 366)
+        if (attrs['date_to'] - attrs['date_from']).days >= maxDays:
+            raise serializers.ValidationError({'date_from': 'Ranges are limited to %d days.' % maxDays})
+        return attrs
+
+# Report rows. Money renders like every other amount in the API: a string
+# with two decimals. quantity is in units sold, unlike the summaries'
+# item_count, which counts order lines.
+class DailyRevenueSerializer(serializers.Serializer):
+    date = serializers.DateField()
+    orders = serializers.IntegerField()
+    delivered = serializers.IntegerField()
+    quantity = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+class MenuItemSalesSerializer(serializers.Serializer):
+    menuitem = serializers.IntegerField()
+    title = serializers.CharField(allow_null=True)
+    quantity = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+class CategorySalesSerializer(serializers.Serializer):
+    category = serializers.IntegerField()
+    title = serializers.CharField()
+    quantity = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+class CrewDeliveriesSerializer(serializers.Serializer):
+    delivery_crew = serializers.IntegerField()
+    assigned = serializers.IntegerField()
+    delivered = serializers.IntegerField()
+
 
 class OrderItemSerializer(serializers.ModelSerializer):
 
@@ -47,18 +135,16 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = ('order', 'menuitem', 'quantity', 'unit_price', 'price')
 class OrderSerializer(serializers.ModelSerializer):
 
-    orderitem = OrderItemSerializer(many=True, read_only=True, source='order')
+    orderitem = OrderItemSerializer(many=True, read_only=True, source='orderitem_set')
     class Meta:
         model = Order
         fields = ['id', 'user', 'delivery_crew', 
                   'status', 'total', 'date', 'orderitem']
     
     def validate_delivery_crew(self, value):
-        try:
-            delivery = User.objects.get(pk=value.pk)
-        except User.DoesNotExist:
-            raise serializers.ValidationError("Delivery crew not found")
-        if not delivery.groups.filter(name='Delivery crew').exists():
+        if value is None:
+            return value
+        if not is_delivery_crew(value):
             raise serializers.ValidationError("This user is not a delivery crew")
         return value
     
@@ -71,4 +157,17 @@ class DeliveryOrderSerializer(serializers.ModelSerializer):
         read_only_fields = ('user', 'delivery_crew', 'total', 'date')
 
 
+class OrderSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderSummary
+        fields = ('order', 'user', 'delivery_crew', 'status', 'total', 'item_count', 'date')
 
+class DailyOrderSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailyOrderSummary
+        fields = ('date', 'order_count', 'delivered_count', 'item_count', 'revenue')
+
+class CrewOrderSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CrewOrderSummary
+        fields = ('delivery_crew', 'order_count', 'delivered_count', 'item_count', 'revenue')
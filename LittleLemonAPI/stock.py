@@ -0,0 +1,126 @@
+import hashlib
+import random
+from functools import partial, reduce
+from operator import or_
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Exists, F, OuterRef, PositiveIntegerField, Q, Sum, When
+from rest_framework.exceptions import ValidationError
+from .caching import get_menu_cache
+from .models import MenuItem, StockShard
+
+# Per-item stock. Checkout takes the whole cart's stock in one guarded UPDATE
+# (plus one per sharded item), so no read-modify-write ever holds a hot row
+# and a checkout either gets every unit it asked for or none. Which items are
+# sold out is cached as one set whose digest is part of the menu cache keys.
+
+SOLD_OUT_KEY = 'stock:sold-out'
+
+def _sold_out_ids(queryset):
+    hasStock = Exists(StockShard.objects.filter(menuitem=OuterRef('pk'), stock__gt=0))
+    return set(queryset.filter(Q(stock=0) | Q(stock_shards__gt=0) & ~hasStock).values_list('pk', flat=True))
+
+def _state(ids):
+    digest = hashlib.md5(','.join(map(str, sorted(ids))).encode()).hexdigest()[:12] if ids else '0'
+    return digest, frozenset(ids)
+
+def get_sold_out():
+    # (digest, frozenset of sold-out menu item ids).
+    cache = get_menu_cache()
+    state = cache.get(SOLD_OUT_KEY)
+    if state is None:
+        state = _state(_sold_out_ids(MenuItem.objects.all()))
+        cache.set(SOLD_OUT_KEY, state, getattr(settings, 'STOCK_SOLD_OUT_TIMEOUT', 60))
+    return state
+
+def refresh_sold_out(menuitemIds):
+    # After stock of these items changed. Only rebuilds the set when one of
+    # them moved in or out of it; the timeout bounds what racing refreshes
+    # can leave behind.
+    cache = get_menu_cache()
+    state = cache.get(SOLD_OUT_KEY)
+    if state is not None and _sold_out_ids(MenuItem.objects.filter(pk__in=menuitemIds)) == state[1] & set(menuitemIds):
+        return
+    cache.set(SOLD_OUT_KEY, _state(_sold_out_ids(MenuItem.objects.all())), getattr(settings, 'STOCK_SOLD_OUT_TIMEOUT', 60))
+
+def get_stock(menuitem):
+    if not menuitem.stock_shards:
+        return menuitem.stock
+    return StockShard.objects.filter(menuitem=menuitem).aggregate(stock=Sum('stock'))['stock'] or 0
+
+def set_stock(menuitem, stock, shards=0):
+    # stock=None stops tracking the item. With shards > 1 the stock is split
+    # over that many rows, for items hot enough that one row is contended.
+    shards = shards if stock is not None and shards > 1 else 0
+    with transaction.atomic():
+        StockShard.objects.filter(menuitem=menuitem).delete()
+        if shards:
+            share, extra = divmod(stock, shards)
+            StockShard.objects.bulk_create([StockShard(menuitem=menuitem, shard=shard, stock=share + (shard < extra))
+                                            for shard in range(shards)])
+        # update() rather than save(): stock is not part of the cached menu.
+        MenuItem.objects.filter(pk=menuitem.pk).update(stock=None if shards else stock, stock_shards=shards)
+        menuitem.stock, menuitem.stock_shards = None if shards else stock, shards
+        transaction.on_commit(partial(refresh_sold_out, [menuitem.pk]))
+
+def _take_from_shards(menuitem, quantity):
+    # Any one shard with enough stock, starting from a random one so
+    # parallel checkouts spread over the rows. If none has enough on its own,
+    # lock all of them and take from each in turn.
+    start = random.randrange(menuitem.stock_shards)
+    for offset in range(menuitem.stock_shards):
+        shard = (start + offset) % menuitem.stock_shards
+        if StockShard.objects.filter(menuitem=menuitem, shard=shard, stock__gte=quantity).update(stock=F('stock') - quantity):
+            return True
+    shards = list(StockShard.objects.select_for_update().filter(menuitem=menuitem, stock__gt=0).order_by('shard'))
+    if sum(shard.stock for shard in shards) < quantity:
+        return False
+    for shard in shards:
+        take = min(shard.stock, quantity)
+        StockShard.objects.filter(pk=shard.pk).update(stock=F('stock') - take)
+        quantity -= take
+        if not quantity:
+            break
+    return True
+
+def take_stock(lines):
+    # Takes stock for [(menu item, quantity)] inside the caller's
+    # transaction, or raises ValidationError naming every item that is short
+    # (the caller's transaction then rolls back whatever was taken).
+    plain = [(item, quantity) for item, quantity in lines if item.stock is not None and not item.stock_shards]
+    sharded = [(item, quantity) for item, quantity in lines if item.stock_shards]
+    short = []
+    if plain:
+        updated = MenuItem.objects.filter(reduce(or_, (Q(pk=item.pk, stock__gte=quantity) for item, quantity in plain))).update(
+            stock=Case(*(When(pk=item.pk, then=F('stock') - quantity) for item, quantity in plain),
+                       default=F('stock'), output_field=PositiveIntegerField()))
+        if updated != len(plain):
+            left = dict(MenuItem.objects.filter(pk__in=[item.pk for item, _ in plain]).values_list('pk', 'stock'))
+            short += [item for item, quantity in plain if left.get(item.pk) is None or left[item.pk] < quantity]
+    short += [item for item, quantity in sharded if not _take_from_shards(item, quantity)]
+    if short:
+        raise ValidationError({'menuitem': ['Not enough "%s" left.' % item.title for item in short]})
+    tracked = [item.pk for item, _ in plain + sharded]
+    if tracked:
+        transaction.on_commit(partial(refresh_sold_out, tracked))
+
+class SoldOutMixin:
+    # Adds sold_out to every menu item in list and retrieve responses,
+    # cached or not, from the cached set; the set's digest is part of the
+    # cache key and ETag so no client keeps a stale answer.
+    def get_sold_out(self):
+        if not hasattr(self, '_sold_out'):
+            self._sold_out = get_sold_out()
+        return self._sold_out
+
+    def get_cache_key(self, request, version):
+        return super().get_cache_key(request, '%s.%s' % (version, self.get_sold_out()[0]))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        data = getattr(response, 'data', None)
+        if response.status_code == 200 and getattr(self, 'action', None) in ('list', 'retrieve') and data is not None:
+            soldOut = self.get_sold_out()[1]
+            rows = data.get('results', [data]) if isinstance(data, dict) else data
+            for row in rows:
+                row['sold_out'] = row['id'] in soldOut
+        return super().finalize_response(request, response, *args, **kwargs)
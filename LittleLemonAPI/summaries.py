@@ -0,0 +1,122 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Greatest
+from .analytics import invalidate_days
+from .models import Order, OrderSummary, DailyOrderSummary, CrewOrderSummary
+
+# Read-side projection for the manager dashboard. Every order write in
+# OrderView goes through sync_order_summary/remove_order_summary, which keep
+# one OrderSummary row per order and apply the difference to the per-day and
+# per-crew rollups, so dashboard reads never touch Order or OrderItem.
+
+def _bump(model, lookup, sign, summary):
+    _add(model, lookup, {
+        'order_count': sign,
+        'delivered_count': sign * int(summary.status),
+        'item_count': sign * summary.item_count,
+        'revenue': sign * summary.total,
+    })
+
+def _add(model, lookup, deltas):
+    # One UPDATE in the steady state; the row is only created the first time
+    # a day or crew member shows up. Decrements stop at zero, so a rollup that
+    # drifted below the truth (see rebuild_order_summaries) cannot make an
+    # order write fail.
+    changes = {field: Greatest(F(field) + delta, Value(0), output_field=model._meta.get_field(field)) if delta < 0
+               else F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **{field: max(delta, 0) for field, delta in deltas.items()})
+    except IntegrityError:
+        model.objects.filter(**lookup).update(**changes)
+
+def _apply(summary, sign):
+    _bump(DailyOrderSummary, {'date': summary.date}, sign, summary)
+    if summary.delivery_crew_id is not None:
+        _bump(CrewOrderSummary, {'delivery_crew_id': summary.delivery_crew_id}, sign, summary)
+
+def _unchanged(previous, summary):
+    fields = ('delivery_crew_id', 'status', 'total', 'item_count', 'date')
+    return all(getattr(previous, field) == getattr(summary, field) for field in fields)
+
+def sync_order_summary(order, item_count=None):
+    with transaction.atomic():
+        previous = OrderSummary.objects.select_for_update().filter(order=order).first()
+        if item_count is None:
+            item_count = previous.item_count if previous else order.orderitem_set.count()
+        summary = OrderSummary(order=order, user_id=order.user_id, delivery_crew_id=order.delivery_crew_id,
+                               status=order.status, total=order.total, item_count=item_count, date=order.date)
+        if previous is not None and _unchanged(previous, summary):
+            return previous
+        if previous is not None:
+            _apply(previous, -1)
+        summary.save()
+        _apply(summary, 1)
+        invalidate_days([previous and previous.date, summary.date])
+    return summary
+
+def remove_order_summary(order):
+    with transaction.atomic():
+        previous = OrderSummary.objects.select_for_update().filter(order=order).first()
+        if previous is not None:
+            _apply(previous, -1)
+            previous.delete()
+            invalidate_days([previous.date])
+
+def assign_order_summaries(assignments):
+    # Bulk form of sync_order_summary for orders moving from no crew to a
+    # crew ({crew id: [order ids]}): per crew, one aggregate, one UPDATE of
+    # the order summaries and one of the crew rollup. Daily rollups are
+    # unaffected by the crew.
+    with transaction.atomic():
+        for crewId, orderIds in assignments.items():
+            summaries = OrderSummary.objects.filter(order_id__in=orderIds, delivery_crew__isnull=True)
+            deltas = summaries.aggregate(
+                order_count=Count('pk'),
+                delivered_count=Count('pk', filter=Q(status=True)),
+                item_count=Sum('item_count'),
+                revenue=Sum('total'),
+            )
+            if deltas['order_count']:
+                invalidate_days(summaries.order_by().values_list('date', flat=True).distinct())
+                summaries.update(delivery_crew_id=crewId)
+                _add(CrewOrderSummary, {'delivery_crew_id': crewId}, deltas)
+
+def _rollup(queryset, key):
+    return queryset.values(key).annotate(
+        order_count=Count('pk'),
+        delivered_count=Count('pk', filter=Q(status=True)),
+        item_count_sum=Sum('item_count'),
+        revenue=Sum('total'),
+    ).order_by()
+
+def rebuild_order_summaries(batch_size=1000):
+    # Full recompute, for backfilling history or repairing drift after writes
+    # that bypassed the API (admin, shell, deleted crew accounts).
+    with transaction.atomic():
+        CrewOrderSummary.objects.all().delete()
+        DailyOrderSummary.objects.all().delete()
+        OrderSummary.objects.all().delete()
+        orders = Order.objects.annotate(item_count=Count('orderitem')).order_by('pk')
+        batch = []
+        for order in orders.iterator(chunk_size=batch_size):
+            batch.append(OrderSummary(order_id=order.pk, user_id=order.user_id, delivery_crew_id=order.delivery_crew_id,
+                                      status=order.status, total=order.total, item_count=order.item_count, date=order.date))
+            if len(batch) >= batch_size:
+                OrderSummary.objects.bulk_create(batch)
+                batch = []
+        OrderSummary.objects.bulk_create(batch)
+        DailyOrderSummary.objects.bulk_create([
+            DailyOrderSummary(date=row['date'], order_count=row['order_count'], delivered_count=row['delivered_count'],
+                              item_count=row['item_count_sum'] or 0, revenue=row['revenue'] or 0)
+            for row in _rollup(OrderSummary.objects.all(), 'date')
+        ], batch_size=batch_size)
+        CrewOrderSummary.objects.bulk_create([
+            CrewOrderSummary(delivery_crew_id=row['delivery_crew'], order_count=row['order_count'],
+                             delivered_count=row['delivered_count'], item_count=row['item_count_sum'] or 0,
+                             revenue=row['revenue'] or 0)
+            for row in _rollup(OrderSummary.objects.filter(delivery_crew__isnull=False), 'delivery_crew')
+        ], batch_size=batch_size)
+    return OrderSummary.objects.count()
@@ -0,0 +1,50 @@
+from django.contrib.auth import get_user_model
+from django.core.mail import send_mail
+from django.db import transaction
+from .background import task
+from .events import order_changed
+from .models import Order
+from .roles import DELIVERY_CREW
+from .summaries import sync_order_summary
+
+# Work moved out of the request cycle. Every task here takes ids and checks
+# the current state first, so running it twice is harmless.
+
+@task
+def send_order_receipt(orderId):
+    order = Order.objects.select_related('user').filter(pk=orderId).first()
+    if order is None or not order.user.email:
+        return
+    lines = ['%d x %s  %s' % (quantity, title, price) for quantity, title, price in
+             order.orderitem_set.order_by('pk').values_list('quantity', 'menuitem__title', 'price')]
+    lines.append('Total: %s' % order.total)
+    send_mail('Little Lemon order #%d' % order.pk, '\n'.join(lines), None, [order.user.email])
+
+@task
+def membership_changed(userId, group, added):
+    user = get_user_model().objects.filter(pk=userId).first()
+    if user is None:
+        return
+    inGroup = user.groups.filter(name=group).exists()
+    if inGroup != added:
+        # Changed back since; a later job covers the current state.
+        return
+    if group == DELIVERY_CREW and not added:
+        release_crew_orders(user.pk)
+    if user.email:
+        send_mail('Little Lemon account update',
+                  'You were %s the %s group.' % ('added to' if added else 'removed from', group),
+                  None, [user.email])
+
+def release_crew_orders(crewId):
+    # Undelivered orders of someone who left the delivery crew go back to the
+    # dispatch queue, one order per transaction.
+    for orderId in list(Order.objects.filter(delivery_crew_id=crewId, status=False).values_list('pk', flat=True)):
+        with transaction.atomic():
+            order = Order.objects.select_for_update().filter(pk=orderId, delivery_crew_id=crewId, status=False).first()
+            if order is None:
+                continue
+            order.delivery_crew = None
+            order.save(update_fields=['delivery_crew'])
+            sync_order_summary(order)
+            order_changed(crewId, False, order)
@@ -0,0 +1,31 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+class _AssertMaxQueriesContext(CaptureQueriesContext):
+    def __init__(self, test_case, limit, connection):
+        self.test_case = test_case
+        self.limit = limit
+        super().__init__(connection)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return
+        executed = len(self)
+        self.test_case.assertLessEqual(
+            executed, self.limit,
+            '%d queries executed, at most %d expected\nCaptured queries were:\n%s' % (
+                executed, self.limit,
+                '\n'.join('%d. %s' % (i, query['sql']) for i, query in enumerate(self.captured_queries, start=1)),
+            ),
+        )
+
+class QueryBudgetMixin:
+    # Like TestCase.assertNumQueries, but only fails when an endpoint goes over
+    # its budget, so adding a prefetch never breaks a test.
+    def assertMaxQueries(self, limit, func=None, *args, using=DEFAULT_DB_ALIAS, **kwargs):
+        context = _AssertMaxQueriesContext(self, limit, connections[using])
+        if func is None:
+            return context
+        with context:
+            return func(*args, **kwargs)
@@ -1,3 +1,1322 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import threading
+import time
+from base64 import b64encode
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from tempfile import TemporaryDirectory
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import Group, User
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections
+from django.http import HttpResponse
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from .authentication import TokenCache, token_cache
+from .background import claim_jobs, enqueue, get_backoff, requeue_stale_jobs, run_job, task
+from .caching import MenuCacheMixin, get_menu_version
+from .dispatch import dispatch_orders, get_crew_loads, unassigned_orders
+from .events import ASSIGNED, CREATED, MANAGERS, EventHub, channels_for, hub, user_channel
+from .idempotency import IdempotencyKeyInUse, IdempotencyKeyReused, claim_key, store_response
+from .instrumentation import RequestProfile, registry
+from .menu_io import import_menu
+from .models import (Cart, Category, CrewOrderSummary, DailyOrderSummary, IdempotencyKey, Job, MenuItem, Order,
+                     OrderItem, OrderSummary, StockShard)
+from .order_export import filter_orders, iter_orders
+from .roles import DELIVERY_CREW, MANAGER, get_roles
+from .stock import get_stock, set_stock
+from .summaries import rebuild_order_summaries
+from .tasks import membership_changed, release_crew_orders, send_order_receipt
+from .testing import QueryBudgetMixin
+from .throttling import FixedWindowRateThrottle, SharedAnonRateThrottle
 
-# Create your tests here.
+class ApiTestMixin:
+    # Throttles off and caches empty, so tests only see the behaviour under test.
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        patcher = mock.patch.object(FixedWindowRateThrottle, 'allow_request', return_value=True)
+        self.allow_request = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.category = Category.objects.create(slug='mains', title='Mains')
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def fill_cart(self, user, menuitem, quantity=1):
+        return Cart.objects.create(user=user, menuitem=menuitem, quantity=quantity,
+                                   unit_price=menuitem.price, price=menuitem.price * quantity)
+
+    def post_in_parallel(self, users, path, **extra):
+        # One thread and connection per request, all released at once.
+        barrier = threading.Barrier(len(users))
+        statuses = []
+
+        def post(user):
+            try:
+                client = self.client_for(user)
+                barrier.wait()
+                statuses.append(client.post(path, **extra).status_code)
+            finally:
+                connection.close()
+        threads = [threading.Thread(target=post, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(statuses)
+
+class CheckoutConcurrencyTests(ApiTestMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.menuitem = MenuItem.objects.create(title='Soup', price=4, featured=False, category=self.category)
+
+    def test_parallel_checkouts_all_succeed(self):
+        users = [User.objects.create_user('customer%d' % n) for n in range(10)]
+        for user in users:
+            self.fill_cart(user, self.menuitem)
+        self.assertEqual(self.post_in_parallel(users, '/api/orders'), [201] * 10)
+        self.assertEqual(Order.objects.count(), 10)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_parallel_double_submit_places_one_order(self):
+        user = User.objects.create_user('customer')
+        self.fill_cart(user, self.menuitem, 2)
+        statuses = self.post_in_parallel([user] * 5, '/api/orders')
+        self.assertEqual(statuses.count(201), 1)
+        self.assertTrue(all(code in (400, 409) for code in statuses if code != 201), statuses)
+        self.assertEqual(Order.objects.count(), 1)
+
+class StockConcurrencyTests(ApiTestMixin, TransactionTestCase):
+    # More buyers than stock, all at once: every unit is sold exactly once.
+    def setUp(self):
+        super().setUp()
+        self.menuitem = MenuItem.objects.create(title='Soup', price=4, featured=False, category=self.category)
+        self.users = [User.objects.create_user('customer%d' % n) for n in range(12)]
+        for user in self.users:
+            self.fill_cart(user, self.menuitem)
+
+    def assertSoldOnce(self, stock):
+        statuses = self.post_in_parallel(self.users, '/api/orders')
+        self.assertEqual(statuses, [201] * stock + [400] * (len(self.users) - stock))
+        self.assertEqual(Order.objects.count(), stock)
+        self.assertEqual(get_stock(MenuItem.objects.get(pk=self.menuitem.pk)), 0)
+
+    def test_stock_never_oversells(self):
+        set_stock(self.menuitem, 5)
+        self.assertSoldOnce(5)
+
+    def test_sharded_stock_never_oversells(self):
+        set_stock(self.menuitem, 7, shards=3)
+        self.assertSoldOnce(7)
+        self.assertEqual(list(StockShard.objects.values_list('stock', flat=True)), [0, 0, 0])
+
+class QueryBudgetTests(QueryBudgetMixin, ApiTestMixin, TestCase):
+    # Budgets are for a cold cache and must not grow with the page size.
+    def setUp(self):
+        super().setUp()
+        self.manager = User.objects.create_user('manager')
+        self.manager.groups.add(Group.objects.create(name=MANAGER))
+        self.crew = User.objects.create_user('crew')
+        self.crew.groups.add(Group.objects.create(name=DELIVERY_CREW))
+        self.customers = [User.objects.create_user('customer%d' % n) for n in range(3)]
+        self.menuitems = [MenuItem.objects.create(title='Dish %d' % n, price=n + 1, featured=n % 2 == 0, category=self.category)
+                          for n in range(12)]
+        for n in range(15):
+            order = Order.objects.create(user=self.customers[n % 3], delivery_crew=self.crew, total=6, date=date(2024, 1, n + 1))
+            OrderItem.objects.bulk_create([OrderItem(order=order, menuitem=menuitem, quantity=1, unit_price=menuitem.price,
+                                                     price=menuitem.price) for menuitem in self.menuitems[:3]])
+        for menuitem in self.menuitems[:5]:
+            self.fill_cart(self.customers[0], menuitem)
+
+    def assertGetWithin(self, limit, user, path):
+        client = self.client_for(user)
+        cache.clear()
+        with self.assertMaxQueries(limit):
+            response = client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_menu_items(self):
+        self.assertGetWithin(3, self.manager, '/api/menu-items?pagination=cursor&page_size=10')
+        self.assertGetWithin(3, self.manager, '/api/menu-items?page=2')
+        self.assertGetWithin(2, self.manager, '/api/menu-items/%d' % self.menuitems[0].pk)
+        self.assertGetWithin(3, self.manager, '/api/menu-items/category')
+
+    def test_orders(self):
+        for user in (self.manager, self.customers[0], self.crew):
+            self.assertGetWithin(3, user, '/api/orders?pagination=cursor&page_size=10')
+            # Page numbers add the count.
+            self.assertGetWithin(4, user, '/api/orders?page=2')
+        self.assertGetWithin(2, self.manager, '/api/orders/%d' % Order.objects.first().pk)
+
+    def test_cart(self):
+        response = self.assertGetWithin(2, self.customers[0], '/api/cart/menu-items?pagination=cursor&page_size=10')
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertGetWithin(3, self.customers[0], '/api/cart/menu-items?page=2')
+
+@override_settings(FAST_LIST_SERIALIZATION=False)
+class SerializerQueryBudgetTests(QueryBudgetTests):
+    # Same budgets through the DRF serializers.
+    pass
+
+class KeysetPaginationTests(ApiTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('customer')
+        for n in range(5):
+            MenuItem.objects.create(title='Dish %d' % n, price=[3, 1, 2, 2, 5][n], featured=False, category=self.category)
+            Order.objects.create(user=self.user, total=n, date=date(2024, 1, 5 - n % 3))
+
+    def walk(self, path):
+        client = self.client_for(self.user)
+        rows = []
+        while path:
+            response = client.get(path)
+            self.assertEqual(response.status_code, 200)
+            rows += response.data['results']
+            path = response.data['next']
+        return rows
+
+    def test_pages_follow_the_ordering(self):
+        rows = self.walk('/api/menu-items?pagination=cursor&page_size=2&ordering=-price')
+        self.assertEqual([(row['price'], row['id']) for row in rows],
+                         sorted([(row['price'], row['id']) for row in rows], key=lambda row: (-float(row[0]), -row[1])))
+        self.assertEqual(len(rows), 5)
+        rows = self.walk('/api/orders?pagination=cursor&page_size=2&ordering=date')
+        self.assertEqual(len({row['id'] for row in rows}), 5)
+        self.assertEqual([row['date'] for row in rows], sorted(row['date'] for row in rows))
+
+    def test_page_numbers_unless_the_client_opts_in(self):
+        client = self.client_for(self.user)
+        response = client.get('/api/menu-items', {'page': 2, 'ordering': 'price'})
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual([row['price'] for row in response.data['results']], ['2.00', '3.00'])
+        self.assertIn('page=3', response.data['next'])
+        response = client.get('/api/menu-items', {'pagination': 'cursor'})
+        self.assertNotIn('count', response.data)
+        self.assertIn('pagination=cursor', response.data['next'])
+        self.assertIn('cursor=', response.data['next'])
+
+    def test_invalid_cursor_values_are_not_found(self):
+        client = self.client_for(self.user)
+        for path, values in (('/api/menu-items', ['abc', 1]), ('/api/menu-items', [{'a': 1}, 1]),
+                             ('/api/menu-items', [None, 1]), ('/api/menu-items', ['1.00', 'x']),
+                             ('/api/orders?ordering=date', ['notadate', 1]), ('/api/orders?ordering=date', [[2024], 1]),
+                             ('/api/orders?ordering=date', ['2024-01-01', 10 ** 30])):
+            cursor = b64encode(json.dumps([0, values]).encode()).decode()
+            response = client.get(path, {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, (path, values))
+            self.assertEqual(response.data['detail'], 'Invalid cursor')
+
+class AsyncViewTests(ApiTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        token_cache.clear()
+        self.user = User.objects.create_user('customer')
+        self.headers = {'Authorization': 'Token %s' % Token.objects.create(user=self.user).key}
+        self.menuitem = menuitem = MenuItem.objects.create(title='Soup', price=4, featured=False, category=self.category)
+        self.fill_cart(self.user, menuitem)
+        self.order = Order.objects.create(user=self.user, total=4, date=date(2024, 1, 1))
+        OrderItem.objects.create(order=self.order, menuitem=menuitem, quantity=1, unit_price=4, price=4)
+
+    async def test_hooks_run_once_per_request(self):
+        # Throttles and the token cache count each request exactly once, as
+        # on the sync endpoints.
+        client = AsyncClient()
+        for path in ('menu-items', 'menu-items/%d' % self.menuitem.pk, 'orders', 'orders/%d' % self.order.pk, 'cart/menu-items'):
+            calls, lookups = self.allow_request.call_count, token_cache.hits + token_cache.misses
+            response = await client.get('/api/async/' + path, headers=self.headers)
+            self.assertEqual(response.status_code, 200, path)
+            syncCalls = self.allow_request.call_count - calls
+            calls = self.allow_request.call_count
+            await client.get('/api/' + path, headers=self.headers)
+            self.assertEqual(syncCalls, self.allow_request.call_count - calls, path)
+            self.assertEqual(token_cache.hits + token_cache.misses - lookups, 2, path)
+
+    async def test_menu_cache_is_written_off_the_event_loop(self):
+        onLoop = []
+        storeResponse = MenuCacheMixin.store_response
+
+        def store_response(view, *args):
+            try:
+                asyncio.get_running_loop()
+                onLoop.append(True)
+            except RuntimeError:
+                onLoop.append(False)
+            return storeResponse(view, *args)
+        with mock.patch.object(MenuCacheMixin, 'store_response', store_response):
+            response = await AsyncClient().get('/api/async/menu-items', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(onLoop, [False])
+
+class FastSerializationTests(ApiTestMixin, TestCase):
+    # The fast list path must render exactly what the DRF serializers do.
+    def setUp(self):
+        super().setUp()
+        self.manager = User.objects.create_user('manager')
+        self.manager.groups.add(Group.objects.create(name=MANAGER))
+        self.crew = User.objects.create_user('crew')
+        self.customer = User.objects.create_user('customer')
+        menuitems = [MenuItem.objects.create(title='Dish "%d" é' % n, price=Decimal('%d.%d5' % (n + 1, n)), featured=n % 2 == 0,
+                                             category=self.category) for n in range(4)]
+        for n in range(3):
+            order = Order.objects.create(user=self.customer, delivery_crew=self.crew if n else None, status=n == 2,
+                                         total='12.50', date=date(2024, 1, n + 1))
+            OrderItem.objects.bulk_create([OrderItem(order=order, menuitem=menuitem, quantity=n + 1, unit_price=menuitem.price,
+                                                     price=menuitem.price * (n + 1)) for menuitem in menuitems[n:]])
+        for menuitem in menuitems[:3]:
+            self.fill_cart(self.customer, menuitem, 2)
+
+    def assertSameContent(self, user, path):
+        client = self.client_for(user)
+        contents = []
+        for fast in (True, False):
+            cache.clear()
+            with override_settings(FAST_LIST_SERIALIZATION=fast):
+                response = client.get(path)
+            self.assertEqual(response.status_code, 200, path)
+            contents.append(response.content)
+        self.assertEqual(contents[0], contents[1], path)
+
+    def test_menu_items(self):
+        self.assertSameContent(self.manager, '/api/menu-items')
+        self.assertSameContent(self.manager, '/api/menu-items?pagination=cursor&page_size=2&ordering=-price')
+        self.assertSameContent(self.manager, '/api/menu-items?page=2&ordering=-price')
+
+    def test_orders(self):
+        for user in (self.manager, self.customer, self.crew):
+            self.assertSameContent(user, '/api/orders')
+        self.assertSameContent(self.customer, '/api/orders/%d' % Order.objects.order_by('pk').first().pk)
+
+    def test_cart(self):
+        self.assertSameContent(self.customer, '/api/cart/menu-items')
+
+class SalesAnalyticsTests(ApiTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.manager = User.objects.create_user('manager')
+        self.manager.groups.add(Group.objects.create(name=MANAGER))
+        customer = User.objects.create_user('customer')
+        menuitems = [MenuItem.objects.create(title='Dish %d' % n, price=Decimal('2.10'), featured=False, category=self.category)
+                     for n in range(2)]
+        for n in range(2):
+            order = Order.objects.create(user=customer, status=n == 0, total=Decimal('10.50'), date=date(2024, 1, 1))
+            OrderItem.objects.bulk_create([OrderItem(order=order, menuitem=menuitem, quantity=quantity, unit_price=Decimal('2.10'),
+                                                     price=Decimal('2.10') * quantity)
+                                           for menuitem, quantity in zip(menuitems, (3, 2))])
+
+    def report(self, name):
+        response = self.client_for(self.manager).get('/api/analytics/%s' % name, {'date_from': '2024-01-01', 'date_to': '2024-01-02'})
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)['results']
+
+    def test_money_is_exact_and_quantity_counts_units(self):
+        self.assertEqual(self.report('revenue'), [{'date': '2024-01-01', 'orders': 2, 'delivered': 1, 'quantity': 10,
+                                                   'revenue': '21.00'}])
+        self.assertEqual([(row['quantity'], row['revenue']) for row in self.report('top-items')], [(6, '12.60'), (4, '8.40')])
+        self.assertEqual([(row['quantity'], row['revenue']) for row in self.report('categories')], [(10, '21.00')])
+
+    def test_finished_days_expire(self):
+        # A change whose invalidation never reached this cache, as with a
+        # per-process cache and another worker.
+        self.report('revenue')
+        Order.objects.update(total=Decimal('1.00'))
+        self.assertEqual(self.report('revenue')[0]['revenue'], '21.00')
+        later = time.time() + settings.ANALYTICS_PARTITION_TIMEOUT + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertEqual(self.report('revenue')[0]['revenue'], '2.00')
+
+class RoleCacheTests(ApiTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('customer')
+        self.group = Group.objects.create(name=MANAGER)
+
+    def roles(self):
+        # As a new request would see them.
+        return get_roles(User.objects.get(pk=self.user.pk))
+
+    def test_memoized_per_request_and_shared_across_requests(self):
+        self.user.groups.add(self.group)
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_roles(user), {MANAGER})
+            self.assertEqual(get_roles(user), {MANAGER})
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_roles(user), {MANAGER})
+
+    def test_membership_changes_invalidate(self):
+        self.assertEqual(self.roles(), frozenset())
+        self.user.groups.add(self.group)
+        self.assertEqual(self.roles(), {MANAGER})
+        self.user.groups.remove(self.group)
+        self.assertEqual(self.roles(), frozenset())
+        self.group.user_set.add(self.user)
+        self.assertEqual(self.roles(), {MANAGER})
+        self.group.user_set.clear()
+        self.assertEqual(self.roles(), frozenset())
+        self.user.groups.add(self.group)
+        self.assertEqual(self.roles(), {MANAGER})
+        self.user.groups.clear()
+        self.assertEqual(self.roles(), frozenset())
+
+    def test_group_rename_and_delete_invalidate(self):
+        self.user.groups.add(self.group)
+        self.assertEqual(self.roles(), {MANAGER})
+        self.group.name = DELIVERY_CREW
+        self.group.save()
+        self.assertEqual(self.roles(), {DELIVERY_CREW})
+        self.group.delete()
+        self.assertEqual(self.roles(), frozenset())
+
+class MenuCacheTests(ApiTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(User.objects.create_user('customer'))
+        self.menuitem = MenuItem.objects.create(title='Soup', price=4, featured=False, category=self.category)
+
+    def etag(self, path='/api/menu-items'):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def assertInvalidates(self, write):
+        etag = self.etag()
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        self.assertNotEqual(self.etag(), etag)
+
+    def test_hit_miss_and_not_modified(self):
+        # The sold-out set, the count and the page on a miss, nothing on a hit.
+        with self.assertNumQueries(3):
+            etag = self.etag()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.etag(), etag)
+        response = self.client.get('/api/menu-items', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertNotEqual(self.etag('/api/menu-items/%d' % self.menuitem.pk), etag)
+
+    def test_model_writes_invalidate(self):
+        def rename():
+            self.menuitem.title = 'Stew'
+            self.menuitem.save()
+        self.assertInvalidates(rename)
+        self.assertEqual(self.client.get('/api/menu-items').data['results'][0]['title'], 'Stew')
+        self.assertInvalidates(lambda: self.category.save())
+        self.assertInvalidates(lambda: MenuItem.objects.create(title='Bread', price=1, featured=False, category=self.category))
+        self.assertInvalidates(lambda: MenuItem.objects.filter(title='Bread').delete())
+
+    def test_bulk_writes_invalidate(self):
+        self.assertInvalidates(lambda: MenuItem.objects.filter(pk=self.menuitem.pk).update(price=5))
+        self.assertEqual(self.client.get('/api/menu-items').data['results'][0]['price'], '5.00')
+        self.assertInvalidates(lambda: MenuItem.objects.bulk_create([MenuItem(title='Bread', price=1, featured=False,
+                                                                              category=self.category)]))
+        self.menuitem.featured = True
+        self.assertInvalidates(lambda: MenuItem.objects.bulk_update([self.menuitem], ['featured']))
+        self.assertInvalidates(lambda: Category.objects.update(title='Plates'))
+
+    def test_stock_writes_keep_the_cache(self):
+        etag = self.etag()
+        with self.captureOnCommitCallbacks(execute=True):
+            MenuItem.objects.filter(pk=self.menuitem.pk).update(stock=3)
+        self.assertEqual(self.etag(), etag)
+
+class ExplainEndpointsTests(TestCase):
+    def test_no_full_scans_or_unused_indexes(self):
+        out = StringIO()
+        call_command('explain_endpoints', strict=True, stdout=out)
+        self.assertNotIn('FULL SCAN', out.getvalue())
+
+class FullTextSearchTests(ApiTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(User.objects.create_user('customer'))
+
+    def search(self, terms, **params):
+        # Writes here never commit, so the menu cache is emptied by hand.
+        cache.clear()
+        response = self.client.get('/api/menu-items', dict(params, search=terms, page_size=100, pagination='cursor'))
+        self.assertEqual(response.status_code, 200)
+        return [row['title'] for row in response.data['results']]
+
+    def test_index_follows_writes(self):
+        menuitem = MenuItem.objects.create(title='Greek salad', price=5, featured=False, category=self.category)
+        self.assertEqual(self.search('gre sal'), ['Greek salad'])
+        self.assertEqual(self.search('main'), ['Greek salad'])
+        menuitem.title = 'Caesar salad'
+        menuitem.save()
+        self.assertEqual(self.search('greek'), [])
+        self.assertEqual(self.search('caes'), ['Caesar salad'])
+        self.category.title = 'Starters'
+        self.category.save()
+        self.assertEqual(self.search('main'), [])
+        self.assertEqual(self.search('starter'), ['Caesar salad'])
+        menuitem.delete()
+        self.assertEqual(self.search('caesar'), [])
+
+    def test_best_match_first(self):
+        soups = Category.objects.create(slug='soups', title='Soups')
+        MenuItem.objects.create(title='Bread roll and soup of the day', price=2, featured=False, category=self.category)
+        MenuItem.objects.create(title='Soup', price=9, featured=False, category=soups)
+        self.assertEqual(self.search('soup'), ['Soup', 'Bread roll and soup of the day'])
+        self.assertEqual(self.search('soup', ordering='price'), ['Bread roll and soup of the day', 'Soup'])
+
+    @override_settings(SEARCH_RANKED_RESULTS=3)
+    def test_matches_beyond_the_ranked_ones_are_returned(self):
+        for n in range(8):
+            MenuItem.objects.create(title='Soup %d' % n, price=n + 1, featured=n % 2 == 0, category=self.category)
+        MenuItem.objects.create(title='Bread', price=1, featured=True, category=self.category)
+        cache.clear()
+        rows, path = [], '/api/menu-items?search=soup&page_size=2&pagination=cursor'
+        while path:
+            response = self.client.get(path)
+            rows += [row['title'] for row in response.data['results']]
+            path = response.data['next']
+        self.assertEqual(sorted(rows), ['Soup %d' % n for n in range(8)])
+        self.assertEqual(len(self.search('soup', featured=True)), 4)
+        self.assertEqual(self.client.get('/api/menu-items', {'search': 'soup'}).data['count'], 8)
+
+class OrderSummaryTests(ApiTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.manager = User.objects.create_user('manager')
+        self.manager.groups.add(Group.objects.create(name=MANAGER))
+        crewGroup = Group.objects.create(name=DELIVERY_CREW)
+        self.crews = [User.objects.create_user('crew%d' % n) for n in range(2)]
+        for crew in self.crews:
+            crew.groups.add(crewGroup)
+        self.customer = User.objects.create_user('customer')
+        self.menuitems = [MenuItem.objects.create(title='Dish %d' % n, price=n + 2, featured=False, category=self.category)
+                          for n in range(3)]
+
+    def projection(self):
+        # A rollup row counting nothing is the same as no row.
+        return (list(OrderSummary.objects.order_by('pk').values()),
+                list(DailyOrderSummary.objects.exclude(order_count=0).order_by('date')
+                     .values('date', 'order_count', 'delivered_count', 'item_count', 'revenue')),
+                list(CrewOrderSummary.objects.exclude(order_count=0).order_by('pk').values()))
+
+    def assertMatchesOrders(self):
+        # The incrementally kept projection equals a rebuild from Order and
+        # OrderItem, and rebuilding again changes nothing.
+        kept = self.projection()
+        rebuild_order_summaries()
+        self.assertEqual(self.projection(), kept)
+        rebuild_order_summaries(batch_size=1)
+        self.assertEqual(self.projection(), kept)
+
+    def place_order(self, count):
+        for menuitem in self.menuitems[:count]:
+            self.fill_cart(self.customer, menuitem, 2)
+        response = self.client_for(self.customer).post('/api/orders')
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def test_projection_follows_order_writes(self):
+        first, second = self.place_order(3), self.place_order(1)
+        self.assertMatchesOrders()
+        self.assertEqual(OrderSummary.objects.get(pk=first).item_count, 3)
+        manager = self.client_for(self.manager)
+        self.assertEqual(manager.patch('/api/orders/%d' % first, {'delivery_crew': self.crews[0].pk}).status_code, 200)
+        self.assertEqual(manager.patch('/api/orders/%d' % second, {'delivery_crew': self.crews[0].pk}).status_code, 200)
+        self.assertMatchesOrders()
+        self.assertEqual(self.client_for(self.crews[0]).patch('/api/orders/%d' % first, {'status': True}).status_code, 200)
+        self.assertMatchesOrders()
+        self.assertEqual(manager.patch('/api/orders/%d' % first, {'delivery_crew': self.crews[1].pk}).status_code, 200)
+        self.assertMatchesOrders()
+        self.assertEqual(CrewOrderSummary.objects.get(pk=self.crews[0].pk).order_count, 1)
+        self.assertEqual(manager.delete('/api/orders/%d' % first).status_code, 204)
+        self.assertMatchesOrders()
+        self.assertEqual(DailyOrderSummary.objects.get().order_count, 1)
+
+    def test_drifted_rollups_stop_at_zero(self):
+        orderId = self.place_order(2)
+        DailyOrderSummary.objects.update(order_count=0, item_count=0, revenue=0)
+        self.assertEqual(self.client_for(self.manager).delete('/api/orders/%d' % orderId).status_code, 204)
+        self.assertEqual(list(DailyOrderSummary.objects.values_list('order_count', 'item_count', 'revenue')),
+                         [(0, 0, Decimal('0.00'))])
+
+def throttle_rates(**rates):
+    return override_settings(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES=rates))
+
+class ThrottleTests(TestCase):
+    # Runs the real throttles, unlike ApiTestMixin.
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.now = 600.0
+        patcher = mock.patch.object(FixedWindowRateThrottle, 'timer', lambda throttle: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user('customer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.menuitem = MenuItem.objects.create(title='Soup', price=4, featured=False,
+                                                category=Category.objects.create(slug='mains', title='Mains'))
+
+    def statuses(self, count, method='get', path='/api/menu-items'):
+        return [getattr(self.client, method)(path).status_code for _ in range(count)]
+
+    @throttle_rates(user='3/minute', anon='1/minute', checkout='1/minute')
+    def test_user_scope_and_window_rollover(self):
+        self.assertEqual(self.statuses(3), [200] * 3)
+        self.now += 15
+        response = self.client.get('/api/menu-items')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '45')
+        self.now += 45
+        self.assertEqual(self.statuses(4), [200, 200, 200, 429])
+
+    @throttle_rates(user='100/minute', anon='1/minute', checkout='1/minute')
+    def test_checkout_scope(self):
+        statuses = []
+        for _ in range(2):
+            Cart.objects.create(user=self.user, menuitem=self.menuitem, quantity=1, unit_price=4, price=4)
+            statuses.append(self.client.post('/api/orders').status_code)
+        self.assertEqual(statuses, [201, 429])
+        # Only order creation is in the checkout scope.
+        self.assertEqual(self.statuses(3, path='/api/orders'), [200] * 3)
+
+    @throttle_rates(user='100/minute', anon='1/minute', checkout='1/minute')
+    def test_anon_scope(self):
+        view = mock.Mock(throttle_scope=None)
+        throttle = SharedAnonRateThrottle()
+        request = mock.Mock(user=mock.Mock(is_authenticated=False), META={'REMOTE_ADDR': '10.0.0.1'})
+        self.assertEqual([throttle.allow_request(request, view) for _ in range(2)], [True, False])
+        self.assertEqual(throttle.wait(), 60)
+
+    @throttle_rates(user='2/minute', anon='1/minute', checkout='1/minute')
+    def test_counter_expiring_between_add_and_incr(self):
+        counters = caches[settings.THROTTLE_CACHE_ALIAS]
+
+        def expire(key, *args, **kwargs):
+            counters.delete(key)
+            raise ValueError(key)
+        with mock.patch.object(counters, 'incr', side_effect=expire):
+            self.assertEqual(self.statuses(1), [200])
+        self.assertEqual(self.statuses(2), [200, 429])
+
+class TokenCacheTests(ApiTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        token_cache.clear()
+        self.user = User.objects.create_user('customer')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token %s' % self.token.key)
+
+    def status(self, path='/api/orders'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(path).status_code
+
+    def test_hits_and_misses(self):
+        before = token_cache.stats()
+        self.assertEqual(self.status(), 200)
+        # Only the (empty) order count: no token, user or group query.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.status(), 200)
+        stats = token_cache.stats()
+        self.assertEqual((stats['misses'] - before['misses'], stats['hits'] - before['hits']), (1, 1))
+
+    def test_logout_and_deactivation_apply_at_once(self):
+        self.assertEqual(self.status(), 200)
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.status(), 401)
+        self.user.is_active = True
+        self.user.save()
+        self.assertEqual(self.status(), 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        self.assertEqual(self.status(), 401)
+
+    def test_group_changes_apply_at_once(self):
+        self.assertEqual(self.status('/api/groups/manager/users'), 403)
+        group = Group.objects.create(name=MANAGER)
+        self.user.groups.add(group)
+        self.assertEqual(self.status('/api/groups/manager/users'), 200)
+        group.delete()
+        self.assertEqual(self.status('/api/groups/manager/users'), 403)
+
+    def test_invalidation_reaches_other_workers(self):
+        # Another worker deactivates the user through its own cache; this
+        # one only sees the shared version move.
+        self.assertEqual(self.status(), 200)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        TokenCache().invalidate_user(self.user.pk)
+        self.assertEqual(self.status(), 401)
+
+class CartBatchTests(ApiTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('customer')
+        self.client = self.client_for(self.user)
+        self.menuitems = [MenuItem.objects.create(title='Dish %d' % n, price=n + 1, featured=False, category=self.category)
+                          for n in range(4)]
+
+    def batch(self, *operations):
+        return self.client.post('/api/cart/menu-items/batch', [dict(zip(('op', 'menuitem', 'quantity'), operation))
+                                                             for operation in operations], format='json')
+
+    def cart(self):
+        return dict(Cart.objects.filter(user=self.user).values_list('menuitem_id', 'quantity'))
+
+    def test_operations_apply_in_order(self):
+        a, b, c, d = (menuitem.pk for menuitem in self.menuitems)
+        self.fill_cart(self.user, self.menuitems[3], 2)
+        response = self.batch(('add', a, 2), ('set', a, 5), ('add', b, 1), ('remove', b), ('add', c, 3), ('add', c, 1),
+                              ('remove', d))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cart(), {a: 5, c: 4})
+        self.assertEqual([(row['menuitem'], row['price']) for row in response.data], [(a, '5.00'), (c, '12.00')])
+
+    def test_invalid_batches_change_nothing(self):
+        self.fill_cart(self.user, self.menuitems[0], 1)
+        expensive = MenuItem.objects.create(title='Caviar', price=Decimal('9999.99'), featured=False, category=self.category)
+        for operations in ([('add', self.menuitems[1].pk, 1), ('add', 999, 1)],
+                           [('add', self.menuitems[1].pk, 20000), ('add', self.menuitems[1].pk, 20000)],
+                           [('add', expensive.pk, 2)],
+                           [('add', self.menuitems[1].pk, 1), ('set', self.menuitems[0].pk, 0)]):
+            self.assertEqual(self.batch(*operations).status_code, 400, operations)
+            self.assertEqual(self.cart(), {self.menuitems[0].pk: 1})
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        a, b, c, d = (menuitem.pk for menuitem in self.menuitems)
+        counts = []
+        for operations in ([('set', a, 2), ('remove', b), ('add', c, 1)],
+                           [('set', a, 3), ('add', a, 1), ('remove', b), ('add', c, 1), ('add', d, 1), ('add', c, 2),
+                            ('set', d, 4)]):
+            Cart.objects.all().delete()
+            self.fill_cart(self.user, self.menuitems[0])
+            self.fill_cart(self.user, self.menuitems[1])
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(self.batch(*operations).status_code, 200)
+            counts.append(len(captured))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_racing_insert_is_a_conflict(self):
+        with mock.patch.object(Cart.objects, 'bulk_create', side_effect=IntegrityError):
+            response = self.batch(('add', self.menuitems[0].pk, 1))
+        self.assertEqual(response.status_code, 409)
+
+class ReplicaRoutingTests(ApiTestMixin, TransactionTestCase):
+    # The replica is a second connection to the test database, so it sees
+    # whatever the primary commits.
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        connections.settings['replica'] = dict(connections['default'].settings_dict)
+        cls.addClassCleanup(cls.remove_replica)
+
+    @classmethod
+    def remove_replica(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+
+    def setUp(self):
+        super().setUp()
+        override = override_settings(DATABASE_REPLICAS=['replica'])
+        override.enable()
+        self.addCleanup(override.disable)
+        self.manager = User.objects.create_user('manager')
+        self.manager.groups.add(Group.objects.create(name=MANAGER))
+        self.menuitem = MenuItem.objects.create(title='Soup', price=4, featured=False, category=self.category)
+
+    def run_on(self, request):
+        # The menu item tables each connection touched while serving request.
+        with CaptureQueriesContext(connection) as primary, CaptureQueriesContext(connections['replica']) as replica:
+            response = request()
+        self.assertLess(response.status_code, 300, response.content)
+        return tuple(any('"LittleLemonAPI_menuitem"' in query['sql'] for query in queries)
+                     for queries in (primary, replica))
+
+    def test_reads_go_to_the_replica(self):
+        client = self.client_for(self.manager)
+        self.assertEqual(self.run_on(lambda: client.get('/api/menu-items')), (False, True))
+        self.assertEqual(self.run_on(lambda: client.get('/api/menu-items/%d' % self.menuitem.pk)), (False, True))
+
+    def test_writes_stay_on_the_primary(self):
+        client = self.client_for(self.manager)
+        self.assertEqual(self.run_on(lambda: client.patch('/api/menu-items/%d' % self.menuitem.pk, {'price': 5})),
+                         (True, False))
+        self.assertEqual(MenuItem.objects.get().price, 5)
+
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        # Each write bumps the menu version, so none of these reads is cached.
+        client = self.client_for(self.manager)
+        other = self.client_for(User.objects.create_user('customer'))
+        self.run_on(lambda: client.patch('/api/menu-items/%d' % self.menuitem.pk, {'price': 5}))
+        self.assertEqual(self.run_on(lambda: client.get('/api/menu-items')), (True, False))
+        self.assertEqual(self.run_on(lambda: other.get('/api/menu-items/%d' % self.menuitem.pk)), (False, True))
+        with override_settings(REPLICA_STICKY_SECONDS=0):
+            self.run_on(lambda: client.patch('/api/menu-items/%d' % self.menuitem.pk, {'price': 6}))
+        self.assertEqual(self.run_on(lambda: client.get('/api/menu-items')), (False, True))
+
+class DispatchTests(ApiTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.manager = User.objects.create_user('manager')
+        self.manager.groups.add(Group.objects.create(name=MANAGER))
+        crewGroup = Group.objects.create(name=DELIVERY_CREW)
+        self.crews = [User.objects.create_user('crew%d' % n) for n in range(2)]
+        for crew in self.crews:
+            crew.groups.add(crewGroup)
+        self.customer = User.objects.create_user('customer')
+        # The first crew member already has two open orders.
+        for day in (1, 2):
+            Order.objects.create(user=self.customer, delivery_crew=self.crews[0], total=4, date=date(2024, 1, day))
+        self.orders = [Order.objects.create(user=self.customer, total=4, date=date(2024, 1, day)) for day in (5, 3, 4, 6)]
+        rebuild_order_summaries()
+
+    def dispatch(self, user=None, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client_for(user or self.manager).post('/api/orders/dispatch', data, format='json')
+
+    def test_assigns_oldest_first_to_the_least_loaded(self):
+        first, second = self.crews
+        assignments, loads = dispatch_orders(limit=3)
+        # Oldest first: the second member catches up, then ties go to the lower id.
+        self.assertEqual(assignments, {second.pk: [self.orders[1].pk, self.orders[2].pk], first.pk: [self.orders[0].pk]})
+        self.assertEqual(loads, {first.pk: 3, second.pk: 2})
+        self.assertEqual(list(unassigned_orders()), [self.orders[3]])
+        self.assertEqual(get_crew_loads([first.pk, second.pk]), loads)
+
+    def test_view(self):
+        response = self.client_for(self.manager).get('/api/orders/dispatch')
+        self.assertEqual(response.json(), {'unassigned': 4, 'crews': [
+            {'delivery_crew': self.crews[0].pk, 'open_orders': 2}, {'delivery_crew': self.crews[1].pk, 'open_orders': 0}]})
+        response = self.dispatch(delivery_crew=[self.crews[1].pk])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['assigned']), 4)
+        self.assertEqual(response.json()['crews'], [{'delivery_crew': self.crews[1].pk, 'open_orders': 4}])
+        self.assertFalse(unassigned_orders().exists())
+        self.assertEqual(self.dispatch(delivery_crew=[self.customer.pk]).status_code, 400)
+
+    def test_guarded_update_conflicts_when_another_dispatch_got_there_first(self):
+        # A stale read of the queue, as a concurrent dispatcher would leave it.
+        Order.objects.filter(pk=self.orders[1].pk).update(delivery_crew=self.crews[0])
+        stale = Order.objects.filter(pk__in=[order.pk for order in self.orders]).order_by('date', 'pk')
+        with mock.patch('LittleLemonAPI.dispatch.unassigned_orders', return_value=stale):
+            response = self.dispatch()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Order.objects.filter(delivery_crew__isnull=True).count(), 3)
+
+    def test_manager_only(self):
+        self.assertEqual(APIClient().post('/api/orders/dispatch').status_code, 401)
+        for user in [self.customer, self.crews[0]]:
+            self.assertEqual(self.client_for(user).get('/api/orders/dispatch').status_code, 403)
+            self.assertEqual(self.dispatch(user).status_code, 403)
+        self.assertEqual(unassigned_orders().count(), 4)
+
+class OrderEventTests(ApiTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        token_cache.clear()
+        self.customer, self.crew, self.manager, self.other = [
+            User.objects.create_user(name) for name in ('customer', 'crew', 'manager', 'other')]
+        self.crew.groups.add(Group.objects.create(name=DELIVERY_CREW))
+        self.manager.groups.add(Group.objects.create(name=MANAGER))
+        self.fill_cart(self.customer, MenuItem.objects.create(title='Soup', price=4, featured=False, category=self.category))
+        self.headers = {'Authorization': 'Token %s' % Token.objects.create(user=self.customer).key}
+
+    async def received(self, subscriptions):
+        # Lets the pushed events land, then drains each queue.
+        await asyncio.sleep(0)
+        events = []
+        for subscription in subscriptions:
+            events.append([])
+            while not subscription.queue.empty():
+                events[-1].append(subscription.queue.get_nowait()['event'])
+        return events
+
+    async def test_hub_fans_out_once_and_drops_the_oldest(self):
+        hub = EventHub()
+        subscription = hub.subscribe([user_channel(1), MANAGERS], maxsize=2)
+        hub.deliver([user_channel(2)], {'event': 'none'})
+        for n in range(3):
+            hub.deliver([MANAGERS, user_channel(1)], {'event': n})
+        self.assertEqual(await self.received([subscription]), [[1, 2]])
+        subscription.close()
+        self.assertEqual(hub._subscribers, {})
+
+    async def test_published_on_commit_to_each_recipient(self):
+        users = [self.customer, self.crew, self.manager, self.other]
+        channels = await sync_to_async(lambda: [channels_for(user) for user in users])()
+        self.assertEqual(channels[2], [user_channel(self.manager.pk), MANAGERS])
+        subscriptions = [hub.subscribe(userChannels) for userChannels in channels]
+        for subscription in subscriptions:
+            self.addCleanup(subscription.close)
+
+        def checkout():
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.assertEqual(self.client_for(self.customer).post('/api/orders').status_code, 201)
+            return callbacks
+        callbacks = await sync_to_async(checkout)()
+        self.assertEqual(await self.received(subscriptions), [[], [], [], []])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(await self.received(subscriptions), [[CREATED], [], [CREATED], []])
+
+        def dispatch():
+            with self.captureOnCommitCallbacks(execute=True):
+                dispatch_orders()
+        await sync_to_async(dispatch)()
+        self.assertEqual(await self.received(subscriptions), [[ASSIGNED], [ASSIGNED], [ASSIGNED], []])
+
+    @override_settings(ORDER_EVENTS_KEEPALIVE=0.05, ORDER_EVENTS_MAX_AGE=0.2)
+    async def test_server_sent_event_framing(self):
+        self.assertEqual((await AsyncClient().get('/api/orders/events')).status_code, 401)
+        response = await AsyncClient().get('/api/orders/events', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        event = {'event': CREATED, 'order': {'id': 1}}
+        hub.deliver([user_channel(self.customer.pk)], event)
+        chunks = [chunk.decode() async for chunk in response.streaming_content]
+        self.assertEqual(chunks[:2], ['retry: 3000\n\n', 'event: order.created\ndata: {"event":"order.created","order":{"id":1}}\n\n'])
+        self.assertTrue(chunks[2:])
+        self.assertEqual(set(chunks[2:]), {': keepalive\n\n'})
+        self.assertNotIn(user_channel(self.customer.pk), hub._subscribers)
+
+class MenuImportTests(ApiTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.manager = User.objects.create_user('manager')
+        self.manager.groups.add(Group.objects.create(name=MANAGER))
+        self.client = self.client_for(self.manager)
+
+    def import_rows(self, body, contentType='text/csv'):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/menu-items/import', body.encode(), content_type=contentType)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def export(self, fmt):
+        response = self.client.get('/api/menu-items/export', {'format': fmt})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_round_trip(self):
+        MenuItem.objects.create(title='Soup, hot', price=Decimal('4.50'), featured=True, category=self.category)
+        MenuItem.objects.create(title='Crème brûlée', price=6, featured=False,
+                                category=Category.objects.create(slug='desserts', title='Desserts'))
+        for fmt, contentType in [('csv', 'text/csv'), ('jsonl', 'application/x-ndjson')]:
+            exported = self.export(fmt)
+            MenuItem.objects.all().delete()
+            Category.objects.all().delete()
+            report = self.import_rows(exported, contentType)
+            self.assertEqual((report['rows'], report['created'], report['categories_created'], report['errors']),
+                             (2, 2, 2, []), fmt)
+            self.assertEqual(self.export(fmt), exported)
+
+    def test_reports_errors_by_line(self):
+        report = import_menu(StringIO('title,price,featured,category\n'
+                                      'Soup,4,true,mains\n'
+                                      'Stew,cheap,false,mains\n'
+                                      ',3,false,mains\n'
+                                      'Pie,5,false,desserts\n'), 'csv')
+        self.assertEqual([(error['line'], sorted(error['errors'])) for error in report['errors']],
+                         [(3, ['price']), (4, ['title']), (5, ['category'])])
+        self.assertEqual((report['rows'], report['created']), (4, 1))
+        report = import_menu(['{"title": "Pie", "price": "5", "category": "mains"}\n', '{not json\n', '\n'], 'jsonl')
+        self.assertEqual(report['errors'], [{'line': 2, 'errors': {'non_field_errors': ['Invalid JSON.']}}])
+        self.assertEqual(sorted(MenuItem.objects.values_list('title', flat=True)), ['Pie', 'Soup'])
+
+    def test_upserts_in_batches(self):
+        def rows(count, price):
+            return ['title,price,featured,category,category_title'] + [
+                'Item %d,%s,false,mains,Mains' % (n, price) for n in range(count)]
+        with CaptureQueriesContext(connection) as small:
+            import_menu(rows(4, 4), 'csv', batch_size=100)
+        MenuItem.objects.all().delete()
+        with CaptureQueriesContext(connection) as large:
+            import_menu(rows(12, 4), 'csv', batch_size=100)
+        self.assertEqual(len(large), len(small))
+        report = import_menu(rows(12, 4)[:7] + rows(12, 5)[7:], 'csv', batch_size=5)
+        self.assertEqual((report['created'], report['updated'], report['unchanged']), (0, 6, 6))
+        self.assertEqual(MenuItem.objects.filter(price=5).count(), 6)
+
+    def test_bumps_the_menu_version_only_on_change(self):
+        body = 'title,price,featured,category\nSoup,4,false,mains\n'
+        version = get_menu_version()[0]
+        self.import_rows(body)
+        self.assertNotEqual(get_menu_version()[0], version)
+        version = get_menu_version()[0]
+        self.assertEqual(self.import_rows(body)['unchanged'], 1)
+        self.assertEqual(get_menu_version()[0], version)
+
+    def test_import_rejects_other_media_types_and_non_managers(self):
+        self.assertEqual(self.client.post('/api/menu-items/import', b'{}', content_type='application/json').status_code, 415)
+        response = self.client_for(User.objects.create_user('customer')).post(
+            '/api/menu-items/import', b'', content_type='text/csv')
+        self.assertEqual(response.status_code, 403)
+
+class OrderExportTests(ApiTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.manager = User.objects.create_user('manager')
+        self.manager.groups.add(Group.objects.create(name=MANAGER))
+        self.customer = User.objects.create_user('customer')
+        self.crew = User.objects.create_user('crew')
+        soup = MenuItem.objects.create(title='Soup', price=4, featured=False, category=self.category)
+        self.pie = pie = MenuItem.objects.create(title='Pie, "apple"', price=5, featured=False, category=self.category)
+        self.orders = [Order.objects.create(user=self.customer, delivery_crew=self.crew if day % 2 else None,
+                                            status=day == 1, total=9, date=date(2024, 1, day)) for day in range(1, 6)]
+        for order in self.orders[:4]:
+            OrderItem.objects.create(order=order, menuitem=soup, quantity=1, unit_price=4, price=4)
+            OrderItem.objects.create(order=order, menuitem=pie, quantity=1, unit_price=5, price=5)
+
+    def export(self, fmt='csv', **params):
+        response = self.client_for(self.manager).get('/api/orders/export', dict(params, format=fmt))
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def exported_ids(self, **params):
+        return [json.loads(line)['id'] for line in self.export('jsonl', **params).splitlines()]
+
+    def test_iter_orders_loads_items_per_chunk(self):
+        with self.assertNumQueries(4):
+            rows = list(iter_orders(filter_orders(), chunk_size=2))
+        self.assertEqual([order[0] for order, _ in rows], [order.pk for order in self.orders])
+        self.assertEqual([len(items) for _, items in rows], [2, 2, 2, 2, 0])
+        self.assertEqual(rows[0][1][1][1:3], ('Pie, "apple"', 1))
+
+    def test_csv(self):
+        lines = self.export().splitlines()
+        self.assertEqual(lines[0], 'id,date,user,delivery_crew,status,total,item_menuitem,item_title,item_quantity,'
+                                   'item_unit_price,item_price')
+        self.assertEqual(len(lines), 1 + 4 * 2 + 1)
+        first, last = self.orders[0], self.orders[-1]
+        self.assertEqual(lines[2], '%d,2024-01-01,%d,%d,true,9.00,%d,"Pie, ""apple""",1,5.00,5.00'
+                         % (first.pk, self.customer.pk, self.crew.pk, self.pie.pk))
+        self.assertEqual(lines[-1], '%d,2024-01-05,%d,%d,false,9.00,,,,,' % (last.pk, self.customer.pk, self.crew.pk))
+
+    def test_json_lines(self):
+        orders = [json.loads(line) for line in self.export('jsonl').splitlines()]
+        self.assertEqual(len(orders), 5)
+        self.assertEqual({key: orders[1][key] for key in ('date', 'delivery_crew', 'status', 'total')},
+                         {'date': '2024-01-02', 'delivery_crew': None, 'status': False, 'total': '9.00'})
+        self.assertEqual([item['title'] for item in orders[1]['items']], ['Soup', 'Pie, "apple"'])
+        self.assertEqual(orders[-1]['items'], [])
+
+    def test_filters_and_resume(self):
+        ids = [order.pk for order in self.orders]
+        self.assertEqual(self.exported_ids(status='true'), ids[:1])
+        self.assertEqual(self.exported_ids(status='false', delivery_crew=self.crew.pk), [ids[2], ids[4]])
+        self.assertEqual(self.exported_ids(date_from='2024-01-02', date_to='2024-01-03'), ids[1:3])
+        self.assertEqual(self.exported_ids(after=ids[1]), ids[2:])
+        full = self.export('csv')
+        resumed = self.export('csv', after=ids[1])
+        self.assertTrue(full.endswith(resumed.split('\n', 1)[1]))
+
+    def test_rejects_bad_filters_and_non_managers(self):
+        response = self.client_for(self.manager).get('/api/orders/export',
+                                                     {'format': 'csv', 'date_from': '2024-01-03', 'date_to': '2024-01-02'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client_for(self.customer).get('/api/orders/export').status_code, 403)
+
+class IdempotencyTests(ApiTestMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('customer')
+        self.client = self.client_for(self.user)
+        self.menuitem = MenuItem.objects.create(title='Soup', price=4, featured=False, category=self.category)
+
+    def add_to_cart(self, key, quantity=1):
+        return self.client.post('/api/cart/menu-items', {'menuitem': self.menuitem.pk, 'quantity': quantity},
+                                format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_claim_and_replay(self):
+        first = self.add_to_cart('a')
+        self.assertEqual(first.status_code, 201)
+        replay = self.add_to_cart('a')
+        self.assertEqual((replay.status_code, replay.content, replay['Idempotent-Replayed']), (201, first.content, 'true'))
+        self.assertEqual(Cart.objects.get().quantity, 1)
+        self.assertEqual(self.add_to_cart('a', 2).status_code, 422)
+        # Keys are per user.
+        other = self.client_for(User.objects.create_user('other'))
+        self.assertNotIn('Idempotent-Replayed', other.post('/api/cart/menu-items', {'menuitem': self.menuitem.pk},
+                                                            format='json', HTTP_IDEMPOTENCY_KEY='a'))
+
+    def test_duplicate_of_a_running_request_conflicts_at_once(self):
+        claim_key(self.user, 'a', 'fingerprint')
+        with mock.patch('time.sleep') as sleep, self.assertRaises(IdempotencyKeyInUse):
+            claim_key(self.user, 'a', 'fingerprint')
+        self.assertFalse(sleep.called)
+        with self.assertRaises(IdempotencyKeyReused):
+            claim_key(self.user, 'a', 'other')
+
+    def test_retryable_failures_release_the_key(self):
+        for code in (500, 503, 409, 429):
+            claim, _ = claim_key(self.user, 'a', 'fingerprint')
+            store_response(claim, HttpResponse(status=code))
+            self.assertFalse(IdempotencyKey.objects.exists(), code)
+        claim, _ = claim_key(self.user, 'a', 'fingerprint')
+        store_response(claim, HttpResponse(b'{}', status=400, content_type='application/json'))
+        _, record = claim_key(self.user, 'a', 'fingerprint')
+        self.assertEqual((record.status_code, bytes(record.content)), (400, b'{}'))
+
+    def test_abandoned_and_expired_keys_are_taken_over(self):
+        claim, _ = claim_key(self.user, 'a', 'fingerprint')
+        timeout = timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT + 1)
+        IdempotencyKey.objects.filter(pk=claim.pk).update(created=claim.created - timeout)
+        takeover, record = claim_key(self.user, 'a', 'other')
+        self.assertIsNone(record)
+        self.assertNotEqual(takeover.pk, claim.pk)
+        store_response(takeover, HttpResponse(status=201))
+        IdempotencyKey.objects.update(expires=timezone.now())
+        self.assertIsNone(claim_key(self.user, 'a', 'fingerprint')[1])
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    def test_parallel_duplicate_checkouts_create_one_order(self):
+        self.fill_cart(self.user, self.menuitem, 2)
+        statuses = self.post_in_parallel([self.user] * 5, '/api/orders', HTTP_IDEMPOTENCY_KEY='checkout')
+        self.assertIn(201, statuses)
+        self.assertTrue(set(statuses) <= {201, 409}, statuses)
+        self.assertEqual(Order.objects.count(), 1)
+        replay = self.client.post('/api/orders', HTTP_IDEMPOTENCY_KEY='checkout')
+        self.assertEqual((replay.status_code, replay.json()['id']), (201, Order.objects.get().pk))
+
+@task
+def failing_task(message):
+    raise RuntimeError(message)
+
+class BackgroundJobTests(ApiTestMixin, TransactionTestCase):
+    def test_enqueue_only_takes_registered_tasks(self):
+        job = enqueue(failing_task, 'boom', delay=60, max_attempts=2)
+        self.assertEqual((job.name, job.args, job.kwargs, job.max_attempts, job.status),
+                         ('LittleLemonAPI.tests.failing_task', ['boom'], {}, 2, Job.QUEUED))
+        self.assertAlmostEqual((job.run_at - job.created).total_seconds(), 60)
+        self.assertEqual(enqueue(send_order_receipt, orderId=1).max_attempts, settings.TASK_MAX_ATTEMPTS)
+        with self.assertRaisesMessage(ValueError, 'is not a registered task'):
+            enqueue(release_crew_orders, 1)
+
+    def test_claims_are_exclusive(self):
+        for n in range(12):
+            enqueue(send_order_receipt, n)
+        enqueue(send_order_receipt, 99, delay=60)
+        barrier = threading.Barrier(4)
+        claimed = []
+
+        def claim():
+            try:
+                barrier.wait()
+                claimed.append(claim_jobs(5))
+            finally:
+                connection.close()
+        threads = [threading.Thread(target=claim) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        ids = [jobId for jobs in claimed for jobId in jobs]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(sorted(ids), list(Job.objects.filter(status=Job.RUNNING).values_list('pk', flat=True)))
+        self.assertEqual(len(ids) + len(claim_jobs(20)), 12)
+        self.assertEqual(set(Job.objects.filter(status=Job.RUNNING).values_list('attempts', flat=True)), {1})
+
+    def test_failures_retry_with_backoff_then_fail(self):
+        job = enqueue(failing_task, 'boom', max_attempts=2)
+        self.assertEqual(claim_jobs(10), [job.pk])
+        started = timezone.now()
+        self.assertFalse(run_job(job.pk))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.claim), (Job.QUEUED, 1, ''))
+        self.assertIn('RuntimeError: boom', job.last_error)
+        self.assertGreaterEqual(job.run_at, started + timedelta(seconds=settings.TASK_RETRY_BACKOFF))
+        self.assertEqual(claim_jobs(10), [])
+        Job.objects.update(run_at=started)
+        self.assertEqual(claim_jobs(10), [job.pk])
+        self.assertFalse(run_job(job.pk))
+        self.assertEqual(Job.objects.get().status, Job.FAILED)
+        receipt = enqueue(send_order_receipt, 0)
+        # Unclaimed jobs are not run; successful ones are deleted.
+        self.assertFalse(run_job(receipt.pk))
+        claim_jobs(10)
+        self.assertTrue(run_job(receipt.pk))
+        self.assertEqual(list(Job.objects.values_list('status', flat=True)), [Job.FAILED])
+
+    def test_backoff_grows_to_its_cap(self):
+        base, cap = settings.TASK_RETRY_BACKOFF, settings.TASK_RETRY_BACKOFF_MAX
+        with mock.patch('LittleLemonAPI.background.random.uniform', side_effect=lambda low, high: high):
+            self.assertEqual([get_backoff(attempts) for attempts in (1, 2, 3)], [base, base * 2, base * 4])
+            self.assertEqual(get_backoff(30), cap)
+        self.assertTrue(all(base <= get_backoff(4) <= base * 8 for _ in range(20)))
+
+    def test_stale_jobs_are_requeued_or_failed(self):
+        jobs = [enqueue(send_order_receipt, n, max_attempts=2) for n in range(3)]
+        claim_jobs(10)
+        stale = timezone.now() - timedelta(seconds=settings.TASK_TIMEOUT + 1)
+        Job.objects.filter(pk__in=[jobs[0].pk, jobs[1].pk]).update(locked_at=stale)
+        Job.objects.filter(pk=jobs[1].pk).update(attempts=2)
+        self.assertEqual(requeue_stale_jobs(), 1)
+        self.assertEqual([Job.objects.get(pk=job.pk).status for job in jobs], [Job.QUEUED, Job.FAILED, Job.RUNNING])
+
+    def test_worker_survives_errors_around_jobs(self):
+        failing = enqueue(send_order_receipt, 1)
+        enqueue(send_order_receipt, 2)
+
+        def run(jobId):
+            if jobId == failing.pk:
+                raise RuntimeError('connection lost')
+            return run_job(jobId)
+        out, err = StringIO(), StringIO()
+        with mock.patch('LittleLemonAPI.management.commands.run_worker.run_job', side_effect=run):
+            call_command('run_worker', '--burst', '--concurrency', '2', '--poll', '0.01', stdout=out, stderr=err)
+        self.assertIn('Ran 2 jobs, 1 failed or retrying.', out.getvalue())
+        self.assertIn("RuntimeError('connection lost')", err.getvalue())
+        self.assertEqual(list(Job.objects.values_list('pk', 'status')), [(failing.pk, Job.RUNNING)])
+
+class MembershipJobTests(ApiTestMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.manager = User.objects.create_user('manager')
+        self.manager.groups.add(Group.objects.create(name=MANAGER))
+        self.crew = User.objects.create_user('crew', 'crew@example.com')
+        self.client = self.client_for(self.manager)
+
+    def jobs(self):
+        return list(Job.objects.order_by('pk').values_list('args', flat=True))
+
+    def test_only_actual_changes_queue_a_job(self):
+        for _ in range(2):
+            self.assertEqual(self.client.post('/api/groups/delivery-crew/users', {'username': 'crew'}).status_code, 201)
+        self.assertEqual(self.jobs(), [[self.crew.pk, DELIVERY_CREW, True]])
+        for _ in range(2):
+            self.assertEqual(self.client.delete('/api/groups/delivery-crew/users/%d' % self.crew.pk).status_code, 200)
+        self.assertEqual(self.jobs(), [[self.crew.pk, DELIVERY_CREW, True], [self.crew.pk, DELIVERY_CREW, False]])
+
+    def test_membership_changed(self):
+        customer = User.objects.create_user('customer')
+        orders = [Order.objects.create(user=customer, delivery_crew=self.crew, status=delivered, total=4,
+                                       date=date(2024, 1, 1)) for delivered in (False, True, False)]
+        rebuild_order_summaries()
+        # Stale job: the crew member was added back since.
+        self.crew.groups.add(Group.objects.create(name=DELIVERY_CREW))
+        membership_changed(self.crew.pk, DELIVERY_CREW, False)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Order.objects.filter(delivery_crew=self.crew).count(), 3)
+        self.crew.groups.clear()
+        membership_changed(self.crew.pk, DELIVERY_CREW, False)
+        self.assertEqual([message.to for message in mail.outbox], [['crew@example.com']])
+        self.assertEqual(mail.outbox[0].body, 'You were removed from the %s group.' % DELIVERY_CREW)
+        self.assertEqual([Order.objects.get(pk=order.pk).delivery_crew_id for order in orders], [None, self.crew.pk, None])
+        self.assertEqual(get_crew_loads([self.crew.pk]), {self.crew.pk: 0})
+        self.assertEqual(list(unassigned_orders()), [orders[0], orders[2]])
+
+class PerformanceTests(ApiTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+        self.addCleanup(registry.reset)
+        self.manager = User.objects.create_user('manager')
+        self.manager.groups.add(Group.objects.create(name=MANAGER))
+        self.customer = User.objects.create_user('customer')
+        Order.objects.create(user=self.customer, total=4, date=date(2024, 1, 1))
+
+    @override_settings(PERF_SAMPLE_RATE=1)
+    def test_counts_queries_through_the_execute_wrapper(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client_for(self.customer).get('/api/orders').status_code, 200)
+        route = registry.snapshot()['orders-list']
+        self.assertEqual(route['requests'], 1)
+        self.assertGreater(len(queries), 0)
+        self.assertEqual(route['queries_per_request'], len(queries))
+        self.assertEqual(route['duplicate_queries'], 0)
+        self.assertEqual(set(route['phases_mean_ms']),
+                         {'authentication', 'permissions', 'throttling', 'queryset', 'serialization'})
+
+    @override_settings(PERF_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_recorded(self):
+        self.assertEqual(self.client_for(self.customer).get('/api/orders').status_code, 200)
+        self.assertEqual(registry.snapshot(), {})
+
+    def test_repeated_statements_count_as_duplicates(self):
+        profile = RequestProfile()
+        execute = mock.Mock()
+        for params in [(1,), (1,), (1,), (2,)]:
+            profile(execute, 'SELECT %s', params, False, {})
+        self.assertEqual((profile.queries, profile.duplicates()), (4, [('SELECT %s', 3)]))
+        registry.record('orders-list', profile, 0.01)
+        self.assertEqual(registry.snapshot()['orders-list']['duplicate_queries'], 2)
+        self.assertEqual(registry.snapshot()['orders-list']['last_duplicate_sql'], 'SELECT %s')
+
+    @override_settings(PERF_SAMPLE_RATE=1)
+    def test_prometheus_text_format(self):
+        self.client_for(self.customer).get('/api/orders')
+        response = self.client_for(self.manager).get('/api/perf/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        lines = response.content.decode().splitlines()
+        self.assertIn('# TYPE littlelemon_requests_total counter', lines)
+        self.assertIn('littlelemon_requests_total{route="orders-list"} 1', lines)
+        self.assertIn('# TYPE littlelemon_token_cache_hits_total counter', lines)
+        for line in lines:
+            if not line.startswith('#'):
+                self.assertRegex(line, r'^littlelemon_\w+(\{route="[\w-]+"(,phase="\w+")?\})? [0-9.e-]+$')
+
+    def test_manager_only(self):
+        for path in ['/api/perf/stats', '/api/perf/metrics']:
+            self.assertEqual(APIClient().get(path).status_code, 401)
+            self.assertEqual(self.client_for(self.customer).get(path).status_code, 403)
+            self.assertEqual(self.client_for(self.manager).get(path).status_code, 200)
+        stats = self.client_for(self.manager).get('/api/perf/stats').json()
+        self.assertEqual(set(stats), {'sample_rate', 'routes', 'token_cache'})
+
+class BenchmarkSmokeTests(TestCase):
+    # The command normally seeds a throwaway database of its own; here it runs
+    # in the test database.
+    def setUp(self):
+        super().setUp()
+        for method in ('create_test_db', 'destroy_test_db'):
+            patcher = mock.patch.object(connection.creation, method)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def benchmark(self, *args):
+        out, self.err = StringIO(), StringIO()
+        call_command('run_benchmarks', '--orders', '30', '--menu-items', '12', '--customers', '4', '--crews', '2',
+                     '--iterations', '2', *args, stdout=out, stderr=self.err)
+        return out.getvalue(), self.err.getvalue()
+
+    def test_report_and_baseline(self):
+        with TemporaryDirectory() as tmp:
+            baseline = os.path.join(tmp, 'baseline.json')
+            self.benchmark('--output', baseline)
+            with open(baseline) as fh:
+                report = json.load(fh)
+            self.assertEqual(report['meta']['orders'], 30)
+            results = report['results']
+            self.assertEqual(results['menuitem-list[customer]']['status'], 200)
+            self.assertGreater(results['orders-export[manager]']['bytes'], 0)
+            self.assertNotIn('orders-events[manager]', results)
+
+            out, err = self.benchmark('--baseline', baseline, '--tolerance', '1000')
+            self.assertEqual(json.loads(out)['results'].keys(), results.keys())
+            self.assertEqual(err, '')
+
+            results['orders-list[customer]']['queries'] = 0
+            results['gone[manager]'] = results['orders-list[manager]']
+            with open(baseline, 'w') as fh:
+                json.dump(report, fh)
+            with self.assertRaisesMessage(CommandError, '2 benchmark regressions'):
+                self.benchmark('--baseline', baseline, '--tolerance', '1000')
+            lines = self.err.getvalue().splitlines()
+            self.assertEqual(lines[0], 'gone[manager]: missing from this run')
+            self.assertRegex(lines[1], r'^orders-list\[customer\]: queries 0 -> [1-9]')
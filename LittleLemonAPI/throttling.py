@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle, UserRateThrottle, AnonRateThrottle, ScopedRateThrottle
+
+class FixedWindowRateThrottle(SimpleRateThrottle):
+    # Counts requests per fixed window with a single atomic increment in the
+    # THROTTLE_CACHE_ALIAS cache, instead of rewriting a timestamp list. Point
+    # that alias at Redis/Memcached so every worker shares the same counters;
+    # the local-memory default is the stand-in for tests and single processes.
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')]
+
+    @property
+    def THROTTLE_RATES(self):
+        # Looked up per request so override_settings (tests, benchmarks) applies.
+        return api_settings.DEFAULT_THROTTLE_RATES
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        self.window_end = (window + 1) * self.duration
+        key = '%s:%d' % (self.key, window)
+        self.cache.add(key, 0, self.duration + 1)
+        try:
+            count = self.cache.incr(key)
+        except ValueError:
+            # Expired between add() and incr(); start the window again.
+            self.cache.add(key, 1, self.duration + 1)
+            count = 1
+        return count <= self.num_requests
+
+    def wait(self):
+        return max(self.window_end - self.now, 0)
+
+class SharedUserRateThrottle(UserRateThrottle, FixedWindowRateThrottle):
+    pass
+
+class SharedAnonRateThrottle(AnonRateThrottle, FixedWindowRateThrottle):
+    pass
+
+class SharedScopedRateThrottle(ScopedRateThrottle, FixedWindowRateThrottle):
+    pass
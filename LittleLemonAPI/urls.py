@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import SimpleRouter
-from . import views
+from . import async_views, views
 
 router = SimpleRouter(trailing_slash=False)
 router.register('menu-items/category', views.CategoryView, 'category')
@@ -8,8 +8,29 @@ router.register('menu-items', views.MenuItemsView)
 router.register('groups/manager/users', views.ManagersView, 'manager')
 router.register('groups/delivery-crew/users', views.DeliveryCrewsView, 'delivery-crew')
 router.register('orders', views.OrderView, 'orders')
+router.register('order-summaries/daily', views.DailyOrderSummaryView, 'order-summary-daily')
+router.register('order-summaries/crew', views.CrewOrderSummaryView, 'order-summary-crew')
+router.register('order-summaries', views.OrderSummaryView, 'order-summary')
 
 urlpatterns = [
+  # Ahead of the router so these are not read as menu item or order ids.
+  path('menu-items/import', views.MenuImportView.as_view(), name='menuitem-import'),
+  path('menu-items/export', views.MenuExportView.as_view(), name='menuitem-export'),
+  path('orders/export', views.OrderExportView.as_view(), name='orders-export'),
+  path('orders/dispatch', views.DispatchView.as_view(), name='orders-dispatch'),
+  path('orders/events', async_views.OrderEventStreamView.as_view(), name='orders-events'),
   path('', include(router.urls)),
-  path('cart/menu-items', views.CartView.as_view(), name='cart')
+  path('cart/menu-items', views.CartView.as_view(), name='cart'),
+  path('cart/menu-items/batch', views.CartBatchView.as_view(), name='cart-batch'),
+  path('async/menu-items', async_views.AsyncReadView.as_view(view_class=views.MenuItemsView), name='async-menuitem-list'),
+  path('async/menu-items/<str:pk>', async_views.AsyncReadView.as_view(view_class=views.MenuItemsView, action='retrieve'), name='async-menuitem-detail'),
+  path('async/orders', async_views.AsyncReadView.as_view(view_class=views.OrderView), name='async-orders-list'),
+  path('async/orders/<str:pk>', async_views.AsyncOrderDetailView.as_view(), name='async-orders-detail'),
+  path('async/cart/menu-items', async_views.AsyncReadView.as_view(view_class=views.CartView), name='async-cart'),
+  path('analytics/revenue', views.SalesAnalyticsView.as_view(report='revenue'), name='analytics-revenue'),
+  path('analytics/top-items', views.SalesAnalyticsView.as_view(report='top-items'), name='analytics-top-items'),
+  path('analytics/categories', views.SalesAnalyticsView.as_view(report='categories'), name='analytics-categories'),
+  path('analytics/crews', views.SalesAnalyticsView.as_view(report='crews'), name='analytics-crews'),
+  path('perf/stats', views.PerformanceStatsView.as_view(), name='perf-stats'),
+  path('perf/metrics', views.PerformanceMetricsView.as_view(), name='perf-metrics'),
 ]
\ No newline at end of file
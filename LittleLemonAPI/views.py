@@ -1,22 +1,72 @@
+import codecs
+import json
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 from rest_framework import viewsets, generics, mixins
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
 from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError, UnsupportedMediaType
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.response import Response
-from .models import MenuItem, Cart, Order, OrderItem, Category
+from rest_framework.views import APIView
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.db import transaction
+from .models import MenuItem, Cart, Order, OrderItem, Category, OrderSummary, DailyOrderSummary, CrewOrderSummary
 from .serializers import *
 from .permissions import IsManager, IsDeliveryCrew
-from datetime import date
+from .caching import MenuCacheMixin
+from .analytics import category_sales, crew_deliveries, daily_revenue, top_menu_items
+from .authentication import token_cache
+from .background import enqueue
+from .carts import apply_cart_operations
+from .checkout import checkout
+from .database import ReplicaReadMixin
+from .dispatch import dispatch_orders, get_crew_ids, get_crew_loads, unassigned_orders
+from .events import format_error, order_changed
+from .fastserializers import FastListMixin
+from .idempotency import IdempotentMixin
+from .instrumentation import InstrumentedViewMixin, registry
+from .menu_io import CSV, JSONL, MEDIA_TYPES, export_menu, import_menu
+from .order_export import export_orders, filter_orders
+from .pagination import KeysetPagination, OptInKeysetPagination
+from .roles import is_manager, is_delivery_crew, MANAGER, DELIVERY_CREW
+from .stock import SoldOutMixin, get_stock, set_stock
+from .summaries import sync_order_summary, remove_order_summary
+from .tasks import membership_changed
+from .throttling import SharedUserRateThrottle, SharedAnonRateThrottle, SharedScopedRateThrottle
 
-class MenuItemsView(viewsets.ModelViewSet):
+class RelatedLoadingMixin:
+    # Relations a view's serializer reads, loaded up front so a page costs a
+    # fixed number of queries however many rows it holds.
+    select_related_fields = ()
+    prefetch_related_fields = ()
+
+    def get_select_related_fields(self):
+        return self.select_related_fields
+
+    def get_prefetch_related_fields(self):
+        return self.prefetch_related_fields
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.get_select_related_fields():
+            queryset = queryset.select_related(*self.get_select_related_fields())
+        if self.get_prefetch_related_fields():
+            queryset = queryset.prefetch_related(*self.get_prefetch_related_fields())
+        return queryset
+
+class MenuItemsView(InstrumentedViewMixin, ReplicaReadMixin, SoldOutMixin, MenuCacheMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = MenuItem.objects.all()
     serializer_class = MenuItemSerializer
     filterset_fields = ['featured', 'category']
     ordering_fields = ['featured', 'price']
+    ordering = ['price']
     search_fields = ['title', 'category__title']
-    throttle_classes = [UserRateThrottle, AnonRateThrottle]
+    fulltext_search = True
+    throttle_classes = [SharedUserRateThrottle, SharedAnonRateThrottle]
+    pagination_class = OptInKeysetPagination
 
     def get_permissions(self):
         permission_classes = [IsAuthenticated]
@@ -25,18 +75,70 @@ class MenuItemsView(viewsets.ModelViewSet):
             permission_classes.append(IsManager)
 
         return [permission() for permission in permission_classes]
+
+    @action(detail=True, methods=['get', 'put'])
+    def stock(self, request, *args, **kwargs):
+        menuitem = self.get_object()
+        if request.method == 'PUT':
+            serializer = StockSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            set_stock(menuitem, serializer.validated_data['stock'], serializer.validated_data['shards'])
+        stock = get_stock(menuitem)
+        return Response({'menuitem': menuitem.pk, 'stock': stock, 'shards': menuitem.stock_shards, 'sold_out': stock == 0})
+
+class MenuExportRenderer(BaseRenderer):
+    # Exports stream past the renderer; it only renders errors.
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data).encode()
+
+class CSVRenderer(MenuExportRenderer):
+    media_type = 'text/csv'
+    format = CSV
+
+class JSONLinesRenderer(MenuExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = JSONL
+
+class MenuImportView(InstrumentedViewMixin, APIView):
+    permission_classes = [IsAuthenticated, IsManager]
+    throttle_classes = [SharedUserRateThrottle, SharedAnonRateThrottle]
+
+    def post(self, request, *args, **kwargs):
+        # Reads the raw body line by line instead of through a parser, so an
+        # upload is never held in memory as a whole.
+        mediaType = (request.content_type or '').split(';')[0].strip().lower()
+        if mediaType not in MEDIA_TYPES:
+            raise UnsupportedMediaType(mediaType)
+        lines = codecs.iterdecode(request.stream, 'utf-8-sig') if request.stream is not None else []
+        try:
+            report = import_menu(lines, MEDIA_TYPES[mediaType], getattr(settings, 'MENU_IMPORT_BATCH_SIZE', 500))
+        except UnicodeDecodeError:
+            raise ParseError('Menu imports must be UTF-8 encoded.')
+        return Response(report)
+
+class MenuExportView(InstrumentedViewMixin, APIView):
+    permission_classes = [IsAuthenticated, IsManager]
+    throttle_classes = [SharedUserRateThrottle, SharedAnonRateThrottle]
+    renderer_classes = [CSVRenderer, JSONLinesRenderer]
+
+    def get(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(export_menu(renderer.format), content_type='%s; charset=utf-8' % renderer.media_type)
+        response['Content-Disposition'] = 'attachment; filename="menu.%s"' % renderer.format
+        return response
     
-class CategoryView(viewsets.ModelViewSet):
+class CategoryView(InstrumentedViewMixin, ReplicaReadMixin, MenuCacheMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticated, IsManager]
     ordering_fields = ['title', 'slug']
     search_fields = ['title', 'slug']
-    throttle_classes = [UserRateThrottle, AnonRateThrottle]
+    throttle_classes = [SharedUserRateThrottle, SharedAnonRateThrottle]
 
     
 User = get_user_model()
-class GroupView(mixins.RetrieveModelMixin,
+class GroupView(InstrumentedViewMixin,
+                mixins.RetrieveModelMixin,
                    mixins.ListModelMixin,
                    viewsets.GenericViewSet):
     queryset = User.objects.all()
@@ -44,7 +146,7 @@ class GroupView(mixins.RetrieveModelMixin,
     permission_classes = [IsAuthenticated, IsManager]
     ordering_fields = ['username']
     search_fields = ['username', 'email']
-    throttle_classes = [UserRateThrottle, AnonRateThrottle]
+    throttle_classes = [SharedUserRateThrottle, SharedAnonRateThrottle]
     group = ''
 
     def get_queryset(self):
@@ -61,29 +163,37 @@ class GroupView(mixins.RetrieveModelMixin,
     def create(self, request, *args, **kwargs):
         user = generics.get_object_or_404(self.queryset, username=request.data['username'])
         group = self.get_group()
-        user.groups.add(group)
+        # Repeated adds and removes change nothing, so they queue no job.
+        with transaction.atomic():
+            if not user.groups.filter(pk=group.pk).exists():
+                user.groups.add(group)
+                enqueue(membership_changed, user.pk, self.group, True)
         serializer = self.get_serializer(user)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def destroy(self, request, *args, **kwargs):
         user = self.get_object()
         group = self.get_group()
-        user.groups.remove(group)
+        with transaction.atomic():
+            if user.groups.filter(pk=group.pk).exists():
+                user.groups.remove(group)
+                enqueue(membership_changed, user.pk, self.group, False)
         return Response(status=status.HTTP_200_OK)
 
 class ManagersView(GroupView):
-    group = "Manager"
+    group = MANAGER
 
 class DeliveryCrewsView(GroupView):
-    group = "Delivery crew"
+    group = DELIVERY_CREW
 
-class CartView(generics.ListCreateAPIView):
+class CartView(InstrumentedViewMixin, IdempotentMixin, FastListMixin, generics.ListCreateAPIView):
     serializer_class = CartSerializer
-    permission_classes = (IsAuthenticated)
+    permission_classes = (IsAuthenticated,)
     filterset_fields = ['menuitem__featured', 'menuitem__category']
     ordering_fields = ['price', 'unit_price']
     search_fields = ['menuitem__title']
-    throttle_classes = [UserRateThrottle, AnonRateThrottle]
+    throttle_classes = [SharedUserRateThrottle, SharedAnonRateThrottle]
+    pagination_class = OptInKeysetPagination
 
     def get_queryset(self):
         return Cart.objects.filter(user=self.request.user)
@@ -94,30 +204,62 @@ class CartView(generics.ListCreateAPIView):
         queryset.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
     
-class OrderView(mixins.ListModelMixin,
+class CartBatchView(InstrumentedViewMixin, IdempotentMixin, generics.GenericAPIView):
+    serializer_class = CartOperationSerializer
+    permission_classes = (IsAuthenticated,)
+    throttle_classes = [SharedUserRateThrottle, SharedAnonRateThrottle]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, many=True, allow_empty=False)
+        serializer.is_valid(raise_exception=True)
+        carts = apply_cart_operations(request.user, serializer.validated_data)
+        return Response(CartSerializer(carts, many=True, context=self.get_serializer_context()).data)
+    
+class OrderView(InstrumentedViewMixin,
+                IdempotentMixin,
+                ReplicaReadMixin,
+                FastListMixin,
+                RelatedLoadingMixin,
+                mixins.ListModelMixin,
                 mixins.DestroyModelMixin,
                 mixins.UpdateModelMixin,
                 viewsets.GenericViewSet):
     serializer_class = OrderSerializer
     filterset_fields = ['user', 'delivery_crew', 'status']
     ordering_fields = ['total', 'date']
+    ordering = ['-date']
     search_fields = ['user__username', 'delivery_crew__username']
-    throttle_classes = [UserRateThrottle, AnonRateThrottle]
+    throttle_classes = [SharedUserRateThrottle, SharedAnonRateThrottle]
+    throttle_scope = 'checkout'
+    pagination_class = OptInKeysetPagination
+    prefetch_related_fields = ('orderitem_set',)
+    replica_actions = ('list',)
     
 
     def get_queryset(self):
-        if self.request.user.groups.filter(name='Manager').exists():
+        if is_manager(self.request.user):
             queryset = Order.objects.all()
-        elif self.request.user.groups.filter(name='Delivery crew').exists():
+        elif is_delivery_crew(self.request.user):
             queryset = Order.objects.filter(delivery_crew=self.request.user)
         else:
             queryset = Order.objects.filter(user=self.request.user)
         return queryset
 
     def get_serializer_class(self):
-        if self.request.user.groups.filter(name='Delivery crew').exists():
+        if is_delivery_crew(self.request.user):
             return DeliveryOrderSerializer
         return super().get_serializer_class()
+
+    def get_throttles(self):
+        throttles = super().get_throttles()
+        if self.action == 'create':
+            throttles.append(SharedScopedRateThrottle())
+        return throttles
+
+    def get_prefetch_related_fields(self):
+        if self.get_serializer_class() is DeliveryOrderSerializer:
+            return ()
+        return super().get_prefetch_related_fields()
         
     def get_permissions(self):
         permission_classes = [IsAuthenticated]
@@ -129,32 +271,171 @@ class OrderView(mixins.ListModelMixin,
         return [permission() for permission in permission_classes + permissionDict.get(self.action, [])]
     
     def create(self, request, *args, **kwargs):
-        carts = Cart.objects.filter(user=request.user)
-        totalPrice = sum(cart.price for cart in carts)
-        order = Order(user=request.user, total=totalPrice, status=False, date=date.today())
-        order.save()
-        for cart in carts:
-            orderItem = OrderItem(order=order, menuitem=cart.menuitem, 
-                                  quantity=cart.quantity, unit_price=cart.unit_price, 
-                                  price=cart.price)
-            orderItem.save()
-            cart.delete()
+        order = checkout(request.user)
         serializer = self.get_serializer(order)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
+    def perform_update(self, serializer):
+        previousCrewId, previousStatus = serializer.instance.delivery_crew_id, serializer.instance.status
+        with transaction.atomic():
+            order = serializer.save()
+            sync_order_summary(order)
+            order_changed(previousCrewId, previousStatus, order)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            remove_order_summary(instance)
+            instance.delete()
+
     def retrieve(self, request, *args, **kwargs):
         orderItemView = OrderItemView(request=request, args=self.args, kwargs=self.kwargs)
         orderItemView.initial(request, *args, **kwargs)
         return orderItemView.list(request, *args, **kwargs)
 
 
-class OrderItemView(generics.ListAPIView):
+class DispatchView(InstrumentedViewMixin, generics.GenericAPIView):
+    serializer_class = DispatchSerializer
+    permission_classes = [IsAuthenticated, IsManager]
+    throttle_classes = [SharedUserRateThrottle, SharedAnonRateThrottle]
+
+    def get_loads(self, loads):
+        return [{'delivery_crew': crewId, 'open_orders': loads[crewId]} for crewId in sorted(loads)]
+
+    def get(self, request, *args, **kwargs):
+        return Response({
+            'unassigned': unassigned_orders().count(),
+            'crews': self.get_loads(get_crew_loads(get_crew_ids())),
+        })
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        assignments, loads = dispatch_orders(serializer.validated_data.get('limit'),
+                                             serializer.validated_data.get('delivery_crew'))
+        assigned = sorted((orderId, crewId) for crewId, orderIds in assignments.items() for orderId in orderIds)
+        return Response({
+            'assigned': [{'order': orderId, 'delivery_crew': crewId} for orderId, crewId in assigned],
+            'crews': self.get_loads(loads),
+        })
+
+
+class OrderExportView(InstrumentedViewMixin, APIView):
+    permission_classes = [IsAuthenticated, IsManager]
+    throttle_classes = [SharedUserRateThrottle, SharedAnonRateThrottle]
+    renderer_classes = [CSVRenderer, JSONLinesRenderer]
+
+    def get(self, request, *args, **kwargs):
+        serializer = OrderExportSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        renderer = request.accepted_renderer
+        stream = export_orders(filter_orders(**serializer.validated_data), renderer.format,
+                               getattr(settings, 'ORDER_EXPORT_CHUNK_SIZE', 2000))
+        response = StreamingHttpResponse(stream, content_type='%s; charset=utf-8' % renderer.media_type)
+        response['Content-Disposition'] = 'attachment; filename="orders.%s"' % renderer.format
+        return response
+
+class SalesAnalyticsView(InstrumentedViewMixin, APIView):
+    # One view per report, picked with as_view(report=...) in urls.py.
+    permission_classes = [IsAuthenticated, IsManager]
+    throttle_classes = [SharedUserRateThrottle, SharedAnonRateThrottle]
+    report = 'revenue'
+
+    def get(self, request, *args, **kwargs):
+        serializer = SalesAnalyticsSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        dateFrom, dateTo = serializer.validated_data['date_from'], serializer.validated_data['date_to']
+        if self.report == 'top-items':
+            results = top_menu_items(dateFrom, dateTo, serializer.validated_data['limit'], serializer.validated_data['by'])
+            rowSerializer = MenuItemSalesSerializer
+        elif self.report == 'categories':
+            results, rowSerializer = category_sales(dateFrom, dateTo), CategorySalesSerializer
+        elif self.report == 'crews':
+            results, rowSerializer = crew_deliveries(dateFrom, dateTo), CrewDeliveriesSerializer
+        else:
+            results, rowSerializer = daily_revenue(dateFrom, dateTo), DailyRevenueSerializer
+        return Response({'date_from': dateFrom, 'date_to': dateTo, 'results': rowSerializer(results, many=True).data})
+
+class EventStreamRenderer(BaseRenderer):
+    # Accepts clients asking for text/event-stream. Only errors are rendered
+    # here; the stream itself is written by async_views.OrderEventStreamView.
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return format_error(data).encode()
+
+class OrderEventsView(InstrumentedViewMixin, APIView):
+    # Authentication, permission and throttle settings of the order event stream.
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [SharedUserRateThrottle, SharedAnonRateThrottle]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+
+class OrderItemView(InstrumentedViewMixin, FastListMixin, generics.ListAPIView):
     serializer_class = OrderItemSerializer
     filterset_fields = ['menuitem__featured', 'menuitem__category']
     ordering_fields = ['price', 'unit_price']
+    ordering = ['price']
     search_fields = ['menuitem__title']
+    pagination_class = OptInKeysetPagination
 
     def get_queryset(self):
         queryset = OrderItem.objects.filter(order__id=self.kwargs['pk'])
         return queryset
 
+
+class OrderSummaryView(InstrumentedViewMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = OrderSummary.objects.all()
+    serializer_class = OrderSummarySerializer
+    permission_classes = [IsAuthenticated, IsManager]
+    filterset_fields = ['user', 'delivery_crew', 'status', 'date']
+    ordering_fields = ['total', 'date']
+    ordering = ['-date']
+    throttle_classes = [SharedUserRateThrottle, SharedAnonRateThrottle]
+    pagination_class = KeysetPagination
+
+class DailyOrderSummaryView(InstrumentedViewMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = DailyOrderSummary.objects.all()
+    serializer_class = DailyOrderSummarySerializer
+    permission_classes = [IsAuthenticated, IsManager]
+    filterset_fields = {'date': ['exact', 'gte', 'lte']}
+    ordering_fields = ['date', 'order_count', 'revenue']
+    ordering = ['-date']
+    throttle_classes = [SharedUserRateThrottle, SharedAnonRateThrottle]
+    pagination_class = KeysetPagination
+
+class CrewOrderSummaryView(InstrumentedViewMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = CrewOrderSummary.objects.all()
+    serializer_class = CrewOrderSummarySerializer
+    permission_classes = [IsAuthenticated, IsManager]
+    ordering_fields = ['order_count', 'delivered_count', 'revenue']
+    ordering = ['-order_count']
+    throttle_classes = [SharedUserRateThrottle, SharedAnonRateThrottle]
+    pagination_class = KeysetPagination
+
+
+class PerformanceStatsView(APIView):
+    permission_classes = [IsAuthenticated, IsManager]
+
+    def get(self, request, *args, **kwargs):
+        return Response({
+            'sample_rate': getattr(settings, 'PERF_SAMPLE_RATE', 0),
+            'routes': registry.snapshot(),
+            'token_cache': token_cache.stats(),
+        })
+
+class PerformanceMetricsView(APIView):
+    permission_classes = [IsAuthenticated, IsManager]
+
+    def get(self, request, *args, **kwargs):
+        stats = token_cache.stats()
+        lines = [
+            '# HELP littlelemon_token_cache_hits_total Token authentications served from cache.',
+            '# TYPE littlelemon_token_cache_hits_total counter',
+            'littlelemon_token_cache_hits_total %d' % stats['hits'],
+            '# HELP littlelemon_token_cache_misses_total Token authentications that queried the database.',
+            '# TYPE littlelemon_token_cache_misses_total counter',
+            'littlelemon_token_cache_misses_total %d' % stats['misses'],
+        ]
+        return HttpResponse(registry.prometheus() + '\n'.join(lines) + '\n',
+                            content_type='text/plain; version=0.0.4; charset=utf-8')